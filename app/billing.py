@@ -0,0 +1,228 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from .cache import invalidate_reseller_reports
+from .db import fetch_one
+from .utils import now_tz, send_wa_message, serialize_row
+
+
+# ---- Settlement Customer Invoice ----
+# Satu statement (data-modifying CTE) untuk:
+#   1. tandai invoice paid (hanya kalau status='success' dan belum paid)
+#   2. perpanjang ppp_users.active_until sepanjang periode invoice
+#   3. insert payment baru / update payment lama (by provider_txn_id, hanya milik
+#      invoice ini — txn id invoice/reseller lain tidak pernah disentuh)
+#   4. kembalikan invoice, payment dan data user hasil akhir
+# Semua CTE melihat snapshot yang sama, jadi hasil akhir diambil dari RETURNING.
+# Callback bersamaan untuk invoice yang sama: cur mengunci invoice (FOR UPDATE)
+# sehingga yang kedua melihat status terbaru, dan pay_ins ON CONFLICT di index
+# unik (invoice_id, provider_txn_id) dari migrations/012 tidak membuat payment ganda.
+SETTLE_INVOICE_SQL = """
+    WITH cur AS (
+        SELECT id, reseller_id, user_id, amount, status
+        FROM customer_invoices
+        WHERE id = $1 AND ($2::uuid IS NULL OR reseller_id = $2::uuid)
+        FOR UPDATE
+    ),
+    inv AS (
+        UPDATE customer_invoices ci
+        SET status = 'paid', paid_at = $3, updated_at = $4
+        FROM cur
+        WHERE ci.id = cur.id AND $5::text = 'success' AND ci.status <> 'paid'
+        RETURNING ci.*
+    ),
+    usr AS (
+        UPDATE ppp_users u
+        SET active_until = COALESCE(u.active_until, inv.period_start)
+                           + (inv.period_end - inv.period_start) + 1,
+            updated_at = $4
+        FROM inv
+        WHERE u.id = inv.user_id
+        RETURNING u.phone, u.username, u.active_until
+    ),
+    prev AS (
+        SELECT p.*
+        FROM payments p
+        WHERE $8::text IS NOT NULL AND p.provider_txn_id = $8::text
+          AND p.invoice_id = (SELECT id FROM cur)
+        ORDER BY p.id
+        LIMIT 1
+    ),
+    pay_upd AS (
+        UPDATE payments p
+        SET status = $5, paid_at = $3, updated_at = $4
+        FROM prev
+        WHERE p.id = prev.id AND p.status IS DISTINCT FROM $5::text
+          AND EXISTS (SELECT 1 FROM cur)
+        RETURNING p.*
+    ),
+    pay_ins AS (
+        INSERT INTO payments (invoice_id, amount, method, provider_txn_id, status, paid_at, created_at)
+        SELECT cur.id, COALESCE($6::numeric, cur.amount), $7, $8, $5, $3, $4
+        FROM cur
+        WHERE NOT EXISTS (SELECT 1 FROM prev)
+          AND ($9::bool OR EXISTS (SELECT 1 FROM inv))
+        ON CONFLICT (invoice_id, provider_txn_id) WHERE provider_txn_id IS NOT NULL DO NOTHING
+        RETURNING *
+    ),
+    pay AS (
+        SELECT * FROM pay_ins
+        UNION ALL
+        SELECT * FROM pay_upd
+        UNION ALL
+        SELECT * FROM prev WHERE NOT EXISTS (SELECT 1 FROM pay_upd)
+    )
+    SELECT
+        cur.status AS prev_status,
+        cur.reseller_id,
+        (SELECT to_json(inv) FROM inv) AS invoice,
+        (SELECT to_json(pay) FROM pay LIMIT 1) AS payment,
+        usr.phone AS user_phone,
+        usr.username AS user_username,
+        usr.active_until AS user_active_until
+    FROM cur
+    LEFT JOIN usr ON true
+"""
+
+
+def _decode_json_row(value: Optional[str]) -> Optional[Dict[str, Any]]:
+    if value is None:
+        return None
+    return serialize_row(json.loads(value, parse_float=Decimal))
+
+
+async def settle_customer_invoice(
+    invoice_id: str,
+    *,
+    method: str,
+    status: str = "success",
+    amount: Any = None,
+    provider_txn_id: Optional[str] = None,
+    reseller_id: Optional[str] = None,
+    paid_at: Any = None,
+    record_if_paid: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """
+    Catat pembayaran customer invoice dalam satu round trip.
+
+    Return None kalau invoice tidak ditemukan. Selain itu dict berisi:
+    - prev_status: status invoice sebelum statement dijalankan
+    - invoice: row invoice setelah dibayar (None kalau tidak ada perubahan)
+    - payment: row payment yang dibuat/diupdate/sudah ada (None kalau tidak dicatat)
+    - user: phone, username, active_until baru (None kalau invoice tidak di-settle)
+
+    record_if_paid=False → payment hanya diinsert kalau invoice benar-benar
+    berubah jadi paid (dipakai jalur manual /invoices/{id}/pay).
+    """
+    now = now_tz()
+    if paid_at is None:
+        paid_at = now
+    elif isinstance(paid_at, str):
+        paid_at = datetime.fromisoformat(paid_at)
+    if amount is not None:
+        amount = Decimal(str(amount))
+    if provider_txn_id is not None:
+        provider_txn_id = str(provider_txn_id)
+
+    row = await fetch_one(
+        SETTLE_INVOICE_SQL,
+        (
+            invoice_id,
+            reseller_id,
+            paid_at,
+            now,
+            status,
+            amount,
+            method,
+            provider_txn_id,
+            record_if_paid,
+        ),
+    )
+    if not row:
+        return None
+
+    invoice = _decode_json_row(row["invoice"])
+    payment = _decode_json_row(row["payment"])
+    if payment is None and provider_txn_id is not None:
+        # kalah race dengan callback lain: payment-nya baru commit setelah
+        # snapshot statement ini diambil (pay_ins kena ON CONFLICT)
+        existing = await fetch_one(
+            "SELECT to_json(p) AS payment FROM payments p WHERE p.invoice_id = $1 AND p.provider_txn_id = $2",
+            (invoice_id, provider_txn_id),
+        )
+        payment = _decode_json_row(existing["payment"]) if existing else None
+    if invoice or payment:
+        await invalidate_reseller_reports(row["reseller_id"])
+
+    user = None
+    if row["user_username"] is not None:
+        user = {
+            "phone": row["user_phone"],
+            "username": row["user_username"],
+            "active_until": row["user_active_until"],
+        }
+
+    return {
+        "prev_status": row["prev_status"],
+        "invoice": invoice,
+        "payment": payment,
+        "user": user,
+    }
+
+
+# ---- Callback Payment Gateway ----
+def parse_payment_callback(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalisasi payload callback (Duitku / format umum) ke field lokal."""
+    if "merchantOrderId" in payload:
+        merchant_order_id = payload.get("merchantOrderId")
+        result_code = payload.get("resultCode")
+
+        # Mapping resultCode Duitku ke status lokal
+        if result_code == "00":
+            status = "success"
+        elif result_code in ("01", "02"):
+            status = "pending"
+        else:
+            status = "failed"
+
+        return {
+            "provider": "duitku",
+            "txn_id": payload.get("reference") or payload.get("paymentCode") or merchant_order_id,
+            "invoice_id": merchant_order_id,
+            "amount": str(payload.get("amount") or payload.get("paymentAmount") or "0"),
+            "status": status,
+            "paid_at": None,
+        }
+
+    return {
+        "provider": payload.get("provider", "unknown"),
+        "txn_id": payload.get("txn_id"),
+        "invoice_id": payload.get("invoice_id"),
+        "amount": payload.get("amount"),
+        "status": payload.get("status", "pending"),
+        "paid_at": payload.get("paid_at"),
+    }
+
+
+async def apply_payment_callback(callback: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Settle invoice dari callback yang sudah dinormalisasi + kirim WA konfirmasi."""
+    result = await settle_customer_invoice(
+        callback["invoice_id"],
+        method=callback["provider"],
+        status=callback["status"],
+        amount=callback["amount"],
+        provider_txn_id=callback["txn_id"],
+        paid_at=callback["paid_at"],
+    )
+    if not result:
+        return None
+
+    user = result["user"]
+    if user:
+        await send_wa_message(
+            phone=user["phone"],
+            text=f"✅ Pembayaran invoice {callback['invoice_id']} via {callback['provider'].upper()} berhasil. Terima kasih {user['username']}!"
+        )
+    return result
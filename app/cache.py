@@ -0,0 +1,138 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from .config import get_settings
+from .db import fetch_one, fetch_val, notify, on_notify
+
+settings = get_settings()
+
+
+# ---- TTL Cache per namespace (mis. per reseller) ----
+class NamespacedTTLCache:
+    """
+    Cache in-process dengan TTL, dikelompokkan per namespace supaya satu
+    namespace bisa diinvalidasi sekaligus. Invalidasi antar worker process
+    lewat Postgres NOTIFY di `channel` (payload = namespace, '' = semua).
+    """
+
+    def __init__(self, channel: str, ttl: float, max_namespaces: int = 10000):
+        self.channel = channel
+        self.ttl = ttl
+        self.max_namespaces = max_namespaces
+        self._data: Dict[str, Dict[Hashable, Tuple[float, Any]]] = {}
+        # generasi per namespace: naik setiap invalidasi, supaya hasil query
+        # yang mulai sebelum invalidasi tidak disimpan setelahnya
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        on_notify(channel, self._on_notify)
+
+    def get(self, ns: str, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(ns, {}).get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def generation(self, ns: str) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(ns, 0)
+
+    def set(self, ns: str, key: Hashable, value: Any, generation: Optional[Tuple[int, int]] = None) -> None:
+        if generation is not None and generation != self.generation(ns):
+            return
+        if ns not in self._data and len(self._data) >= self.max_namespaces:
+            self._data.pop(next(iter(self._data)))
+        self._data.setdefault(ns, {})[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate_local(self, ns: Optional[str] = None) -> None:
+        if ns:
+            self._data.pop(ns, None)
+            self._generations[ns] = self._generations.get(ns, 0) + 1
+        else:
+            self._data.clear()
+            self._epoch += 1
+
+    async def invalidate(self, ns: Optional[str] = None) -> None:
+        """Invalidasi lokal (read-your-writes) lalu broadcast ke process lain."""
+        self.invalidate_local(ns)
+        await notify(self.channel, ns or "")
+
+    async def get_or_load(self, ns: str, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(ns, key)
+        if value is not None:
+            return value
+        generation = self.generation(ns)
+        value = await loader()
+        self.set(ns, key, value, generation)
+        return value
+
+    def _on_notify(self, payload: Optional[str]) -> None:
+        # None = koneksi LISTEN sempat putus → flush semua
+        self.invalidate_local(payload or None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "namespaces": len(self._data),
+            "entries": sum(len(v) for v in self._data.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# cache /reports/* per reseller
+report_cache = NamespacedTTLCache("report_cache", ttl=settings.REPORT_CACHE_TTL)
+
+
+async def invalidate_reseller_reports(reseller_id: Any) -> None:
+    if reseller_id:
+        await report_cache.invalidate(str(reseller_id))
+
+
+# bucket bulanan time-series yang sudah tutup, namespace '<scope>:YYYY-MM'
+# (scope = reseller_id / 'admin'). Bulan lama masih bisa berubah (invoice lama
+# baru dibayar): trigger rollup (migrations/009) NOTIFY namespace bulan yang
+# berubah; TTL hanya jaring pengaman.
+closed_month_cache = NamespacedTTLCache("report_closed_months", ttl=3600, max_namespaces=100000)
+
+
+def closed_month_ns(scope: str, month: Any) -> str:
+    return f"{scope}:{month:%Y-%m}"
+
+
+# ---- Reseller context (row resellers kecil yang sering dibaca handler) ----
+RESELLER_CONTEXT_SQL = """
+    SELECT id, name, company_name, email, phone, alamat, logo,
+           price_per_user, currency, volume_pricing
+    FROM resellers WHERE id=$1
+"""
+
+reseller_context_cache = NamespacedTTLCache("reseller_context", ttl=settings.RESELLER_CONTEXT_TTL)
+
+
+async def get_reseller_context(reseller_id: Any) -> Optional[Dict[str, Any]]:
+    """Row resellers (read-only, jangan dimutasi); None kalau reseller tidak ada."""
+    ns = str(reseller_id)
+    return await reseller_context_cache.get_or_load(
+        ns, "ctx", lambda: fetch_one(RESELLER_CONTEXT_SQL, (ns,))
+    )
+
+
+async def invalidate_reseller_context(reseller_id: Any) -> None:
+    if reseller_id:
+        await reseller_context_cache.invalidate(str(reseller_id))
+
+
+# ---- Versi resource per reseller (ETag list endpoint) ----
+# Dinaikkan trigger DB (migrations/007) yang juga NOTIFY resource_version → tiap
+# process cukup cache angka versinya; TTL hanya jaring pengaman.
+resource_versions = NamespacedTTLCache("resource_version", ttl=3600)
+
+
+async def get_resource_version(reseller_id: Any, resource: str) -> int:
+    ns = str(reseller_id)
+    return await resource_versions.get_or_load(ns, resource, lambda: fetch_val(
+        "SELECT COALESCE((SELECT version FROM resource_versions WHERE reseller_id=$1 AND resource=$2), 0)",
+        (ns, resource),
+    ))
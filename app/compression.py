@@ -0,0 +1,170 @@
+import zlib
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli  # opsional: pip install brotli
+except ImportError:
+    brotli = None
+
+# content-type yang layak dikompres (JSON list, NDJSON/CSV export, teks)
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/plain",
+    "text/html",
+)
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _Brotli:
+    def __init__(self, quality: int):
+        self._b = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._b.process(data)
+
+    def flush(self) -> bytes:
+        return self._b.flush()
+
+    def finish(self) -> bytes:
+        return self._b.finish()
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding → {encoding: q}; q tidak valid dianggap 0."""
+    result: Dict[str, float] = {}
+    for part in header.lower().split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        result[name] = q
+    return result
+
+
+class CompressionMiddleware:
+    """
+    Kompres response (br kalau modul brotli ada & diterima klien, selain itu gzip).
+
+    - Hanya content-type di COMPRESSIBLE_TYPES, tanpa Content-Encoding bawaan.
+    - Response biasa di bawah minimum_size dikirim apa adanya.
+    - StreamingResponse (NDJSON/CSV) dikompres per chunk sambil jalan, tidak
+      di-buffer utuh; tiap chunk di-flush (Z_SYNC_FLUSH / brotli flush) supaya
+      klien langsung menerima chunk itu, tidak menunggu blok compressor penuh.
+    - Accept-Encoding dengan q=0 (mis. "br;q=0") berarti encoding itu ditolak.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 5, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose(self, scope: Scope) -> Optional[Tuple[str, object]]:
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        candidates = []
+        if brotli is not None:
+            candidates.append(("br", lambda: _Brotli(self.brotli_quality)))
+        candidates.append(("gzip", lambda: _Gzip(self.gzip_level)))
+        # q tertinggi menang, seri → urutan kandidat (br dulu)
+        best, best_q = None, 0.0
+        for name, factory in candidates:
+            q = accepted.get(name, accepted.get("*", 0.0))
+            if q > best_q:
+                best, best_q = (name, factory), q
+        return best
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        chosen = self._choose(scope)
+        if chosen is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressionResponder(self, chosen[0], chosen[1])(scope, receive, send, self.app)
+
+
+class _CompressionResponder:
+    def __init__(self, mw: CompressionMiddleware, encoding: str, factory):
+        self.mw = mw
+        self.encoding = encoding
+        self.factory = factory
+        self.start_message: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send, app: ASGIApp) -> None:
+        self.send = send
+        await app(scope, receive, self.send_wrapper)
+
+    def _compressible(self, message: Message) -> bool:
+        if message["status"] < 200 or message["status"] in (204, 304):
+            return False
+        headers = Headers(raw=message["headers"])
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return content_type in COMPRESSIBLE_TYPES
+
+    async def send_wrapper(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            self.passthrough = not self._compressible(message)
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            # response biasa (satu body) yang kecil → tidak sebanding overhead kompresi
+            if not more_body and len(body) < self.mw.minimum_size:
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.compressor = self.factory()
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+            await self.send(self.start_message)
+
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.finish()
+        elif body:
+            data += self.compressor.flush()
+        if data or not more_body:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
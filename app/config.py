@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Optional
 from pydantic import BaseSettings
   # kalau masih pakai pydantic <2, tetap bisa dari pydantic
 # kalau pydantic v2: from pydantic_settings import BaseSettings
@@ -13,6 +14,8 @@ class Settings(BaseSettings):
     JWT_ALG: str = "HS256"
     JWT_ACCESS_EXPIRES_MIN: int = 60
     JWT_REFRESH_EXPIRES_MIN: int = 1440
+    # jumlah token terverifikasi yang di-cache per process (auth_reseller_jwt)
+    JWT_CACHE_SIZE: int = 10000
 
     # Admin BasicAuth
     ADMIN_BASIC_USER: str
@@ -28,9 +31,49 @@ class Settings(BaseSettings):
     # Auth Config
     USE_JWT: bool = True
     DEFAULT_RESELLER_ID: str = "00000000-0000-0000-0000-000000000000"
+    # bcrypt login/register: jumlah thread, antrian, dan batas tunggu (detik) sebelum 429
+    PASSWORD_HASH_THREADS: int = 2
+    PASSWORD_HASH_QUEUE: int = 16
+    PASSWORD_HASH_TIMEOUT: float = 2.0
     # Payment Gateway -
     DUITKU_MERCHANT_CODE: str
     DUITKU_API_KEY: str
+    # Mode ingest webhook: callback valid masuk inbox, diproses worker per batch
+    DUITKU_WEBHOOK_QUEUE: bool = False
+    WEBHOOK_INBOX_BATCH: int = 200
+    WEBHOOK_INBOX_MAX_ATTEMPTS: int = 5
+    # Cache /reports/* per reseller (detik)
+    REPORT_CACHE_TTL: int = 60
+    # Cache row resellers per process (detik), diinvalidasi via NOTIFY saat update
+    RESELLER_CONTEXT_TTL: int = 300
+    # Cache katalog ppp_profiles per reseller (detik), diinvalidasi via NOTIFY saat CRUD profile
+    PROFILE_CATALOG_TTL: int = 600
+    # Report job admin (/admin/report-jobs): jumlah report paralel per worker & batas retry
+    REPORT_JOB_CONCURRENCY: int = 2
+    REPORT_JOB_MAX_ATTEMPTS: int = 2
+    # Kompresi response (gzip, br kalau paket brotli terpasang)
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 5
+    # Slow-query log helper db: ambang (ms, 0 = mati), porsi query lambat yang di-EXPLAIN
+    # (ANALYZE, BUFFERS) di koneksi terpisah, dan batas waktu EXPLAIN (detik)
+    SLOW_QUERY_MS: int = 500
+    SLOW_QUERY_EXPLAIN_RATE: float = 0.1
+    SLOW_QUERY_EXPLAIN_TIMEOUT: float = 10.0
+    # Statistik query per request: header X-DB-* di response (debug saja) dan
+    # ambang bentuk SQL yang sama diulang dalam satu request sebelum dicatat sebagai N+1 (0 = mati)
+    DEBUG_DB_HEADERS: bool = False
+    N_PLUS_ONE_THRESHOLD: int = 10
+    # Monitor event loop: interval sampler lag (detik, 0 = mati) dan ambang watchdog
+    # blocking (ms, 0 = mati) sebelum stack thread loop di-log
+    LOOP_LAG_INTERVAL: float = 0.5
+    LOOP_BLOCK_THRESHOLD_MS: int = 250
+    # /metrics: folder snapshot per process (shared volume API + worker), interval tulis,
+    # dan umur snapshot sebelum dianggap process mati. METRICS_DIR kosong = hanya process sendiri
+    METRICS_DIR: Optional[str] = "/tmp/billing_metrics"
+    METRICS_FLUSH_INTERVAL: float = 5.0
+    METRICS_STALE_SECONDS: float = 60.0
+    # Folder file settlement Duitku (settlement_YYYY-MM-DD.csv) untuk rekonsiliasi worker
+    SETTLEMENT_DIR: Optional[str] = None
 
     class Config:
         env_file = ".env"
@@ -1,29 +1,55 @@
 from contextlib import asynccontextmanager
+import asyncio
+import json
+import random
+import re
+import time
 import asyncpg 
-from typing import Any, List, Optional, Dict
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Dict
 
 from .config import get_settings
+from .metrics import Gauge, Histogram
+from .request_context import current_caller, record_query
 from .utils import serialize_row
 
 settings = get_settings()
 
 pool: Optional[asyncpg.Pool] = None
 
+# koneksi khusus LISTEN (di luar pool) + callback per channel
+_listen_conn: Optional[asyncpg.Connection] = None
+_listen_closing = False
+_listeners: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+
 
 # --- Pool Management ---
 async def connect_db():
     """Inisialisasi koneksi pool ke database (startup)."""
-    global pool
+    global pool, _listen_closing
+    _listen_closing = False
     pool = await asyncpg.create_pool(
         dsn=settings.DATABASE_URL,
         min_size=1,
-        max_size=10
+        max_size=10,
+        # hari bucket rollup payment (migrations/008) mengikuti TIMEZONE app
+        server_settings={"app.timezone": settings.TIMEZONE},
     )
+    for writer in _log_writers:
+        writer.start()
+    await _start_listener()
 
 
 async def disconnect_db():
     """Tutup koneksi pool (shutdown)."""
-    global pool
+    global pool, _listen_conn, _listen_closing
+    _listen_closing = True
+    if _listen_conn:
+        await _listen_conn.close()
+        _listen_conn = None
+    # flush sisa buffer log sebelum pool ditutup
+    for writer in _log_writers:
+        await writer.stop()
     if pool:
         await pool.close()
         pool = None
@@ -39,37 +65,491 @@ async def _get_pool() -> asyncpg.Pool:
     return pool
 
 
-# --- Helper Query ---
-async def fetch_all(query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
+# --- Metrics pool & query ---
+DB_ACQUIRE_SECONDS = Histogram(
+    "db_pool_acquire_seconds",
+    "Waktu tunggu ambil koneksi dari pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_seconds",
+    "Durasi query lewat helper db (per jenis statement + tabel pertama)",
+    ("op", "stmt"),
+)
+
+
+def _pool_stats() -> Dict[str, float]:
+    if pool is None:
+        return {}
+    return {"size": pool.get_size(), "idle": pool.get_idle_size(), "max": pool.get_max_size()}
+
+
+Gauge("db_pool_connections", "Koneksi pool asyncpg per process", ("state",), fn=_pool_stats, mode="pid")
+
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([a-zA-Z_][\w.]*)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(query: str) -> str:
+    """Label pendek query untuk metrics, mis. 'select ppp_users' / 'update customer_invoices'."""
+    text = " ".join(query.split())
+    verb = text.split(" ", 1)[0].lower() if text else "?"
+    if verb == "with":
+        verb = "cte"
+    m = _TABLE_RE.search(text)
+    return f"{verb} {m.group(1).lower()}" if m else verb
+
+
+@asynccontextmanager
+async def _acquire():
     conn_pool = await _get_pool()
+    start = time.perf_counter()
     async with conn_pool.acquire() as conn:
+        DB_ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+        timed = _TimedConnection(conn)
+        try:
+            yield timed
+        finally:
+            timed._finish()
+
+
+async def _timed(op: str, query: str, params: Optional[tuple], run: Awaitable[Any]) -> Any:
+    start = time.perf_counter()
+    try:
+        return await run
+    finally:
+        _observe_query(op, query, params, time.perf_counter() - start)
+
+
+def _observe_query(op: str, query: str, params: Optional[tuple], elapsed: float) -> None:
+    DB_QUERY_SECONDS.observe(elapsed, op=op, stmt=statement_label(query))
+    record_query(normalize_sql(query), elapsed)
+    if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        _report_slow_query(op, query, params, elapsed)
+
+
+class _TimedConnection:
+    """
+    Koneksi pool yang dipakai semua helper (fetch_*, execute, transaction(),
+    stream_rows, BatchLogWriter): tiap query/COPY/cursor masuk metrics,
+    slow-query log, dan statistik query per request. Method lain diteruskan.
+    """
+
+    def __init__(self, conn: asyncpg.Connection):
+        self._conn = conn
+        self._cursors: List["_TimedCursor"] = []
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    async def fetch(self, query: str, *args: Any, **kwargs: Any) -> List[Any]:
+        return await _timed("fetch_all", query, args, self._conn.fetch(query, *args, **kwargs))
+
+    async def fetchrow(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await _timed("fetch_one", query, args, self._conn.fetchrow(query, *args, **kwargs))
+
+    async def fetchval(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await _timed("fetch_val", query, args, self._conn.fetchval(query, *args, **kwargs))
+
+    async def execute(self, query: str, *args: Any, **kwargs: Any) -> str:
+        return await _timed("execute", query, args, self._conn.execute(query, *args, **kwargs))
+
+    async def executemany(self, query: str, args: Any, **kwargs: Any) -> None:
+        return await _timed("executemany", query, None, self._conn.executemany(query, args, **kwargs))
+
+    async def copy_records_to_table(self, table: str, **kwargs: Any) -> str:
+        return await _timed("copy", f"COPY {table}", None, self._conn.copy_records_to_table(table, **kwargs))
+
+    def cursor(self, query: str, *args: Any, **kwargs: Any) -> "_TimedCursor":
+        cursor = _TimedCursor(self._conn.cursor(query, *args, **kwargs), query, args)
+        self._cursors.append(cursor)
+        return cursor
+
+    def _finish(self) -> None:
+        # cursor yang iterasinya dihentikan di tengah (client putus, break) tetap dicatat
+        for cursor in self._cursors:
+            cursor._record()
+        self._cursors.clear()
+
+
+class _TimedCursor:
+    """Iterasi cursor; waktu tunggu fetch per batch dijumlah, dicatat sekali per cursor."""
+
+    def __init__(self, factory: Any, query: str, params: tuple):
+        self._factory = factory
+        self._query = query
+        self._params = params
+        self._iter: Any = None
+        self._elapsed = 0.0
+        self._recorded = False
+
+    def __await__(self):
+        return self._factory.__await__()
+
+    def __aiter__(self) -> "_TimedCursor":
+        self._iter = self._factory.__aiter__()
+        return self
+
+    async def __anext__(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return await self._iter.__anext__()
+        except StopAsyncIteration:
+            self._elapsed += time.perf_counter() - start
+            self._record()
+            raise
+        finally:
+            if not self._recorded:
+                self._elapsed += time.perf_counter() - start
+
+    def _record(self) -> None:
+        if self._iter is not None and not self._recorded:
+            self._recorded = True
+            _observe_query("cursor", self._query, self._params, self._elapsed)
+
+
+# --- Slow-query log ---
+# Satu baris JSON per query lambat: SQL dinormalisasi (literal → ?), parameter
+# hanya tipe/panjangnya, route/job pemanggil, dan (sampel) rencana EXPLAIN.
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|(?<![\w$])\d+(?:\.\d+)?\b")
+_WRITE_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|COPY)\b", re.IGNORECASE)
+# EXPLAIN per bentuk SQL paling sering sekali per interval ini (detik)
+_EXPLAIN_INTERVAL = 300.0
+_explained_at: Dict[str, float] = {}
+_explain_task: Optional[asyncio.Task] = None
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(query: str) -> str:
+    return _LITERAL_RE.sub("?", " ".join(query.split()))[:2000]
+
+
+# EXPLAIN mengganti $n dengan nilai parameter di Filter/Cond (plan_cache_mode
+# tidak berpengaruh untuk EXPLAIN) → samarkan literal di baris ekspresi saja,
+# angka cost/rows/time di baris lain tetap terbaca.
+_PLAN_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_PLAN_EXPR_KEY_RE = re.compile(
+    r"^\s*(?!Rows Removed)(?:[A-Z][\w ]*? )?(?:Cond|Condition|Filter|Key|Output|Order By|Call): "
+)
+
+
+def _redact_plan(plan: str) -> str:
+    lines = []
+    for line in plan.splitlines():
+        m = _PLAN_EXPR_KEY_RE.match(line)
+        if m:
+            line = m.group(0) + _LITERAL_RE.sub("?", line[m.end():])
+        else:
+            line = _PLAN_STRING_RE.sub("?", line)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _redact_param(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (str, bytes, list, tuple, dict)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def _report_slow_query(op: str, query: str, params: Optional[tuple], elapsed: float) -> None:
+    global _explain_task
+    sql = normalize_sql(query)
+    entry = {
+        "ms": round(elapsed * 1000, 1),
+        "op": op,
+        "caller": current_caller(),
+        "sql": sql,
+        "params": [_redact_param(p) for p in params or ()],
+    }
+
+    now = time.monotonic()
+    if (
+        op not in ("copy", "executemany")  # tidak bisa di-EXPLAIN dengan params yang tercatat
+        and (_explain_task is None or _explain_task.done())
+        and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE
+        and now - _explained_at.get(sql, -_EXPLAIN_INTERVAL) >= _EXPLAIN_INTERVAL
+    ):
+        if len(_explained_at) > 1000:
+            _explained_at.clear()
+        _explained_at[sql] = now
+        # log ditunda sampai rencana didapat supaya tetap satu baris
+        _explain_task = asyncio.get_running_loop().create_task(_explain_and_log(entry, query, params))
+        return
+    _log_slow_query(entry)
+
+
+def _log_slow_query(entry: Dict[str, Any]) -> None:
+    print("🐢 Slow query " + json.dumps(entry, default=str, ensure_ascii=False))
+
+
+async def _explain_and_log(entry: Dict[str, Any], query: str, params: Optional[tuple]) -> None:
+    try:
+        entry["plan"] = await asyncio.wait_for(
+            _explain(query, params), timeout=settings.SLOW_QUERY_EXPLAIN_TIMEOUT
+        )
+    except Exception as e:
+        # pesan error bisa memuat nilai parameter (mis. invalid input syntax: "...")
+        entry["plan_error"] = f"{type(e).__name__}: " + re.sub(r'"[^"]*"', "?", _LITERAL_RE.sub("?", str(e)))
+    _log_slow_query(entry)
+
+
+async def _explain(query: str, params: Optional[tuple]) -> str:
+    """
+    EXPLAIN di koneksi terpisah (bukan pool, yang mungkin sedang penuh).
+    ANALYZE benar-benar menjalankan query, jadi hanya untuk statement baca;
+    statement tulis cukup rencana tanpa ANALYZE. Semuanya di transaksi
+    read-only yang selalu di-rollback.
+    """
+    analyze = not _WRITE_RE.search(query)
+    options = "ANALYZE, BUFFERS" if analyze else "VERBOSE"
+    timeout_ms = int(settings.SLOW_QUERY_EXPLAIN_TIMEOUT * 1000)
+    conn = await asyncpg.connect(
+        dsn=settings.DATABASE_URL,
+        timeout=settings.SLOW_QUERY_EXPLAIN_TIMEOUT,
+        server_settings={"statement_timeout": str(timeout_ms), "application_name": "slow_query_explain"},
+    )
+    try:
+        tx = conn.transaction(readonly=analyze)
+        await tx.start()
+        try:
+            rows = await conn.fetch(f"EXPLAIN ({options}) {query}", *(params or ()))
+        finally:
+            await tx.rollback()
+        return _redact_plan("\n".join(r[0] for r in rows))
+    finally:
+        await conn.close()
+
+
+# --- Helper Query ---
+async def fetch_all(query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
+    async with _acquire() as conn:
         rows = await conn.fetch(query, *(params or ()))
         return [serialize_row(dict(r)) for r in rows]
 
 
 async def fetch_one(query: str, params: Optional[tuple] = None) -> Optional[Dict[str, Any]]:
-    conn_pool = await _get_pool()
-    async with conn_pool.acquire() as conn:
+    async with _acquire() as conn:
         row = await conn.fetchrow(query, *(params or ()))
         return serialize_row(dict(row)) if row else None
 
 
 async def fetch_val(query: str, params: Optional[tuple] = None) -> Any:
-    conn_pool = await _get_pool()
-    async with conn_pool.acquire() as conn:
+    async with _acquire() as conn:
         return await conn.fetchval(query, *(params or ()))
 
 
 async def execute(query: str, params: Optional[tuple] = None) -> str:
-    conn_pool = await _get_pool()
-    async with conn_pool.acquire() as conn:
+    async with _acquire() as conn:
         return await conn.execute(query, *(params or ()))
 
 
-# --- Transaksi ---
+async def stream_rows(
+    query: str, params: Optional[tuple] = None, prefetch: int = 500
+) -> AsyncIterator[Dict[str, Any]]:
+    """Iterasi hasil query lewat server-side cursor (memory konstan, untuk streaming/export)."""
+    async with _acquire() as conn:
+        async with conn.transaction():
+            async for r in conn.cursor(query, *(params or ()), prefetch=prefetch):
+                yield serialize_row(dict(r))
+
+
+# --- LISTEN / NOTIFY (invalidasi cache antar worker process) ---
+def on_notify(channel: str, callback: Callable[[Optional[str]], None]) -> None:
+    """
+    Daftarkan callback untuk NOTIFY di channel (dipanggil sebelum connect_db).
+    Callback menerima payload; payload None berarti koneksi listener sempat
+    putus dan notifikasi mungkin hilang → callback sebaiknya flush semua.
+    """
+    _listeners.setdefault(channel, []).append(callback)
+
+
+async def notify(channel: str, payload: str = "") -> None:
+    await execute("SELECT pg_notify($1, $2)", (channel, payload))
+
+
+def _dispatch_notify(conn, pid, channel, payload) -> None:
+    for callback in _listeners.get(channel, ()):
+        try:
+            callback(payload)
+        except Exception as e:
+            print(f"❌ Listener {channel} error: {e}")
+
+
+def _flush_all_listeners() -> None:
+    for channel in _listeners:
+        _dispatch_notify(None, None, channel, None)
+
+
+async def _start_listener() -> None:
+    global _listen_conn
+    if not _listeners or _listen_conn is not None:
+        return
+    conn = await asyncpg.connect(dsn=settings.DATABASE_URL)
+    for channel in _listeners:
+        await conn.add_listener(channel, _dispatch_notify)
+    conn.add_termination_listener(_on_listener_lost)
+    _listen_conn = conn
+
+
+def _on_listener_lost(conn) -> None:
+    global _listen_conn
+    _listen_conn = None
+    if _listen_closing:
+        return
+    print("⚠️ Koneksi LISTEN terputus, reconnect...")
+    _flush_all_listeners()
+    asyncio.get_running_loop().create_task(_reconnect_listener())
+
+
+async def _reconnect_listener() -> None:
+    delay = 1.0
+    while not _listen_closing and _listen_conn is None:
+        try:
+            await _start_listener()
+            # notifikasi selama putus tidak diterima → flush sekali lagi
+            _flush_all_listeners()
+            return
+        except Exception as e:
+            print(f"❌ Reconnect LISTEN gagal: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+
+# --- Koneksi / Transaksi ---
+# Untuk operasi di luar helper di atas (COPY, cursor); query tetap tercatat metric.
+@asynccontextmanager
+async def connection():
+    async with _acquire() as conn:
+        yield conn
+
+
 @asynccontextmanager
 async def transaction():
-    conn_pool = await _get_pool()
-    async with conn_pool.acquire() as conn:
+    async with _acquire() as conn:
         async with conn.transaction():
             yield conn
+
+
+# --- Batched Log Writer ---
+_log_writers: List["BatchLogWriter"] = []
+
+
+class BatchLogWriter:
+    """
+    Buffer row tabel log append-only di memory lalu tulis per batch via COPY.
+    Flush saat buffer mencapai max_rows, tiap flush_interval detik, dan saat shutdown.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        columns: tuple,
+        max_rows: int = 500,
+        flush_interval: float = 1.0,
+        max_buffer: int = 50000,
+    ):
+        self.table = table
+        self.columns = columns
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+
+        self._buffer: List[tuple] = []
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+
+        # counters
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.dropped_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+        _log_writers.append(self)
+
+    def add(self, *values: Any) -> None:
+        """Masukkan satu row ke buffer (tanpa round trip ke DB)."""
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped_rows += 1
+            return
+        self._buffer.append(values)
+        if len(self._buffer) >= self.max_rows and (self._size_flush is None or self._size_flush.done()):
+            self._size_flush = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self._buffer or pool is None:
+                return 0
+            rows, self._buffer = self._buffer, []
+
+            start = time.perf_counter()
+            try:
+                async with _acquire() as conn:
+                    await conn.copy_records_to_table(self.table, records=rows, columns=self.columns)
+            except Exception as e:
+                self.flush_errors += 1
+                # kembalikan ke buffer (dibatasi max_buffer) supaya dicoba di flush berikutnya
+                room = max(self.max_buffer - len(self._buffer), 0)
+                self.dropped_rows += max(len(rows) - room, 0)
+                self._buffer[:0] = rows[:room]
+                print(f"❌ Gagal flush {self.table} ({len(rows)} rows): {e}")
+                return 0
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushed_rows += len(rows)
+            self.flush_count += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+            return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "table": self.table,
+            "queue_depth": len(self._buffer),
+            "flushed_rows": self.flushed_rows,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "dropped_rows": self.dropped_rows,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.flush_count, 3) if self.flush_count else 0.0,
+        }
+
+
+def log_writer_stats() -> List[Dict[str, Any]]:
+    return [w.stats() for w in _log_writers]
+
+
+duitku_log_writer = BatchLogWriter(
+    "duitku_logs",
+    ("merchant_order_id", "amount", "result_code", "signature", "payload", "created_at"),
+)
+coa_log_writer = BatchLogWriter(
+    "coa_log",
+    ("username", "nas_ip", "result", "response"),
+)
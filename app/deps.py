@@ -1,28 +1,92 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, HTTPBasic, HTTPBasicCredentials
 from jose import jwt, JWTError
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import time
 
 from .config import get_settings
+from .utils import decode_cursor
+from .revocation import revoked_tokens
+from .cache import get_reseller_context
 
 settings = get_settings()
 
 # ---- JWT Auth untuk Reseller ----
 security_jwt = HTTPBearer(auto_error=False)
 
+
+class JWTClaimCache:
+    """
+    LRU token → claims untuk token yang sudah lolos verifikasi, supaya request
+    berikutnya dengan bearer token yang sama cukup lookup dict.
+    Entry kedaluwarsa di `exp` token (token tanpa exp: maksimal fallback_ttl detik).
+    """
+
+    def __init__(self, max_size: int, fallback_ttl: float = 300):
+        self.max_size = max_size
+        self.fallback_ttl = fallback_ttl
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        entry = self._data.get(token)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self._data[token]
+            self.misses += 1
+            return None
+        self._data.move_to_end(token)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, token: str, claims: Dict[str, Any]) -> None:
+        exp = claims.get("exp")
+        expires_at = float(exp) if isinstance(exp, (int, float)) else time.time() + self.fallback_ttl
+        self._data[token] = (expires_at, claims)
+        self._data.move_to_end(token)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+jwt_claim_cache = JWTClaimCache(settings.JWT_CACHE_SIZE)
+
+
 async def auth_reseller_jwt(credentials: HTTPAuthorizationCredentials = Depends(security_jwt)) -> Dict[str, Any]:
+    if not settings.USE_JWT:
+        # Mode non-JWT → auto return reseller default
+        return {"reseller_id": settings.DEFAULT_RESELLER_ID}
+
     if credentials is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing authorization header")
 
     token = credentials.credentials
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
-        reseller_id: str = payload.get("sub")
-        if reseller_id is None:
+    payload = jwt_claim_cache.get(token)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
+        except JWTError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid JWT token")
+        if payload.get("sub") is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid JWT payload")
-        return {"reseller_id": reseller_id}
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid JWT token")
+        jwt_claim_cache.set(token, payload)
+
+    # token hasil logout (lookup memory, tanpa query)
+    if payload.get("jti") in revoked_tokens:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+
+    return {"reseller_id": payload["sub"], "jti": payload.get("jti"), "exp": payload.get("exp")}
+
+async def reseller_context(reseller: Dict[str, Any] = Depends(auth_reseller_jwt)) -> Dict[str, Any]:
+    """Row resellers milik token (dari cache process, diinvalidasi via NOTIFY)."""
+    ctx = await get_reseller_context(reseller["reseller_id"])
+    if not ctx:
+        raise HTTPException(status_code=404, detail="Reseller not found")
+    return ctx
 
 
 # ---- Basic Auth untuk Admin ----
@@ -48,20 +112,12 @@ async def pagination(page: int = 1, per_page: int = 20) -> Dict[str, int]:
     offset = (page - 1) * per_page
     return {"page": page, "per_page": per_page, "offset": offset, "limit": per_page}
 
-async def auth_reseller_jwt(credentials: HTTPAuthorizationCredentials = Depends(security_jwt)) -> Dict[str, Any]:
-    if not settings.USE_JWT:
-        # Mode non-JWT → auto return reseller default
-        return {"reseller_id": settings.DEFAULT_RESELLER_ID}
-
-    if credentials is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing authorization header")
 
-    token = credentials.credentials
+async def cursor_pagination(cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+    if limit < 1 or limit > 500:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 500")
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALG])
-        reseller_id: str = payload.get("sub")
-        if reseller_id is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid JWT payload")
-        return {"reseller_id": reseller_id}
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid JWT token")
+        decoded = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"cursor": decoded, "limit": limit}
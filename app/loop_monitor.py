@@ -0,0 +1,129 @@
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+from .config import get_settings
+from .metrics import Gauge, Histogram
+
+settings = get_settings()
+
+# ---- Monitor event loop (API & worker) ----
+# 1. Sampler lag: task yang tidur LOOP_LAG_INTERVAL detik lalu mengukur
+#    keterlambatan bangunnya → histogram + persentil jendela terakhir.
+# 2. Watchdog thread: ping loop lewat call_soon_threadsafe; kalau tidak dibalas
+#    dalam LOOP_BLOCK_THRESHOLD_MS, ambil stack thread loop (kode yang sedang
+#    memblok: bcrypt, json.dumps besar, print, dll) dan log.
+
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "Keterlambatan event loop (sampler periodik)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED_SECONDS = Histogram(
+    "event_loop_blocked_seconds",
+    "Durasi event loop terblokir melewati ambang watchdog",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+_recent_lags: collections.deque = collections.deque(maxlen=600)
+
+
+def _lag_quantiles() -> Dict[str, float]:
+    if not _recent_lags:
+        return {}
+    ordered = sorted(_recent_lags)
+    last = len(ordered) - 1
+    return {q: ordered[min(int(float(q) * len(ordered)), last)] for q in ("0.5", "0.9", "0.99", "1")}
+
+
+Gauge(
+    "event_loop_lag_recent_seconds",
+    "Persentil lag event loop dari 600 sampel terakhir per process",
+    ("quantile",),
+    fn=_lag_quantiles,
+    mode="pid",
+)
+
+_sampler_task: Optional[asyncio.Task] = None
+_watchdog: Optional["_Watchdog"] = None
+
+
+async def _sample_lag() -> None:
+    interval = settings.LOOP_LAG_INTERVAL
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(time.perf_counter() - start - interval, 0.0)
+        _recent_lags.append(lag)
+        LOOP_LAG_SECONDS.observe(lag)
+
+
+class _Watchdog(threading.Thread):
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float):
+        super().__init__(name="loop-watchdog", daemon=True)
+        self.loop = loop
+        self.threshold = threshold
+        self.loop_thread_id = threading.get_ident()
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _stack(self) -> str:
+        frame = sys._current_frames().get(self.loop_thread_id)
+        return "".join(traceback.format_stack(frame)) if frame else "(stack tidak tersedia)"
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.threshold):
+            pong = threading.Event()
+            started = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(pong.set)
+            except RuntimeError:
+                return  # loop sudah ditutup
+            if pong.wait(self.threshold):
+                continue
+
+            # loop tidak membalas dalam ambang → ambil stack selagi masih memblok
+            stack = self._stack()
+            print(
+                f"⚠️ Event loop terblokir > {self.threshold * 1000:.0f} ms, stack thread loop:\n{stack}",
+                flush=True,
+            )
+            while not pong.wait(self.threshold) and not self._stop_event.is_set():
+                pass
+            blocked = time.perf_counter() - started
+            print(f"⚠️ Event loop kembali jalan setelah ≥ {blocked * 1000:.0f} ms", flush=True)
+            # metrics diupdate dari thread loop (registry tidak thread-safe)
+            try:
+                self.loop.call_soon_threadsafe(LOOP_BLOCKED_SECONDS.observe, blocked)
+            except RuntimeError:
+                return
+
+
+def start_loop_monitor() -> None:
+    global _sampler_task, _watchdog
+    loop = asyncio.get_running_loop()
+    if settings.LOOP_LAG_INTERVAL and _sampler_task is None:
+        _sampler_task = loop.create_task(_sample_lag())
+    if settings.LOOP_BLOCK_THRESHOLD_MS and _watchdog is None:
+        _watchdog = _Watchdog(loop, settings.LOOP_BLOCK_THRESHOLD_MS / 1000)
+        _watchdog.start()
+
+
+async def stop_loop_monitor() -> None:
+    global _sampler_task, _watchdog
+    if _watchdog:
+        _watchdog.stop()
+        _watchdog = None
+    if _sampler_task:
+        _sampler_task.cancel()
+        try:
+            await _sampler_task
+        except asyncio.CancelledError:
+            pass
+        _sampler_task = None
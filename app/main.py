@@ -1,9 +1,17 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 
-from app.db import connect_db, disconnect_db
+from app.db import connect_db, disconnect_db, log_writer_stats
+from app.deps import jwt_claim_cache
+from app.revocation import revoked_tokens
+from app.responses import FastJSONResponse
+from app.compression import CompressionMiddleware
+from app.request_context import QueryStatsMiddleware
+from app.loop_monitor import start_loop_monitor, stop_loop_monitor
+from app.metrics import MetricsMiddleware, render as render_metrics, start_metrics_writer, stop_metrics_writer
+from app.config import get_settings
 from app.routers import (
     resellers,
     profiles,
@@ -18,9 +26,14 @@ from app.routers import (
 async def lifespan(app: FastAPI):
     # startup
     await connect_db()
+    await revoked_tokens.load()
+    start_metrics_writer()
+    start_loop_monitor()
     print("✅ Database connected")
     yield
     # shutdown
+    await stop_loop_monitor()
+    await stop_metrics_writer()
     await disconnect_db()
     print("🛑 Database disconnected")
 
@@ -29,6 +42,7 @@ app = FastAPI(
     version="1.0.0",
     description="API untuk manajemen reseller, users, invoices, payments, dan reports",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # Middleware
@@ -46,6 +60,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/br untuk JSON list & export NDJSON/CSV (streaming tetap streaming)
+settings = get_settings()
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+)
+
+# jumlah query / waktu DB per request + deteksi N+1
+app.add_middleware(QueryStatsMiddleware)
+
+# latensi per route (paling luar, supaya waktu kompresi ikut terhitung)
+app.add_middleware(MetricsMiddleware)
+
 # Exception Handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -57,7 +85,12 @@ async def global_exception_handler(request: Request, exc: Exception):
 # Health Check
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "log_writers": log_writer_stats(), "jwt_cache": jwt_claim_cache.stats()}
+
+# Prometheus: gabungan semua worker uvicorn + worker scheduler (lihat METRICS_DIR)
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 # Router Registrasi
 app.include_router(resellers.router, prefix="", tags=["Resellers & Auth"])
@@ -0,0 +1,328 @@
+import asyncio
+import bisect
+import glob
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .config import get_settings
+from .request_context import reset_caller, set_caller
+
+settings = get_settings()
+
+# ---- Metrics (format teks Prometheus, tanpa dependency eksternal) ----
+# Tiap process (4 worker uvicorn + worker scheduler) menulis snapshot JSON ke
+# METRICS_DIR setiap METRICS_FLUSH_INTERVAL detik; /metrics menggabungkan
+# snapshot semua process (counter & histogram dijumlah, gauge sesuai mode).
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+_registry: Dict[str, "_Metric"] = {}
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(l, "")) for l in self.labelnames)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "help": self.help, "labelnames": list(self.labelnames)}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, value: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + value
+
+    def samples(self) -> List[list]:
+        return [[list(k), v] for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """
+    Nilai sesaat: di-set manual atau dibaca dari `fn` saat snapshot
+    (fn return angka, atau dict label tuple → angka).
+    mode gabungan antar process: sum / max / pid (tiap process jadi label pid).
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        fn: Optional[Callable[[], Any]] = None,
+        mode: str = "sum",
+    ):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.mode = mode
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> List[list]:
+        values = dict(self._values)
+        if self.fn is not None:
+            try:
+                v = self.fn()
+            except Exception:
+                v = None
+            if isinstance(v, dict):
+                values.update({tuple(k) if isinstance(k, tuple) else (k,): val for k, val in v.items()})
+            elif v is not None:
+                values[()] = v
+        return [[list(k), v] for k, v in values.items()]
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "mode": self.mode}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # per label: [jumlah per bucket (non-kumulatif, + slot +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[list]:
+        return [[list(k), list(v[0]), v[1], v[2]] for k, v in self._values.items()]
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "buckets": list(self.buckets)}
+
+
+# ---- Snapshot & gabungan antar process ----
+def snapshot() -> Dict[str, Any]:
+    return {
+        "process": PROCESS_ID,
+        "ts": time.time(),
+        "metrics": {name: {**m.describe(), "samples": m.samples()} for name, m in _registry.items()},
+    }
+
+
+def _snapshot_path() -> Optional[str]:
+    if not settings.METRICS_DIR:
+        return None
+    return os.path.join(settings.METRICS_DIR, f"{PROCESS_ID}.json")
+
+
+def write_snapshot() -> None:
+    path = _snapshot_path()
+    if not path:
+        return
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _load_snapshots() -> List[Dict[str, Any]]:
+    snapshots = [snapshot()]
+    own = _snapshot_path()
+    if not own:
+        return snapshots
+    stale_before = time.time() - settings.METRICS_STALE_SECONDS
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+        if path == own:
+            continue
+        try:
+            if os.path.getmtime(path) < stale_before:
+                # process sudah mati / restart
+                os.remove(path)
+                continue
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def render() -> str:
+    """Gabungkan snapshot semua process → teks exposition Prometheus."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for snap in _load_snapshots():
+        for name, m in snap.get("metrics", {}).items():
+            target = merged.setdefault(name, {**{k: v for k, v in m.items() if k != "samples"}, "values": {}})
+            values = target["values"]
+            labelnames = m["labelnames"]
+            for sample in m["samples"]:
+                key = tuple(sample[0])
+                if m["kind"] == "histogram":
+                    cur = values.get(key)
+                    if cur is None or len(cur[0]) != len(sample[1]):
+                        values[key] = [list(sample[1]), sample[2], sample[3]]
+                    else:
+                        cur[0] = [a + b for a, b in zip(cur[0], sample[1])]
+                        cur[1] += sample[2]
+                        cur[2] += sample[3]
+                elif m["kind"] == "gauge" and m.get("mode") == "pid":
+                    values[key + (snap["process"],)] = sample[1]
+                    target["labelnames"] = list(labelnames) + ["pid"]
+                elif m["kind"] == "gauge" and m.get("mode") == "max":
+                    values[key] = max(values.get(key, sample[1]), sample[1])
+                else:
+                    values[key] = values.get(key, 0.0) + sample[1]
+
+    lines: List[str] = []
+    for name in sorted(merged):
+        m = merged[name]
+        lines.append(f"# HELP {name} {m['help']}")
+        lines.append(f"# TYPE {name} {m['kind']}")
+        labelnames = m["labelnames"]
+        for key, value in sorted(m["values"].items()):
+            if m["kind"] == "histogram":
+                counts, total, count = value
+                cumulative = 0
+                for le, c in zip(m["buckets"] + ["+Inf"], counts):
+                    cumulative += c
+                    le_label = 'le="%s"' % (le if le == "+Inf" else _fmt(le))
+                    lines.append(f"{name}_bucket{_labels(labelnames, key, le_label)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labelnames, key)} {_fmt(total)}")
+                lines.append(f"{name}_count{_labels(labelnames, key)} {count}")
+            else:
+                lines.append(f"{name}{_labels(labelnames, key)} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---- Background writer ----
+_writer_task: Optional[asyncio.Task] = None
+
+
+async def _writer_loop() -> None:
+    while True:
+        await asyncio.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError as e:
+            print(f"❌ Gagal menulis snapshot metrics: {e}")
+
+
+def start_metrics_writer() -> None:
+    global _writer_task
+    if settings.METRICS_DIR and _writer_task is None:
+        _writer_task = asyncio.get_running_loop().create_task(_writer_loop())
+
+
+async def stop_metrics_writer() -> None:
+    global _writer_task
+    if _writer_task:
+        _writer_task.cancel()
+        try:
+            await _writer_task
+        except asyncio.CancelledError:
+            pass
+        _writer_task = None
+    path = _snapshot_path()
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+# ---- Metrics HTTP ----
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Durasi request HTTP per route",
+    ("method", "route", "status"),
+)
+
+
+# panggilan keluar (WA gateway, radclient CoA) per target & hasil
+OUTBOUND_CALL_SECONDS = Histogram(
+    "outbound_call_seconds",
+    "Latensi panggilan ke layanan luar",
+    ("target", "outcome"),
+)
+
+
+class MetricsMiddleware:
+    """Catat durasi tiap request per route template (bukan path mentah)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        token = set_caller(scope)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            reset_caller(token)
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            )
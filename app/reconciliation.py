@@ -0,0 +1,211 @@
+import asyncio
+import codecs
+import csv
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .db import connection, execute, fetch_val, transaction
+from .utils import now_tz, start_of_day_tz
+
+MISMATCH_COLUMNS = (
+    "run_id", "kind", "provider_txn_id", "payment_id",
+    "file_amount", "db_amount", "db_status", "line_no",
+)
+MISMATCH_FLUSH_ROWS = 5000
+
+
+# ---- Sumber baris CSV ----
+async def iter_text_lines(chunks: AsyncIterator[bytes], encoding: str = "utf-8-sig") -> AsyncIterator[str]:
+    """Ubah stream bytes (request body / file) jadi baris teks tanpa load semua ke memory."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_file_chunks(path: str, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _parse_amount(value: Optional[str]) -> Optional[Decimal]:
+    if value is None:
+        return None
+    value = value.strip().replace(",", "")
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        return None
+
+
+# ---- Engine ----
+async def _load_payments(window_start: date, window_end: date, method: Optional[str]) -> Dict[str, tuple]:
+    """Satu range query payments di window, di-index by provider_txn_id (hash join build side)."""
+    index: Dict[str, tuple] = {}
+    # batas hari di TIMEZONE app, bukan timezone sesi database
+    params: List[Any] = [start_of_day_tz(window_start), start_of_day_tz(window_end + timedelta(days=1))]
+    method_filter = ""
+    if method:
+        params.append(method)
+        method_filter = "AND method=$3"
+
+    async with transaction() as conn:
+        async for r in conn.cursor(
+            f"""
+            SELECT id, provider_txn_id, amount, status
+            FROM payments
+            WHERE created_at >= $1 AND created_at < $2
+              AND provider_txn_id IS NOT NULL {method_filter}
+            """,
+            *params,
+            prefetch=10000,
+        ):
+            index[r["provider_txn_id"]] = (r["id"], r["amount"], r["status"])
+    return index
+
+
+async def _flush_mismatches(rows: List[tuple]) -> None:
+    if not rows:
+        return
+    async with connection() as conn:
+        await conn.copy_records_to_table(
+            "reconciliation_mismatches", records=rows, columns=MISMATCH_COLUMNS
+        )
+    rows.clear()
+
+
+async def reconcile_settlement(
+    lines: AsyncIterator[str],
+    *,
+    window_start: date,
+    window_end: date,
+    source: str,
+    method: Optional[str] = "duitku",
+    txn_column: str = "reference",
+    amount_column: str = "amount",
+) -> Dict[str, Any]:
+    """
+    Cocokkan file settlement (stream baris CSV) dengan tabel payments.
+
+    Memory dibatasi jumlah payments di window (hash index) + buffer mismatch;
+    file tidak pernah di-load utuh. Mismatch ditulis per batch via COPY.
+    """
+    run_id = await fetch_val(
+        """
+        INSERT INTO reconciliation_runs (source, method, window_start, window_end, status, created_at)
+        VALUES ($1,$2,$3,$4,'running',$5)
+        RETURNING id
+        """,
+        (source, method, window_start, window_end, now_tz()),
+    )
+
+    lines_count = matched = mismatched = 0
+    buffer: List[tuple] = []
+
+    def mismatch(kind, txn_id=None, payment=None, file_amount=None, line_no=None):
+        nonlocal mismatched
+        mismatched += 1
+        buffer.append((
+            run_id, kind, txn_id,
+            payment[0] if payment else None,
+            file_amount,
+            payment[1] if payment else None,
+            payment[2] if payment else None,
+            line_no,
+        ))
+
+    try:
+        payments = await _load_payments(window_start, window_end, method)
+        seen = set()
+
+        header: Optional[List[str]] = None
+        line_no = 0
+        async for line in lines:
+            line_no += 1
+            if not line.strip():
+                continue
+            fields = next(csv.reader([line]))
+            if header is None:
+                header = [h.strip() for h in fields]
+                if txn_column not in header or amount_column not in header:
+                    raise ValueError(f"CSV harus punya kolom '{txn_column}' dan '{amount_column}'")
+                txn_idx = header.index(txn_column)
+                amount_idx = header.index(amount_column)
+                continue
+
+            lines_count += 1
+            txn_id = fields[txn_idx].strip() if len(fields) > txn_idx else ""
+            file_amount = _parse_amount(fields[amount_idx]) if len(fields) > amount_idx else None
+            if not txn_id or file_amount is None:
+                mismatch("invalid_line", txn_id or None, file_amount=file_amount, line_no=line_no)
+            elif txn_id in seen:
+                mismatch("duplicate_in_file", txn_id, file_amount=file_amount, line_no=line_no)
+            else:
+                payment = payments.pop(txn_id, None)
+                if payment is None:
+                    mismatch("missing_in_db", txn_id, file_amount=file_amount, line_no=line_no)
+                else:
+                    seen.add(txn_id)
+                    if payment[1] != file_amount:
+                        mismatch("amount_mismatch", txn_id, payment, file_amount, line_no)
+                    elif payment[2] != "success":
+                        mismatch("status_mismatch", txn_id, payment, file_amount, line_no)
+                    else:
+                        matched += 1
+
+            if len(buffer) >= MISMATCH_FLUSH_ROWS:
+                await _flush_mismatches(buffer)
+
+        # sisa index = payment success di DB tapi tidak ada di file settlement
+        for txn_id, payment in payments.items():
+            if payment[2] != "success":
+                continue
+            mismatch("missing_in_file", txn_id, payment)
+            if len(buffer) >= MISMATCH_FLUSH_ROWS:
+                await _flush_mismatches(buffer)
+        await _flush_mismatches(buffer)
+
+    except BaseException as e:
+        # termasuk CancelledError (job dibatalkan / worker shutdown) supaya run
+        # tidak tertinggal 'running'; shield agar update tetap selesai
+        await asyncio.shield(execute(
+            """
+            UPDATE reconciliation_runs
+            SET status='failed', error=$2, lines=$3, matched=$4, mismatched=$5, finished_at=$6
+            WHERE id=$1
+            """,
+            (run_id, str(e) or type(e).__name__, lines_count, matched, mismatched, now_tz()),
+        ))
+        raise
+
+    await execute(
+        """
+        UPDATE reconciliation_runs
+        SET status='done', lines=$2, matched=$3, mismatched=$4, finished_at=$5
+        WHERE id=$1
+        """,
+        (run_id, lines_count, matched, mismatched, now_tz()),
+    )
+    return {
+        "run_id": run_id,
+        "source": source,
+        "window_start": window_start,
+        "window_end": window_end,
+        "lines": lines_count,
+        "matched": matched,
+        "mismatched": mismatched,
+    }
@@ -0,0 +1,111 @@
+import json
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict
+
+from .db import fetch_all
+from .utils import json_default, period_range, start_of_day_tz
+
+
+# ---- Validasi params ----
+def _month_range(params: Dict[str, Any]) -> Dict[str, Any]:
+    """params {period_from, period_to: 'YYYY-MM'} → maksimal 24 bulan."""
+    try:
+        start, _ = period_range(params["period_from"])
+        _, end = period_range(params["period_to"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("params period_from dan period_to wajib, format YYYY-MM")
+    if end <= start:
+        raise ValueError("period_to harus >= period_from")
+    if (end.year - start.year) * 12 + end.month - start.month > 24:
+        raise ValueError("Range maksimal 24 bulan")
+    return params
+
+
+def _day_range(params: Dict[str, Any]) -> Dict[str, Any]:
+    """params {date_from, date_to: 'YYYY-MM-DD'} → maksimal 366 hari."""
+    try:
+        start = date.fromisoformat(params["date_from"])
+        end = date.fromisoformat(params["date_to"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("params date_from dan date_to wajib, format YYYY-MM-DD")
+    if end < start:
+        raise ValueError("date_to harus >= date_from")
+    if (end - start).days > 366:
+        raise ValueError("Range maksimal 366 hari")
+    return params
+
+
+# ---- Report ----
+async def finance_by_reseller(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Keuangan per reseller per bulan (dari invoice_daily_rollup)."""
+    start, _ = period_range(params["period_from"])
+    _, end = period_range(params["period_to"])
+    rows = await fetch_all(
+        """
+        SELECT
+            r.id AS reseller_id, r.name AS reseller_name,
+            date_trunc('month', x.day)::date AS month,
+            COALESCE(SUM(x.invoice_count) FILTER (WHERE x.status='paid'),0)::bigint AS paid_invoices,
+            COALESCE(SUM(x.invoice_count) FILTER (WHERE x.status NOT IN ('paid','')),0)::bigint AS unpaid_invoices,
+            COALESCE(SUM(x.amount) FILTER (WHERE x.status='paid'),0) AS paid_amount,
+            COALESCE(SUM(x.amount) FILTER (WHERE x.status NOT IN ('paid','')),0) AS unpaid_amount,
+            COALESCE(SUM(x.payments_amount),0) AS payments_total
+        FROM invoice_daily_rollup x
+        JOIN resellers r ON r.id = x.reseller_id
+        WHERE x.day >= $1 AND x.day < $2
+        GROUP BY 1, 2, 3
+        ORDER BY 2, 3
+        """,
+        (start, end),
+    )
+    return {"rows": rows}
+
+
+async def usage_by_user(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Pemakaian radacct (durasi & traffic) per user, sesi yang mulai di range tanggal."""
+    start = date.fromisoformat(params["date_from"])
+    end = date.fromisoformat(params["date_to"])
+    conditions = ["a.acctstarttime >= $1", "a.acctstarttime < $2"]
+    args = [start_of_day_tz(start), start_of_day_tz(end + timedelta(days=1))]
+    if params.get("reseller_id"):
+        conditions.append("u.reseller_id = $3::uuid")
+        args.append(params["reseller_id"])
+    where_clause = " AND ".join(conditions)
+
+    rows = await fetch_all(
+        f"""
+        SELECT
+            u.reseller_id, a.username,
+            COUNT(*) AS sessions,
+            COALESCE(SUM(a.acctsessiontime),0)::bigint AS session_seconds,
+            COALESCE(SUM(a.acctinputoctets),0)::bigint AS input_octets,
+            COALESCE(SUM(a.acctoutputoctets),0)::bigint AS output_octets
+        FROM radacct a
+        JOIN ppp_users u ON u.username = a.username
+        WHERE {where_clause}
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        """,
+        tuple(args),
+    )
+    return {"rows": rows}
+
+
+# kind → (validasi params saat submit, fungsi report di worker)
+REPORT_KINDS: Dict[str, tuple] = {
+    "finance_by_reseller": (_month_range, finance_by_reseller),
+    "usage_by_user": (_day_range, usage_by_user),
+}
+
+
+def validate_report_spec(kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Raise ValueError kalau kind/params tidak valid (dipanggil API sebelum insert)."""
+    if kind not in REPORT_KINDS:
+        raise ValueError(f"kind harus salah satu dari: {', '.join(REPORT_KINDS)}")
+    return REPORT_KINDS[kind][0](params or {})
+
+
+async def run_report(kind: str, params: Dict[str, Any]) -> str:
+    """Hitung report, return JSON siap disimpan ke report_jobs.result."""
+    report: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]] = REPORT_KINDS[kind][1]
+    return json.dumps(await report(params), default=json_default)
@@ -0,0 +1,106 @@
+from contextvars import ContextVar, Token
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import get_settings
+
+settings = get_settings()
+
+# Pemanggil yang sedang berjalan di task ini: scope ASGI request API
+# (di-set MetricsMiddleware) atau nama job worker (di-set tracked_job).
+_caller: ContextVar[Any] = ContextVar("caller", default=None)
+
+
+def set_caller(caller: Any) -> Token:
+    return _caller.set(caller)
+
+
+def reset_caller(token: Token) -> None:
+    _caller.reset(token)
+
+
+def current_caller() -> Optional[str]:
+    """Label pemanggil, mis. 'GET /users/{user_id}' atau 'job_process_webhook_inbox'."""
+    caller = _caller.get()
+    if isinstance(caller, dict):
+        # scope ASGI: route template baru terisi setelah routing
+        route = caller.get("route")
+        return f"{caller.get('method')} {getattr(route, 'path', caller.get('path'))}"
+    return caller
+
+
+# ---- Statistik query per request ----
+class QueryStats:
+    """Round trip DB, total waktu DB, dan jumlah eksekusi per bentuk SQL dalam satu request."""
+
+    __slots__ = ("round_trips", "db_seconds", "shapes")
+
+    def __init__(self):
+        self.round_trips = 0
+        self.db_seconds = 0.0
+        self.shapes: Dict[str, int] = {}
+
+    def record(self, shape: str, elapsed: float) -> None:
+        self.round_trips += 1
+        self.db_seconds += elapsed
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def repeated(self, min_count: int = 2) -> List[Tuple[str, int]]:
+        """Bentuk SQL yang dieksekusi >= min_count kali, terbanyak dulu."""
+        return sorted(
+            ((shape, n) for shape, n in self.shapes.items() if n >= min_count),
+            key=lambda item: -item[1],
+        )
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def record_query(shape: str, elapsed: float) -> None:
+    """Dipanggil helper db setiap round trip (no-op di luar request)."""
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.record(shape, elapsed)
+
+
+class QueryStatsMiddleware:
+    """
+    Hitung query per request. DEBUG_DB_HEADERS=true → header X-DB-Queries,
+    X-DB-Time-Ms, X-DB-Max-Repeat di response. Bentuk SQL yang sama diulang
+    >= N_PLUS_ONE_THRESHOLD kali dalam satu request dicatat sebagai N+1.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _query_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and settings.DEBUG_DB_HEADERS:
+                max_repeat = max(stats.shapes.values(), default=0)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-queries", str(stats.round_trips).encode()),
+                    (b"x-db-time-ms", f"{stats.db_seconds * 1000:.1f}".encode()),
+                    (b"x-db-max-repeat", str(max_repeat).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _query_stats.reset(token)
+            threshold = settings.N_PLUS_ONE_THRESHOLD
+            if threshold:
+                suspects = stats.repeated(threshold)
+                if suspects:
+                    route = scope.get("route")
+                    shapes = "; ".join(f"{n}x {shape[:200]}" for shape, n in suspects[:3])
+                    print(
+                        f"⚠️ N+1 {scope['method']} {getattr(route, 'path', scope['path'])}: "
+                        f"{stats.round_trips} query ({stats.db_seconds * 1000:.1f} ms) — {shapes}"
+                    )
@@ -0,0 +1,72 @@
+import hashlib
+from decimal import Decimal
+from typing import Any, Dict, Optional, Type
+
+import orjson
+from fastapi.encoders import decimal_encoder
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _orjson_default(v: Any) -> Any:
+    # date/datetime/UUID sudah ditangani orjson; Decimal ikut aturan FastAPI (int/float)
+    if isinstance(v, Decimal):
+        return decimal_encoder(v)
+    return str(v)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse dengan encoder orjson (output sama dengan jsonable_encoder untuk row DB)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _project(row: Optional[Dict[str, Any]], fields) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    return {k: row.get(k) for k in fields}
+
+
+def trusted_response(
+    content: Any,
+    model: Optional[Type[BaseModel]] = None,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+) -> FastJSONResponse:
+    """
+    Kembalikan row DB apa adanya tanpa validasi ulang response_model.
+
+    Row dari fetch_one/fetch_all sudah bertipe benar, jadi cukup diproyeksikan
+    ke field `model` (supaya kolom lain tidak ikut keluar) lalu di-encode orjson.
+    response_model di decorator tetap dipakai untuk dokumentasi OpenAPI.
+    """
+    if model is not None:
+        fields = model.__fields__.keys()
+        if isinstance(content, list):
+            content = [_project(r, fields) for r in content]
+        else:
+            content = _project(content, fields)
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+# ---- Conditional GET (ETag / If-None-Match) ----
+def make_etag(*parts: Any) -> str:
+    raw = ":".join(str(p) for p in parts)
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest()[:24] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison sesuai RFC 9110 (prefix W/ diabaikan)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tag = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == tag for t in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from .db import execute, fetch_all, notify, on_notify
+
+CHANNEL = "token_revoked"
+
+
+class RevokedTokens:
+    """
+    jti token yang sudah di-revoke (logout). Sumber kebenaran tabel revoked_tokens,
+    dicerminkan ke dict jti → exp di tiap process dan disinkron lewat NOTIFY
+    (payload 'jti:exp'), jadi cek di auth_reseller_jwt tanpa query.
+    """
+
+    def __init__(self):
+        self._jtis: Dict[str, float] = {}
+        on_notify(CHANNEL, self._on_notify)
+
+    def __contains__(self, jti: Optional[str]) -> bool:
+        return jti is not None and jti in self._jtis
+
+    def __len__(self) -> int:
+        return len(self._jtis)
+
+    def _prune(self) -> None:
+        now = time.time()
+        for jti in [j for j, exp in self._jtis.items() if exp <= now]:
+            del self._jtis[jti]
+
+    async def load(self) -> None:
+        # digabung (bukan diganti) supaya NOTIFY yang masuk selama query tidak hilang
+        rows = await fetch_all(
+            "SELECT jti, EXTRACT(EPOCH FROM expires_at)::float8 AS exp FROM revoked_tokens WHERE expires_at > now()"
+        )
+        for r in rows:
+            self._jtis[r["jti"]] = r["exp"]
+        self._prune()
+
+    async def _reload(self) -> None:
+        try:
+            await self.load()
+        except Exception as e:
+            print(f"❌ Reload revoked_tokens gagal: {e}")
+
+    async def revoke(self, jti: str, reseller_id: Any, exp: float) -> None:
+        await execute(
+            """
+            INSERT INTO revoked_tokens (jti, reseller_id, expires_at)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (jti) DO NOTHING
+            """,
+            (jti, reseller_id, datetime.fromtimestamp(exp, timezone.utc)),
+        )
+        self._jtis[jti] = exp
+        self._prune()
+        await notify(CHANNEL, f"{jti}:{exp}")
+
+    def _on_notify(self, payload: Optional[str]) -> None:
+        if payload is None:
+            # listener sempat putus → revocation yang terlewat diambil ulang dari DB
+            asyncio.get_running_loop().create_task(self._reload())
+            return
+        jti, _, exp = payload.rpartition(":")
+        self._jtis[jti] = float(exp)
+        self._prune()
+
+
+revoked_tokens = RevokedTokens()
@@ -1,21 +1,93 @@
 # app/routers/admin.py
-from fastapi import APIRouter, Depends, HTTPException, Query
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional, List, Any
+from datetime import date
 import json
-from app.db import fetch_all, fetch_one, execute
-from app.deps import admin_basic_auth
-from app.utils import now_tz, send_wa_message
+from app.db import fetch_all, fetch_one, execute, stream_rows
+from app.deps import admin_basic_auth, pagination, cursor_pagination
+from app.reconciliation import iter_text_lines, reconcile_settlement
+from app.routers.reports import build_timeseries
+from app.report_jobs import validate_report_spec
+from app.cache import get_reseller_context, invalidate_reseller_context
+from app.utils import (
+    now_tz, send_wa_message, response_list, response_cursor, encode_cursor, cursor_keyset, period_range, start_of_day_tz, stream_ndjson,
+)
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
 
+# ---------------------------
+# Helper list: cursor pagination (keyset created_at, id) / NDJSON streaming
+# ---------------------------
+async def _keyset_list(
+    select_sql: str,
+    alias: str,
+    conditions: List[str],
+    params: List[Any],
+    paging: dict,
+    fmt: str,
+):
+    after_cursor, order = cursor_keyset(alias, len(params) + 1)
+
+    if fmt == "ndjson":
+        # semua row yang cocok filter, dibaca lewat server-side cursor
+        where_clause = " AND ".join(conditions) or "TRUE"
+        sql = f"{select_sql} WHERE {where_clause} {order}"
+        return StreamingResponse(
+            stream_ndjson(stream_rows(sql, tuple(params))),
+            media_type="application/x-ndjson",
+        )
+
+    conditions = list(conditions)
+    params = list(params)
+    if paging["cursor"]:
+        created_at, row_id = paging["cursor"]
+        conditions.append(after_cursor)
+        params.extend([created_at, row_id])
+
+    where_clause = " AND ".join(conditions) or "TRUE"
+    # ambil limit+1 untuk tahu masih ada halaman berikutnya, tanpa COUNT(*)
+    rows = await fetch_all(
+        f"{select_sql} WHERE {where_clause} {order} LIMIT {paging['limit'] + 1}",
+        tuple(params),
+    )
+    next_cursor = None
+    if len(rows) > paging["limit"]:
+        rows = rows[: paging["limit"]]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return response_cursor(rows, paging["limit"], next_cursor)
+
+
+def _period_filter(
+    column: str, period: str, conditions: List[str], params: List[Any], timestamp: bool = False
+) -> None:
+    try:
+        start, end = period_range(period)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="period harus format YYYY-MM")
+    if timestamp:
+        start, end = start_of_day_tz(start), start_of_day_tz(end)
+    conditions.append(f"{column} >= ${len(params)+1} AND {column} < ${len(params)+2}")
+    params.extend([start, end])
+
+
 # ---------------------------
 # Resellers
 # ---------------------------
 @router.get("/resellers")
-async def list_resellers(admin=Depends(admin_basic_auth)):
-    rows = await fetch_all("SELECT * FROM resellers ORDER BY created_at DESC")
-    return {"data": rows, "total": len(rows)}
+async def list_resellers(
+    search: Optional[str] = Query(None, description="Cari nama / email / company"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    paging=Depends(cursor_pagination),
+    admin=Depends(admin_basic_auth),
+):
+    conditions, params = [], []
+    if search:
+        conditions.append("(r.name ILIKE $1 OR r.email ILIKE $1 OR r.company_name ILIKE $1)")
+        params.append(f"%{search}%")
+
+    return await _keyset_list("SELECT r.* FROM resellers r", "r", conditions, params, paging, fmt)
 
 
 @router.get("/resellers/{reseller_id}")
@@ -56,12 +128,14 @@ async def update_reseller(reseller_id: str, payload: dict, admin=Depends(admin_b
     sql = f"UPDATE resellers SET {set_fields}, updated_at=${len(payload)+2} WHERE id=$1"
     params = (reseller_id, *payload.values(), now_tz())
     await execute(sql, params)
+    await invalidate_reseller_context(reseller_id)
     return {"message": "Reseller updated"}
 
 
 @router.delete("/resellers/{reseller_id}")
 async def delete_reseller(reseller_id: str, admin=Depends(admin_basic_auth)):
     await execute("DELETE FROM resellers WHERE id=$1", (reseller_id,))
+    await invalidate_reseller_context(reseller_id)
     return {"message": "Reseller deleted"}
 
 
@@ -69,11 +143,33 @@ async def delete_reseller(reseller_id: str, admin=Depends(admin_basic_auth)):
 # Users
 # ---------------------------
 @router.get("/users")
-async def list_users(admin=Depends(admin_basic_auth)):
-    rows = await fetch_all(
-        "SELECT u.*, r.name AS reseller_name FROM ppp_users u JOIN resellers r ON u.reseller_id=r.id WHERE u.deleted_at IS NULL ORDER BY u.created_at DESC"
+async def list_users(
+    reseller_id: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    profile_id: Optional[str] = Query(None),
+    search: Optional[str] = Query(None, description="Cari username / full_name"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    paging=Depends(cursor_pagination),
+    admin=Depends(admin_basic_auth),
+):
+    conditions, params = ["u.deleted_at IS NULL"], []
+    if reseller_id:
+        params.append(reseller_id)
+        conditions.append(f"u.reseller_id=${len(params)}")
+    if status:
+        params.append(status)
+        conditions.append(f"u.status=${len(params)}")
+    if profile_id:
+        params.append(profile_id)
+        conditions.append(f"u.profile_id=${len(params)}")
+    if search:
+        params.append(f"%{search}%")
+        conditions.append(f"(u.username ILIKE ${len(params)} OR u.full_name ILIKE ${len(params)})")
+
+    return await _keyset_list(
+        "SELECT u.*, r.name AS reseller_name FROM ppp_users u JOIN resellers r ON u.reseller_id=r.id",
+        "u", conditions, params, paging, fmt,
     )
-    return {"data": rows, "total": len(rows)}
 
 
 @router.get("/users/{user_id}")
@@ -91,19 +187,57 @@ async def get_user(user_id: str, admin=Depends(admin_basic_auth)):
 # Invoices
 # ---------------------------
 @router.get("/invoices")
-async def list_customer_invoices(admin=Depends(admin_basic_auth)):
-    rows = await fetch_all(
-        "SELECT ci.*, r.name AS reseller_name FROM customer_invoices ci JOIN resellers r ON ci.reseller_id=r.id ORDER BY ci.created_at DESC"
+async def list_customer_invoices(
+    reseller_id: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    period: Optional[str] = Query(None, description="Format: YYYY-MM (period_start)"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    paging=Depends(cursor_pagination),
+    admin=Depends(admin_basic_auth),
+):
+    conditions, params = [], []
+    if reseller_id:
+        params.append(reseller_id)
+        conditions.append(f"ci.reseller_id=${len(params)}")
+    if user_id:
+        params.append(user_id)
+        conditions.append(f"ci.user_id=${len(params)}")
+    if status:
+        params.append(status)
+        conditions.append(f"ci.status=${len(params)}")
+    if period:
+        _period_filter("ci.period_start", period, conditions, params)
+
+    return await _keyset_list(
+        "SELECT ci.*, r.name AS reseller_name FROM customer_invoices ci JOIN resellers r ON ci.reseller_id=r.id",
+        "ci", conditions, params, paging, fmt,
     )
-    return {"data": rows, "total": len(rows)}
 
 
 @router.get("/reseller-invoices")
-async def list_reseller_invoices(admin=Depends(admin_basic_auth)):
-    rows = await fetch_all(
-        "SELECT i.*, r.name AS reseller_name FROM invoices i JOIN resellers r ON i.reseller_id=r.id ORDER BY i.created_at DESC"
+async def list_reseller_invoices(
+    reseller_id: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    period: Optional[str] = Query(None, description="Format: YYYY-MM (period_start)"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    paging=Depends(cursor_pagination),
+    admin=Depends(admin_basic_auth),
+):
+    conditions, params = [], []
+    if reseller_id:
+        params.append(reseller_id)
+        conditions.append(f"i.reseller_id=${len(params)}")
+    if status:
+        params.append(status)
+        conditions.append(f"i.status=${len(params)}")
+    if period:
+        _period_filter("i.period_start", period, conditions, params)
+
+    return await _keyset_list(
+        "SELECT i.*, r.name AS reseller_name FROM invoices i JOIN resellers r ON i.reseller_id=r.id",
+        "i", conditions, params, paging, fmt,
     )
-    return {"data": rows, "total": len(rows)}
 
 
 @router.post("/reseller-invoices/generate")
@@ -139,13 +273,17 @@ async def mark_reseller_invoice_paid(invoice_id: str, admin=Depends(admin_basic_
     if invoice["status"] == "paid":
         raise HTTPException(status_code=400, detail="Invoice already paid")
 
+    # reseller sudah dihapus → 404 sebelum invoice diubah
+    reseller_data = await get_reseller_context(invoice["reseller_id"]) if invoice["reseller_id"] else None
+    if not reseller_data:
+        raise HTTPException(status_code=404, detail="Reseller not found")
+
     paid_at = now_tz()
     await execute(
         "UPDATE invoices SET status='paid', updated_at=$1, meta = jsonb_set(coalesce(meta,'{}'::jsonb),'{$.paid_at}',$2::jsonb,true) WHERE id=$3",
         (paid_at, json.dumps(paid_at.isoformat()), invoice_id),
     )
 
-    reseller_data = await fetch_one("SELECT phone FROM resellers WHERE id=$1", (invoice["reseller_id"],))
     await send_wa_message(
         phone=reseller_data["phone"],
         text=f"Pembayaran invoice reseller {invoice_id} berhasil. Terima kasih."
@@ -165,11 +303,111 @@ async def mark_reseller_invoice_paid(invoice_id: str, admin=Depends(admin_basic_
 # Payments
 # ---------------------------
 @router.get("/payments")
-async def list_all_payments(admin=Depends(admin_basic_auth)):
+async def list_all_payments(
+    reseller_id: Optional[str] = Query(None),
+    method: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    period: Optional[str] = Query(None, description="Format: YYYY-MM (created_at)"),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    paging=Depends(cursor_pagination),
+    admin=Depends(admin_basic_auth),
+):
+    conditions, params = [], []
+    if reseller_id:
+        params.append(reseller_id)
+        conditions.append(f"ci.reseller_id=${len(params)}")
+    if method:
+        params.append(method)
+        conditions.append(f"p.method=${len(params)}")
+    if status:
+        params.append(status)
+        conditions.append(f"p.status=${len(params)}")
+    if period:
+        _period_filter("p.created_at", period, conditions, params, timestamp=True)
+
+    return await _keyset_list(
+        "SELECT p.*, ci.reseller_id, r.name AS reseller_name FROM payments p JOIN customer_invoices ci ON p.invoice_id=ci.id JOIN resellers r ON ci.reseller_id=r.id",
+        "p", conditions, params, paging, fmt,
+    )
+
+
+# ---------------------------
+# Reconciliation (settlement provider vs payments)
+# ---------------------------
+@router.post("/reconciliations")
+async def create_reconciliation(
+    request: Request,
+    date_from: date = Query(..., description="Awal window settlement (YYYY-MM-DD)"),
+    date_to: date = Query(..., description="Akhir window settlement (YYYY-MM-DD)"),
+    method: Optional[str] = Query("duitku", description="Filter payments.method"),
+    txn_column: str = Query("reference", description="Kolom CSV untuk provider_txn_id"),
+    amount_column: str = Query("amount", description="Kolom CSV untuk nominal"),
+    admin=Depends(admin_basic_auth),
+):
+    """
+    Body request = isi file CSV settlement (Content-Type: text/csv), dibaca streaming.
+    """
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to harus >= date_from")
+    try:
+        return await reconcile_settlement(
+            iter_text_lines(request.stream()),
+            window_start=date_from,
+            window_end=date_to,
+            source="upload",
+            method=method,
+            txn_column=txn_column,
+            amount_column=amount_column,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/reconciliations")
+async def list_reconciliations(admin=Depends(admin_basic_auth), paging=Depends(pagination)):
     rows = await fetch_all(
-        "SELECT p.*, ci.reseller_id, r.name AS reseller_name FROM payments p JOIN customer_invoices ci ON p.invoice_id=ci.id JOIN resellers r ON ci.reseller_id=r.id ORDER BY p.created_at DESC"
+        f"SELECT * FROM reconciliation_runs ORDER BY id DESC OFFSET {paging['offset']} LIMIT {paging['limit']}"
     )
-    return {"data": rows, "total": len(rows)}
+    total = await fetch_one("SELECT COUNT(*) AS count FROM reconciliation_runs")
+    return response_list(rows, paging["page"], paging["per_page"], total["count"])
+
+
+@router.get("/reconciliations/{run_id}")
+async def get_reconciliation(run_id: int, admin=Depends(admin_basic_auth)):
+    row = await fetch_one("SELECT * FROM reconciliation_runs WHERE id=$1", (run_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Reconciliation run not found")
+    return row
+
+
+@router.get("/reconciliations/{run_id}/mismatches")
+async def list_reconciliation_mismatches(
+    run_id: int,
+    kind: Optional[str] = Query(None),
+    admin=Depends(admin_basic_auth),
+    paging=Depends(pagination),
+):
+    conditions = ["run_id=$1"]
+    params = [run_id]
+    if kind:
+        conditions.append("kind=$2")
+        params.append(kind)
+    where_clause = " AND ".join(conditions)
+
+    rows = await fetch_all(
+        f"""
+        SELECT * FROM reconciliation_mismatches
+        WHERE {where_clause}
+        ORDER BY id
+        OFFSET {paging['offset']} LIMIT {paging['limit']}
+        """,
+        tuple(params),
+    )
+    total = await fetch_one(
+        f"SELECT COUNT(*) AS count FROM reconciliation_mismatches WHERE {where_clause}",
+        tuple(params),
+    )
+    return response_list(rows, paging["page"], paging["per_page"], total["count"])
 
 
 # ---------------------------
@@ -177,16 +415,29 @@ async def list_all_payments(admin=Depends(admin_basic_auth)):
 # ---------------------------
 @router.get("/reports/resellers/summary")
 async def summary_resellers(admin=Depends(admin_basic_auth)):
+    # agregat per reseller dihitung terpisah (users dari ppp_users, invoice dari rollup)
+    # lalu di-join 1:1, tanpa fan-out users × invoices
     rows = await fetch_all(
         """
         SELECT r.id, r.name,
-            COUNT(u.id) FILTER (WHERE u.deleted_at IS NULL) AS users_count,
-            COUNT(ci.id) FILTER (WHERE ci.status='paid') AS invoices_paid,
-            COALESCE(SUM(ci.amount) FILTER (WHERE ci.status='paid'),0) AS total_revenue
+            COALESCE(u.users_count, 0) AS users_count,
+            COALESCE(ci.invoices_paid, 0) AS invoices_paid,
+            COALESCE(ci.total_revenue, 0) AS total_revenue
         FROM resellers r
-        LEFT JOIN ppp_users u ON u.reseller_id=r.id
-        LEFT JOIN customer_invoices ci ON ci.reseller_id=r.id
-        GROUP BY r.id, r.name
+        LEFT JOIN (
+            SELECT reseller_id, COUNT(*) AS users_count
+            FROM ppp_users
+            WHERE deleted_at IS NULL
+            GROUP BY reseller_id
+        ) u ON u.reseller_id=r.id
+        LEFT JOIN (
+            SELECT reseller_id,
+                SUM(invoice_count)::bigint AS invoices_paid,
+                SUM(amount) AS total_revenue
+            FROM invoice_daily_rollup
+            WHERE status='paid'
+            GROUP BY reseller_id
+        ) ci ON ci.reseller_id=r.id
         ORDER BY r.name
         """
     )
@@ -198,24 +449,81 @@ async def finance_summary(
     period: Optional[str] = Query(None, description="Format: YYYY-MM"),
     admin=Depends(admin_basic_auth),
 ):
-    params = []
-    where_period = ""
+    # dibaca dari invoice_daily_rollup (dijaga trigger, lihat migrations/004)
+    conditions, params = [], []
     if period:
-        params.append(period)
-        where_period = "WHERE to_char(ci.period_start,'YYYY-MM')=$1"
+        _period_filter("day", period, conditions, params)
+    where_period = f"WHERE {conditions[0]}" if conditions else ""
 
     row = await fetch_one(
         f"""
         SELECT
-            COUNT(ci.id) FILTER (WHERE ci.status='paid') AS paid_invoices,
-            COUNT(ci.id) FILTER (WHERE ci.status!='paid') AS unpaid_invoices,
-            COALESCE(SUM(ci.amount) FILTER (WHERE ci.status='paid'),0) AS paid_amount,
-            COALESCE(SUM(ci.amount) FILTER (WHERE ci.status!='paid'),0) AS unpaid_amount,
-            COALESCE(SUM(p.amount) FILTER (WHERE p.status='success'),0) AS payments_total
-        FROM customer_invoices ci
-        LEFT JOIN payments p ON p.invoice_id=ci.id
+            COALESCE(SUM(invoice_count) FILTER (WHERE status='paid'),0)::bigint AS paid_invoices,
+            COALESCE(SUM(invoice_count) FILTER (WHERE status NOT IN ('paid','')),0)::bigint AS unpaid_invoices,
+            COALESCE(SUM(amount) FILTER (WHERE status='paid'),0) AS paid_amount,
+            COALESCE(SUM(amount) FILTER (WHERE status NOT IN ('paid','')),0) AS unpaid_amount,
+            COALESCE(SUM(payments_amount),0) AS payments_total
+        FROM invoice_daily_rollup
         {where_period}
         """,
         tuple(params),
     )
     return row
+
+
+@router.get("/reports/timeseries")
+async def admin_timeseries(
+    months: int = Query(12, ge=1, le=60, description="Jumlah bulan terakhir (termasuk bulan ini)"),
+    reseller_id: Optional[str] = Query(None, description="Kosong = semua reseller"),
+    admin=Depends(admin_basic_auth),
+):
+    return {"months": months, "buckets": await build_timeseries(reseller_id, months)}
+
+
+# ---------------------------
+# Report jobs (report berat dihitung worker, API hanya submit & poll)
+# ---------------------------
+@router.post("/report-jobs", status_code=202)
+async def create_report_job(payload: dict, admin=Depends(admin_basic_auth)):
+    """
+    Body: {"kind": "finance_by_reseller", "params": {"period_from": "2025-01", "period_to": "2025-12"}}
+    atau  {"kind": "usage_by_user", "params": {"date_from": "2025-01-01", "date_to": "2025-01-31", "reseller_id": "..."}}
+    """
+    kind = payload.get("kind")
+    try:
+        params = validate_report_spec(kind, payload.get("params") or {})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    row = await fetch_one(
+        "INSERT INTO report_jobs (kind, params) VALUES ($1, $2::jsonb) RETURNING id, kind, status, created_at",
+        (kind, json.dumps(params)),
+    )
+    return row
+
+
+@router.get("/report-jobs")
+async def list_report_jobs(admin=Depends(admin_basic_auth), paging=Depends(pagination)):
+    rows = await fetch_all(
+        f"""
+        SELECT id, kind, params, status, attempts, error, created_at, started_at, finished_at
+        FROM report_jobs
+        ORDER BY id DESC
+        OFFSET {paging['offset']} LIMIT {paging['limit']}
+        """
+    )
+    for r in rows:
+        r["params"] = json.loads(r["params"])
+    total = await fetch_one("SELECT COUNT(*) AS count FROM report_jobs")
+    return response_list(rows, paging["page"], paging["per_page"], total["count"])
+
+
+@router.get("/report-jobs/{job_id}")
+async def get_report_job(job_id: int, admin=Depends(admin_basic_auth)):
+    row = await fetch_one("SELECT * FROM report_jobs WHERE id=$1", (job_id,))
+    if not row:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    row["params"] = json.loads(row["params"])
+    if row["result"] is not None:
+        row["result"] = json.loads(row["result"])
+    return row
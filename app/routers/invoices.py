@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any
 from datetime import date, timedelta, datetime
 from decimal import Decimal
 import json
 
-from app.db import fetch_one, fetch_all, execute
-from app.deps import auth_reseller_jwt, pagination
-from app.utils import new_uuid, now_tz, response_list, send_wa_message
+from app.db import fetch_one, fetch_all, execute, stream_rows
+from app.deps import auth_reseller_jwt, reseller_context, pagination
+from app.billing import settle_customer_invoice
+from app.cache import invalidate_reseller_reports, get_resource_version, resource_versions
+from app.routers.profiles import get_catalog_profile
+from app.utils import new_uuid, now_tz, period_range, response_list, send_wa_message, stream_csv
+from app.responses import trusted_response, make_etag, etag_matches, not_modified
 
 router = APIRouter()
 
@@ -61,10 +66,7 @@ async def create_customer_invoice(data: CustomerInvoiceCreate, reseller=Depends(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    profile = await fetch_one(
-        "SELECT id, name, price FROM ppp_profiles WHERE id=$1",
-        (user["profile_id"],),
-    )
+    profile = await get_catalog_profile(reseller["reseller_id"], user["profile_id"])
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
 
@@ -112,6 +114,8 @@ async def create_customer_invoice(data: CustomerInvoiceCreate, reseller=Depends(
         ),
     )
 
+    await invalidate_reseller_reports(reseller["reseller_id"])
+
     await send_wa_message(
         phone=user.get("phone"),
         text=f"Tagihan baru {data.months} bulan paket {profile['name']} total {amount} jatuh tempo {period_end}."
@@ -120,19 +124,15 @@ async def create_customer_invoice(data: CustomerInvoiceCreate, reseller=Depends(
     row = await fetch_one("SELECT * FROM customer_invoices WHERE id=$1", (invoice_id,))
     return row
 
-from fastapi import Query
-
-@router.get("/invoices", response_model=Dict[str, Any])
-async def list_customer_invoices(
-    reseller=Depends(auth_reseller_jwt),
-    paging=Depends(pagination),
-    user_id: Optional[str] = None,
-    status: Optional[str] = None,
-    period: Optional[str] = None,  # format YYYY-MM
-    search: Optional[str] = Query(None, description="Cari berdasarkan full_name"),
+def _customer_invoice_filters(
+    reseller_id: str,
+    user_id: Optional[str],
+    status: Optional[str],
+    period: Optional[str],
+    search: Optional[str],
 ):
     conditions = ["ci.reseller_id=$1"]
-    params = [reseller["reseller_id"]]
+    params = [reseller_id]
     idx = 2
 
     if user_id:
@@ -146,16 +146,34 @@ async def list_customer_invoices(
         idx += 1
 
     if period:
-        conditions.append(f"to_char(ci.period_start, 'YYYY-MM')=${idx}")
-        params.append(period)
-        idx += 1
+        try:
+            start, end = period_range(period)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="period harus format YYYY-MM")
+        conditions.append(f"ci.period_start >= ${idx} AND ci.period_start < ${idx+1}")
+        params.extend([start, end])
+        idx += 2
 
     if search:
         conditions.append(f"u.full_name ILIKE ${idx}")
         params.append(f"%{search}%")
         idx += 1
 
-    where_clause = " AND ".join(conditions)
+    return " AND ".join(conditions), params
+
+
+@router.get("/invoices", response_model=Dict[str, Any])
+async def list_customer_invoices(
+    reseller=Depends(auth_reseller_jwt),
+    paging=Depends(pagination),
+    user_id: Optional[str] = None,
+    status: Optional[str] = None,
+    period: Optional[str] = None,  # format YYYY-MM
+    search: Optional[str] = Query(None, description="Cari berdasarkan full_name"),
+):
+    where_clause, params = _customer_invoice_filters(
+        reseller["reseller_id"], user_id, status, period, search
+    )
 
     query = f"""
         SELECT 
@@ -179,59 +197,97 @@ async def list_customer_invoices(
         tuple(params),
     )
 
-    return response_list(rows, paging["page"], paging["per_page"], total["count"])
+    return trusted_response(response_list(rows, paging["page"], paging["per_page"], total["count"]))
+
+
+CUSTOMER_INVOICE_EXPORT_COLUMNS = [
+    "id", "user_id", "username", "full_name", "profile_id", "profile_name",
+    "period_start", "period_end", "amount", "status", "paid_at", "created_at",
+]
+
+
+@router.get("/invoices/export")
+async def export_customer_invoices(
+    reseller=Depends(auth_reseller_jwt),
+    user_id: Optional[str] = None,
+    status: Optional[str] = None,
+    period: Optional[str] = None,  # format YYYY-MM
+    search: Optional[str] = Query(None, description="Cari berdasarkan full_name"),
+):
+    """
+    Export CSV invoice customer (filter sama dengan GET /invoices), di-stream
+    dari server-side cursor sehingga memory tetap konstan berapapun jumlah row.
+    """
+    where_clause, params = _customer_invoice_filters(
+        reseller["reseller_id"], user_id, status, period, search
+    )
+
+    query = f"""
+        SELECT 
+            ci.id, ci.user_id, u.username, u.full_name, ci.profile_id,
+            ci.meta->>'profile_name' AS profile_name,
+            ci.period_start, ci.period_end, ci.amount, ci.status, ci.paid_at, ci.created_at
+        FROM customer_invoices ci
+        JOIN ppp_users u ON ci.user_id = u.id
+        WHERE {where_clause}
+        ORDER BY ci.created_at DESC
+    """
+
+    filename = f"invoices_{period or now_tz().strftime('%Y-%m-%d')}.csv"
+    return StreamingResponse(
+        stream_csv(stream_rows(query, tuple(params)), CUSTOMER_INVOICE_EXPORT_COLUMNS),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.get("/invoices/{invoice_id}", response_model=CustomerInvoiceOut)
-async def get_customer_invoice(invoice_id: str, reseller=Depends(auth_reseller_jwt)):
+async def get_customer_invoice(invoice_id: str, request: Request, reseller=Depends(auth_reseller_jwt)):
+    # ETag dari updated_at; klien yang kirim If-None-Match dicek dulu tanpa ambil row penuh
+    if request.headers.get("if-none-match"):
+        current = await fetch_one(
+            "SELECT id, updated_at FROM customer_invoices WHERE id=$1 AND reseller_id=$2",
+            (invoice_id, reseller["reseller_id"]),
+        )
+        if current:
+            etag = make_etag("customer_invoice", current["id"], current["updated_at"])
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
     row = await fetch_one(
         "SELECT * FROM customer_invoices WHERE id=$1 AND reseller_id=$2",
         (invoice_id, reseller["reseller_id"]),
     )
     if not row:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    return row
+    return trusted_response(
+        row, CustomerInvoiceOut,
+        headers={"ETag": make_etag("customer_invoice", row["id"], row["updated_at"])},
+    )
 
 @router.put("/invoices/{invoice_id}/pay", response_model=CustomerInvoiceOut)
 async def pay_customer_invoice(invoice_id: str, reseller=Depends(auth_reseller_jwt)):
-    invoice = await fetch_one(
-        "SELECT * FROM customer_invoices WHERE id=$1 AND reseller_id=$2",
-        (invoice_id, reseller["reseller_id"]),
+    # invoice paid + extend active_until + insert payment dalam satu statement
+    result = await settle_customer_invoice(
+        invoice_id,
+        method="manual",
+        reseller_id=reseller["reseller_id"],
+        record_if_paid=False,
     )
-    if not invoice:
+    if not result:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    if invoice["status"] == "paid":
+    if result["invoice"] is None:
         raise HTTPException(status_code=400, detail="Invoice already paid")
 
-    paid_at = now_tz()
-    await execute(
-        "UPDATE customer_invoices SET status='paid', paid_at=$1, updated_at=$2 WHERE id=$3",
-        (paid_at, now_tz(), invoice_id),
-    )
-
-    # extend active_until user
-    user = await fetch_one("SELECT id, active_until, phone FROM ppp_users WHERE id=$1", (invoice["user_id"],))
-    current_until = user["active_until"] or invoice["period_start"]
-    new_until = current_until + (invoice["period_end"] - invoice["period_start"]) + timedelta(days=1)
-    await execute("UPDATE ppp_users SET active_until=$1 WHERE id=$2", (new_until, user["id"]))
-
-    # insert ke payments
-    await execute(
-        """
-        INSERT INTO payments (invoice_id, amount, method, status, paid_at, created_at)
-        VALUES ($1,$2,'manual','success',$3,$4)
-        """,
-        (invoice_id, invoice["amount"], paid_at, now_tz()),
-    )
-
-    await send_wa_message(
-        phone=user["phone"],
-        text=f"Pembayaran invoice {invoice_id} berhasil. Layanan aktif sampai {new_until}."
-    )
+    user = result["user"]
+    if user:
+        await send_wa_message(
+            phone=user["phone"],
+            text=f"Pembayaran invoice {invoice_id} berhasil. Layanan aktif sampai {user['active_until']}."
+        )
 
-    row = await fetch_one("SELECT * FROM customer_invoices WHERE id=$1", (invoice_id,))
-    return row
+    return result["invoice"]
 
 
 @router.get("/invoices/{invoice_id}/print")
@@ -254,6 +310,7 @@ async def print_customer_invoice(invoice_id: str, reseller=Depends(auth_reseller
 
 @router.get("/reseller-invoices/me", response_model=Dict[str, Any])
 async def list_my_reseller_invoices(
+    request: Request,
     reseller=Depends(auth_reseller_jwt),
     paging=Depends(pagination),
     status: Optional[str] = Query(None, description="Filter status invoice (paid/unpaid/draft)"),
@@ -263,7 +320,13 @@ async def list_my_reseller_invoices(
     """
     🔹 Ambil daftar invoice milik reseller yang sedang login.
     Mirip list_reseller_invoices tapi otomatis pakai reseller_id dari token.
+    ETag dari versi reseller_invoices (dinaikkan trigger) + query string.
     """
+    version = await get_resource_version(reseller["reseller_id"], "reseller_invoices")
+    etag = make_etag("reseller_invoices", reseller["reseller_id"], version, request.url.query)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     conditions = ["reseller_id=$1"]
     params = [reseller["reseller_id"]]
     idx = 2
@@ -302,7 +365,10 @@ async def list_my_reseller_invoices(
         tuple(params),
     )
 
-    return response_list(rows, paging["page"], paging["per_page"], total["count"])
+    return trusted_response(
+        response_list(rows, paging["page"], paging["per_page"], total["count"]),
+        headers={"ETag": etag},
+    )
 
 
 @router.get("/reseller-invoices", response_model=Dict[str, Any])
@@ -324,7 +390,6 @@ async def list_reseller_invoices(
         idx += 1
 
     if year and month:
-        from datetime import date, timedelta
         period_start = date(year, month, 1)
         if month == 12:
             period_end = date(year, 12, 31)
@@ -350,7 +415,7 @@ async def list_reseller_invoices(
         tuple(params),
     )
 
-    return response_list(rows, paging["page"], paging["per_page"], total["count"])
+    return trusted_response(response_list(rows, paging["page"], paging["per_page"], total["count"]))
 
 @router.get("/reseller-invoices/{invoice_id}", response_model=ResellerInvoiceOut)
 async def get_reseller_invoice(invoice_id: str, reseller=Depends(auth_reseller_jwt)):
@@ -371,6 +436,7 @@ async def get_reseller_invoice(invoice_id: str, reseller=Depends(auth_reseller_j
 @router.post("/reseller-invoices/generate", response_model=ResellerInvoiceOut)
 async def generate_reseller_invoice(
     reseller=Depends(auth_reseller_jwt),
+    reseller_data=Depends(reseller_context),
     year: Optional[int] = Query(None, description="Tahun periode (YYYY)"),
     month: Optional[int] = Query(None, description="Bulan periode (1-12)")
 ):
@@ -407,11 +473,6 @@ async def generate_reseller_invoice(
         (reseller["reseller_id"],),
     )
 
-    reseller_data = await fetch_one(
-        "SELECT name, company_name, phone, price_per_user, currency FROM resellers WHERE id=$1",
-        (reseller["reseller_id"],),
-    )
-
     unit_price = reseller_data["price_per_user"]
     subtotal = unit_price * users_count["count"]
     total = subtotal
@@ -446,6 +507,8 @@ async def generate_reseller_invoice(
         ),
     )
 
+    resource_versions.invalidate_local(reseller["reseller_id"])
+
     await send_wa_message(
         phone=reseller_data["phone"],
         text=f"Invoice reseller periode {period_start} - {period_end} total {total}, due date {period_end.replace(day=20)}."
@@ -458,7 +521,11 @@ async def generate_reseller_invoice(
 
 
 @router.put("/reseller-invoices/{invoice_id}/pay", response_model=ResellerInvoiceOut)
-async def pay_reseller_invoice(invoice_id: str, reseller=Depends(auth_reseller_jwt)):
+async def pay_reseller_invoice(
+    invoice_id: str,
+    reseller=Depends(auth_reseller_jwt),
+    reseller_data=Depends(reseller_context),
+):
     invoice = await fetch_one(
         "SELECT * FROM invoices WHERE id=$1 AND reseller_id=$2",
         (invoice_id, reseller["reseller_id"]),
@@ -474,8 +541,8 @@ async def pay_reseller_invoice(invoice_id: str, reseller=Depends(auth_reseller_j
         "UPDATE invoices SET status='paid', updated_at=$1, meta = jsonb_set(coalesce(meta,'{}'::jsonb),'{$.paid_at}',$2::jsonb,true) WHERE id=$3",
         (paid_at, json.dumps(paid_at.isoformat()), invoice_id),
     )
+    resource_versions.invalidate_local(reseller["reseller_id"])
 
-    reseller_data = await fetch_one("SELECT phone FROM resellers WHERE id=$1", (reseller["reseller_id"],))
     await send_wa_message(
         phone=reseller_data["phone"],
         text=f"Pembayaran invoice reseller {invoice_id} berhasil. Terima kasih."
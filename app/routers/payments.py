@@ -1,11 +1,15 @@
 # app/routers/payments.py
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional
-from app.db import fetch_all, fetch_one, execute
-from app.deps import auth_reseller_jwt
-from app.utils import now_tz, send_wa_message
+from app.db import fetch_all, fetch_one, execute, stream_rows, duitku_log_writer
+from app.deps import auth_reseller_jwt, cursor_pagination
+from app.billing import settle_customer_invoice, parse_payment_callback, apply_payment_callback
+from app.utils import (
+    now_tz, send_wa_message, stream_csv, encode_cursor, cursor_keyset, response_cursor, period_range, start_of_day_tz,
+)
 from app.config import get_settings
-import hashlib, json
+import asyncio, hashlib, json
 
 router = APIRouter(tags=["Payments"])
 
@@ -13,20 +17,16 @@ settings = get_settings()
 DUITKU_MERCHANT_CODE = settings.DUITKU_MERCHANT_CODE
 DUITKU_API_KEY = settings.DUITKU_API_KEY
 
-# ---------------------------
-# GET /payments
-# ---------------------------
-@router.get("/payments")
-async def list_payments(
-    invoice_id: Optional[str] = Query(None),
-    method: Optional[str] = Query(None),
-    status: Optional[str] = Query(None),
-    period: Optional[str] = Query(None),  # YYYY-MM
-    search: Optional[str] = Query(None, description="Cari berdasarkan full_name user"),
-    reseller=Depends(auth_reseller_jwt),
+def _payment_filters(
+    reseller_id: str,
+    invoice_id: Optional[str],
+    method: Optional[str],
+    status: Optional[str],
+    period: Optional[str],
+    search: Optional[str],
 ):
     conditions = ["ci.reseller_id=$1"]
-    params = [reseller["reseller_id"]]
+    params = [reseller_id]
     idx = 2
 
     if invoice_id:
@@ -42,20 +42,133 @@ async def list_payments(
         params.append(status)
         idx += 1
     if period:
-        conditions.append(f"to_char(p.created_at, 'YYYY-MM')=${idx}")
-        params.append(period)
-        idx += 1
+        try:
+            start, end = period_range(period)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="period harus format YYYY-MM")
+        conditions.append(f"p.created_at >= ${idx} AND p.created_at < ${idx+1}")
+        params.extend([start_of_day_tz(start), start_of_day_tz(end)])
+        idx += 2
     if search:
         conditions.append(f"u.full_name ILIKE ${idx}")
         params.append(f"%{search}%")
         idx += 1
 
-    where_clause = " AND ".join(conditions)
+    return " AND ".join(conditions), params
 
-    sql = f"""
+
+# ---------------------------
+# GET /payments
+# ---------------------------
+@router.get("/payments")
+async def list_payments(
+    invoice_id: Optional[str] = Query(None),
+    method: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    period: Optional[str] = Query(None),  # YYYY-MM
+    search: Optional[str] = Query(None, description="Cari berdasarkan full_name user"),
+    paging=Depends(cursor_pagination),
+    reseller=Depends(auth_reseller_jwt),
+):
+    """
+    Cursor pagination (created_at, id). Halaman pertama (tanpa cursor) juga
+    membawa summary: total count/amount + breakdown per status dan per method
+    untuk seluruh row yang cocok filter.
+    """
+    where_clause, params = _payment_filters(
+        reseller["reseller_id"], invoice_id, method, status, period, search
+    )
+    from_clause = f"""
+        FROM payments p
+        JOIN customer_invoices ci ON p.invoice_id = ci.id
+        JOIN ppp_users u ON ci.user_id = u.id
+        WHERE {where_clause}
+    """
+
+    page_where, page_params = "", list(params)
+    after_cursor, order = cursor_keyset("p", len(page_params) + 1)
+    if paging["cursor"]:
+        created_at, row_id = paging["cursor"]
+        page_where = f"AND {after_cursor}"
+        page_params.extend([created_at, row_id])
+
+    page_query = fetch_all(
+        f"""
         SELECT 
             p.*, 
             u.full_name
+        {from_clause} {page_where}
+        {order}
+        LIMIT {paging['limit'] + 1}
+        """,
+        tuple(page_params),
+    )
+
+    if paging["cursor"]:
+        rows, summary = await page_query, None
+    else:
+        rows, groups = await asyncio.gather(
+            page_query,
+            fetch_all(
+                f"""
+                SELECT
+                    p.status, p.method,
+                    GROUPING(p.status) AS g_status, GROUPING(p.method) AS g_method,
+                    COUNT(*) AS count, COALESCE(SUM(p.amount), 0) AS total
+                {from_clause}
+                GROUP BY GROUPING SETS ((p.status), (p.method), ())
+                """,
+                tuple(params),
+            ),
+        )
+        summary = {"count": 0, "total_amount": 0, "by_status": [], "by_method": []}
+        for g in groups:
+            if g["g_status"] and g["g_method"]:
+                summary["count"] = g["count"]
+                summary["total_amount"] = g["total"]
+            elif g["g_method"]:
+                summary["by_status"].append({"status": g["status"], "count": g["count"], "total": g["total"]})
+            else:
+                summary["by_method"].append({"method": g["method"], "count": g["count"], "total": g["total"]})
+
+    next_cursor = None
+    if len(rows) > paging["limit"]:
+        rows = rows[: paging["limit"]]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    result = response_cursor(rows, paging["limit"], next_cursor)
+    if summary is not None:
+        result["total"] = summary["count"]
+        result["summary"] = summary
+    return result
+
+
+# ---------------------------
+# GET /payments/export (CSV streaming)
+# ---------------------------
+PAYMENT_EXPORT_COLUMNS = [
+    "id", "invoice_id", "username", "full_name", "amount", "method",
+    "provider_txn_id", "status", "paid_at", "created_at",
+]
+
+
+@router.get("/payments/export")
+async def export_payments(
+    invoice_id: Optional[str] = Query(None),
+    method: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    period: Optional[str] = Query(None),  # YYYY-MM
+    search: Optional[str] = Query(None, description="Cari berdasarkan full_name user"),
+    reseller=Depends(auth_reseller_jwt),
+):
+    where_clause, params = _payment_filters(
+        reseller["reseller_id"], invoice_id, method, status, period, search
+    )
+
+    sql = f"""
+        SELECT 
+            p.id, p.invoice_id, u.username, u.full_name, p.amount, p.method,
+            p.provider_txn_id, p.status, p.paid_at, p.created_at
         FROM payments p
         JOIN customer_invoices ci ON p.invoice_id = ci.id
         JOIN ppp_users u ON ci.user_id = u.id
@@ -63,8 +176,12 @@ async def list_payments(
         ORDER BY p.created_at DESC
     """
 
-    rows = await fetch_all(sql, tuple(params))
-    return {"data": rows, "total": len(rows)}
+    filename = f"payments_{period or now_tz().strftime('%Y-%m-%d')}.csv"
+    return StreamingResponse(
+        stream_csv(stream_rows(sql, tuple(params)), PAYMENT_EXPORT_COLUMNS),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 
@@ -103,40 +220,28 @@ async def create_payment(payload: dict, reseller=Depends(auth_reseller_jwt)):
     status = payload.get("status", "success")
     paid_at = payload.get("paid_at") or now_tz()
 
-    invoice = await fetch_one(
-        "SELECT * FROM customer_invoices WHERE id=$1 AND reseller_id=$2",
-        (invoice_id, reseller["reseller_id"]),
+    # insert payment + (kalau success) invoice paid & extend active_until, satu statement
+    result = await settle_customer_invoice(
+        invoice_id,
+        method=method,
+        status=status,
+        amount=amount,
+        provider_txn_id=provider_txn_id,
+        reseller_id=reseller["reseller_id"],
+        paid_at=paid_at,
     )
-    if not invoice:
+    if not result:
         raise HTTPException(status_code=404, detail="Invoice not found")
 
-    # insert payment
-    await execute(
-        """
-        INSERT INTO payments (invoice_id, amount, method, provider_txn_id, status, paid_at, created_at)
-        VALUES ($1,$2,$3,$4,$5,$6,$7)
-        """,
-        (invoice_id, amount, method, provider_txn_id, status, now_tz(), now_tz()),
-    )
-
-    # update invoice + kirim WA
-    if status == "success":
-        await execute(
-            "UPDATE customer_invoices SET status='paid', paid_at=$1, updated_at=$2 WHERE id=$3",
-            (paid_at, now_tz(), invoice_id),
+    # kirim WA hanya kalau invoice benar-benar baru di-settle
+    user = result["user"]
+    if user:
+        await send_wa_message(
+            phone=user["phone"],
+            text=f"Pembayaran invoice {invoice_id} berhasil. Terima kasih {user['username']}!"
         )
-        user = await fetch_one(
-            "SELECT u.phone, u.username, u.active_until FROM ppp_users u WHERE u.id=$1",
-            (invoice["user_id"],),
-        )
-        if user:
-            await send_wa_message(
-                phone=user["phone"],
-                text=f"Pembayaran invoice {invoice_id} berhasil. Terima kasih {user['username']}!"
-            )
 
-    row = await fetch_one("SELECT * FROM payments WHERE invoice_id=$1 ORDER BY id DESC LIMIT 1", (invoice_id,))
-    return row
+    return result["payment"]
 
 
 # ---------------------------
@@ -146,13 +251,6 @@ async def create_payment(payload: dict, reseller=Depends(auth_reseller_jwt)):
 async def payment_webhook(request: Request):
     payload = await request.json()
 
-    provider = "unknown"
-    txn_id = None
-    invoice_id = None
-    amount = None
-    status = "pending"
-    paid_at = now_tz()
-
     # ==========================================
     # 1️⃣ CALLBACK DUITKU
     # ==========================================
@@ -166,102 +264,54 @@ async def payment_webhook(request: Request):
         # Buat signature check
         raw_signature = f"{DUITKU_MERCHANT_CODE}{merchant_order_id}{amount}{DUITKU_API_KEY}"
         signature_check = hashlib.md5(raw_signature.encode()).hexdigest()
-
-        # Simpan ke log table dulu (selalu disimpan, meski signature invalid)
-        await execute(
-            """
-            INSERT INTO duitku_logs (merchant_order_id, amount, result_code, signature, payload, created_at)
-            VALUES ($1, $2, $3, $4, $5, $6)
-            """,
-            (
-                merchant_order_id,
-                float(amount),
-                result_code,
-                signature,
-                json.dumps(payload),
-                now_tz(),
-            ),
+        valid = signature.lower() == signature_check.lower()
+
+        # Simpan ke log table (selalu disimpan, meski signature invalid).
+        # Ditulis per batch oleh duitku_log_writer, tanpa round trip di sini.
+        duitku_log_writer.add(
+            merchant_order_id,
+            float(amount),
+            result_code,
+            signature,
+            json.dumps(payload),
+            now_tz(),
         )
 
+        if valid and settings.DUITKU_WEBHOOK_QUEUE:
+            # Mode ingest: masuk inbox lalu langsung balas SUCCESS.
+            # Proses settle dikerjakan worker (job_process_webhook_inbox).
+            callback = parse_payment_callback(payload)
+            await execute(
+                """
+                INSERT INTO payment_webhook_inbox (provider, provider_txn_id, invoice_id, payload, received_at)
+                VALUES ('duitku', $1, $2, $3::jsonb, $4)
+                """,
+                (callback["txn_id"], callback["invoice_id"], json.dumps(payload), now_tz()),
+            )
+            return {"status": "SUCCESS"}
+
         # Verifikasi signature
-        if signature.lower() != signature_check.lower():
+        if not valid:
             raise HTTPException(status_code=403, detail="Invalid signature")
 
-        # Mapping resultCode Duitku ke status lokal
-        if result_code == "00":
-            status = "success"
-        elif result_code in ("01", "02"):
-            status = "pending"
-        else:
-            status = "failed"
-
-        provider = "duitku"
-        txn_id = payload.get("reference") or payload.get("paymentCode") or merchant_order_id
-        invoice_id = merchant_order_id
-        paid_at = now_tz()
-
-    # ==========================================
-    # 2️⃣ CALLBACK FORMAT UMUM PROVIDER LAIN
-    # ==========================================
-    else:
-        provider = payload.get("provider", "unknown")
-        txn_id = payload.get("txn_id")
-        invoice_id = payload.get("invoice_id")
-        amount = payload.get("amount")
-        status = payload.get("status", "pending")
-        paid_at = payload.get("paid_at") or now_tz()
-
     # ==========================================
-    # 3️⃣ VALIDASI INVOICE
+    # 2️⃣ NORMALISASI (Duitku / format umum provider lain)
     # ==========================================
-    invoice = await fetch_one("SELECT * FROM customer_invoices WHERE id=$1", (invoice_id,))
-    if not invoice:
-        raise HTTPException(status_code=404, detail=f"Invoice not found: {invoice_id}")
+    callback = parse_payment_callback(payload)
 
     # ==========================================
-    # 4️⃣ INSERT / UPDATE PAYMENT
+    # 3️⃣ INSERT / UPDATE PAYMENT + UPDATE INVOICE + NOTIFIKASI
     # ==========================================
-    existing = await fetch_one("SELECT * FROM payments WHERE provider_txn_id=$1", (txn_id,))
-    if existing:
-        if existing["status"] != status:
-            await execute(
-                "UPDATE payments SET status=$1, paid_at=$2, updated_at=$3 WHERE id=$4",
-                (status, paid_at, now_tz(), existing["id"]),
-            )
-        payment_id = existing["id"]
-    else:
-        await execute(
-            """
-            INSERT INTO payments (invoice_id, amount, method, provider_txn_id, status, paid_at, created_at)
-            VALUES ($1,$2,$3,$4,$5,$6,$7)
-            """,
-            (invoice_id, amount, provider, txn_id, status, paid_at, now_tz()),
-        )
-        row = await fetch_one("SELECT id FROM payments WHERE provider_txn_id=$1", (txn_id,))
-        payment_id = row["id"]
+    result = await apply_payment_callback(callback)
+    if not result:
+        raise HTTPException(status_code=404, detail=f"Invoice not found: {callback['invoice_id']}")
 
-    # ==========================================
-    # 5️⃣ UPDATE INVOICE + NOTIFIKASI
-    # ==========================================
-    if status == "success":
-        await execute(
-            "UPDATE customer_invoices SET status='paid', paid_at=$1, updated_at=$2 WHERE id=$3",
-            (paid_at, now_tz(), invoice_id),
-        )
-        user = await fetch_one(
-            "SELECT u.phone, u.username FROM ppp_users u WHERE u.id=$1",
-            (invoice["user_id"],),
-        )
-        if user:
-            await send_wa_message(
-                phone=user["phone"],
-                text=f"✅ Pembayaran invoice {invoice_id} via {provider.upper()} berhasil. Terima kasih {user['username']}!"
-            )
+    payment_id = result["payment"]["id"] if result["payment"] else None
 
     # ==========================================
-    # 6️⃣ RESPONSE
+    # 4️⃣ RESPONSE
     # ==========================================
-    if provider == "duitku":
+    if callback["provider"] == "duitku":
         return {"status": "SUCCESS"}
 
-    return {"message": "Webhook processed", "payment_id": payment_id, "status": status}
+    return {"message": "Webhook processed", "payment_id": payment_id, "status": callback["status"]}
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 from decimal import Decimal
@@ -7,9 +7,47 @@ from datetime import datetime
 from app.db import fetch_one, fetch_all, execute
 from app.deps import auth_reseller_jwt, pagination
 from app.utils import new_uuid, now_tz, response_list
+from app.responses import trusted_response, make_etag, etag_matches, not_modified
+from app.cache import NamespacedTTLCache, invalidate_reseller_reports, get_resource_version, resource_versions
+from app.config import get_settings
+
+settings = get_settings()
 
 router = APIRouter()
 
+
+# -------- Profile catalog --------
+# Profile per reseller jarang berubah: dimuat sekali per process lalu dipakai
+# invoice creation & scheduler untuk harga/nama tanpa query. Diinvalidasi
+# endpoint create/update/delete di bawah (NOTIFY ke semua process).
+profile_catalog = NamespacedTTLCache("profile_catalog", ttl=settings.PROFILE_CATALOG_TTL)
+
+
+async def get_profile_catalog(reseller_id: Any) -> Dict[str, Dict[str, Any]]:
+    """profile_id → {id, reseller_id, name, price, is_active} milik reseller (read-only)."""
+    ns = str(reseller_id)
+
+    async def load():
+        rows = await fetch_all(
+            "SELECT id, reseller_id, name, price, is_active FROM ppp_profiles WHERE reseller_id=$1",
+            (ns,),
+        )
+        return {r["id"]: r for r in rows}
+
+    return await profile_catalog.get_or_load(ns, "catalog", load)
+
+
+async def get_catalog_profile(reseller_id: Any, profile_id: Any) -> Optional[Dict[str, Any]]:
+    if profile_id is None:
+        return None
+    return (await get_profile_catalog(reseller_id)).get(str(profile_id))
+
+
+async def invalidate_profile_catalog(reseller_id: Any) -> None:
+    await profile_catalog.invalidate(str(reseller_id))
+    # versi ETag /profiles dinaikkan trigger + NOTIFY; buang lokal dulu (read-your-writes)
+    resource_versions.invalidate_local(str(reseller_id))
+
 # -------- Schemas --------
 class ProfileBase(BaseModel):
     name: str
@@ -54,11 +92,18 @@ class ProfileOut(ProfileBase):
 
 @router.get("/profiles", response_model=Dict[str, Any])
 async def list_profiles(
+    request: Request,
     reseller=Depends(auth_reseller_jwt),
     paging=Depends(pagination),
     is_active: Optional[bool] = None,
     search: Optional[str] = None,
 ):
+    # ETag dari versi profiles reseller (dinaikkan trigger) + query string
+    version = await get_resource_version(reseller["reseller_id"], "profiles")
+    etag = make_etag("profiles", reseller["reseller_id"], version, request.url.query)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
     conditions = ["reseller_id=$1", "deleted_at IS NULL"]
     params = [reseller["reseller_id"]]
 
@@ -86,7 +131,10 @@ async def list_profiles(
         tuple(params),
     )
 
-    return response_list(rows, paging["page"], paging["per_page"], total["count"])
+    return trusted_response(
+        response_list(rows, paging["page"], paging["per_page"], total["count"]),
+        headers={"ETag": etag},
+    )
 
 
 @router.get("/profiles/{profile_id}", response_model=ProfileOut)
@@ -105,7 +153,7 @@ async def get_profile(profile_id: str, reseller=Depends(auth_reseller_jwt)):
     )
     if not row:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return row
+    return trusted_response(row, ProfileOut)
 
 
 @router.post("/profiles", response_model=ProfileOut)
@@ -154,6 +202,9 @@ async def create_profile(data: ProfileCreate, reseller=Depends(auth_reseller_jwt
         ),
     )
 
+    await invalidate_reseller_reports(reseller["reseller_id"])
+    await invalidate_profile_catalog(reseller["reseller_id"])
+
     row = await fetch_one(
         """
         SELECT id, reseller_id, name, price,
@@ -208,6 +259,9 @@ async def update_profile(
         ),
     )
 
+    await invalidate_reseller_reports(reseller["reseller_id"])
+    await invalidate_profile_catalog(reseller["reseller_id"])
+
     row = await fetch_one(
         """
         SELECT id, reseller_id, name, price,
@@ -230,4 +284,6 @@ async def delete_profile(profile_id: str, reseller=Depends(auth_reseller_jwt)):
         "DELETE FROM ppp_profiles WHERE id=$1 AND reseller_id=$2",
         (profile_id, reseller["reseller_id"]),
     )
+    await invalidate_reseller_reports(reseller["reseller_id"])
+    await invalidate_profile_catalog(reseller["reseller_id"])
     return {}
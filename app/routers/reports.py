@@ -1,18 +1,29 @@
 # app/routers/reports.py
-from fastapi import APIRouter, Depends, Query
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional, List, Dict, Any
+from datetime import date
+from decimal import Decimal
+import json
 from app.db import fetch_one, fetch_all
 from app.deps import auth_reseller_jwt
+from app.utils import period_range, now_tz, start_of_day_tz
+from app.cache import report_cache, closed_month_cache, closed_month_ns
+from app.config import get_settings
+
+settings = get_settings()
 
 router = APIRouter(tags=["Reports"])
 
+# Semua summary di-cache per reseller (report_cache, TTL REPORT_CACHE_TTL) dan
+# diinvalidasi oleh write path users/profiles/invoices/payments lewat NOTIFY.
+
 
 # ---------------------------
 # GET /reports/users/summary
 # ---------------------------
 @router.get("/reports/users/summary")
 async def users_summary(reseller=Depends(auth_reseller_jwt)):
-    row = await fetch_one(
+    row = await report_cache.get_or_load(reseller["reseller_id"], ("users",), lambda: fetch_one(
         """
         SELECT 
             COUNT(*) FILTER (WHERE status='active' AND deleted_at IS NULL) AS active,
@@ -22,10 +33,22 @@ async def users_summary(reseller=Depends(auth_reseller_jwt)):
         WHERE reseller_id=$1
         """,
         (reseller["reseller_id"],),
-    )
+    ))
     return row
 
 
+def _rollup_period(period: Optional[str], params: list) -> str:
+    """Filter day rollup untuk period YYYY-MM (kosong = semua periode)."""
+    if not period:
+        return ""
+    try:
+        start, end = period_range(period)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="period harus format YYYY-MM")
+    params.extend([start, end])
+    return f"AND day >= ${len(params)-1} AND day < ${len(params)}"
+
+
 # ---------------------------
 # GET /reports/invoices/summary
 # ---------------------------
@@ -34,24 +57,22 @@ async def invoices_summary(
     period: Optional[str] = Query(None, description="Format: YYYY-MM"),
     reseller=Depends(auth_reseller_jwt),
 ):
+    # dibaca dari invoice_daily_rollup (dijaga trigger), bukan scan customer_invoices
     params = [reseller["reseller_id"]]
-    where_period = ""
-    if period:
-        params.append(period)
-        where_period = "AND to_char(period_start,'YYYY-MM')=$2"
+    where_period = _rollup_period(period, params)
 
-    row = await fetch_one(
+    row = await report_cache.get_or_load(reseller["reseller_id"], ("invoices", period), lambda: fetch_one(
         f"""
         SELECT 
-            COUNT(*) FILTER (WHERE status='paid') AS paid_count,
+            COALESCE(SUM(invoice_count) FILTER (WHERE status='paid'),0)::bigint AS paid_count,
             COALESCE(SUM(amount) FILTER (WHERE status='paid'),0) AS paid_amount,
-            COUNT(*) FILTER (WHERE status!='paid') AS unpaid_count,
-            COALESCE(SUM(amount) FILTER (WHERE status!='paid'),0) AS unpaid_amount
-        FROM customer_invoices
+            COALESCE(SUM(invoice_count) FILTER (WHERE status NOT IN ('paid','')),0)::bigint AS unpaid_count,
+            COALESCE(SUM(amount) FILTER (WHERE status NOT IN ('paid','')),0) AS unpaid_amount
+        FROM invoice_daily_rollup
         WHERE reseller_id=$1 {where_period}
         """,
         tuple(params),
-    )
+    ))
     return row
 
 
@@ -63,22 +84,20 @@ async def payments_summary(
     period: Optional[str] = Query(None, description="Format: YYYY-MM"),
     reseller=Depends(auth_reseller_jwt),
 ):
+    # dibaca dari payment_daily_rollup (dijaga trigger), bukan join payments × invoices
     params = [reseller["reseller_id"]]
-    where_period = ""
-    if period:
-        params.append(period)
-        where_period = "AND to_char(p.created_at,'YYYY-MM')=$2"
+    where_period = _rollup_period(period, params)
 
-    rows = await fetch_all(
+    rows = await report_cache.get_or_load(reseller["reseller_id"], ("payments", period), lambda: fetch_all(
         f"""
-        SELECT p.method, COUNT(p.id) AS count, SUM(p.amount) AS total
-        FROM payments p
-        JOIN customer_invoices ci ON ci.id = p.invoice_id
-        WHERE ci.reseller_id=$1 {where_period}
-        GROUP BY p.method
+        SELECT NULLIF(method,'') AS method, SUM(payment_count)::bigint AS count, SUM(amount) AS total
+        FROM payment_daily_rollup
+        WHERE reseller_id=$1 {where_period}
+        GROUP BY method
+        HAVING SUM(payment_count) > 0
         """,
         tuple(params),
-    )
+    ))
 
     return {"methods": rows}
 
@@ -88,19 +107,244 @@ async def payments_summary(
 # ---------------------------
 @router.get("/reports/profiles/summary")
 async def profiles_summary(reseller=Depends(auth_reseller_jwt)):
-    rows = await fetch_all(
+    # agregat per profile dihitung dulu di subquery, baru di-join ke profiles
+    # (join langsung users × invoices menggandakan row dan menggelembungkan revenue)
+    rows = await report_cache.get_or_load(reseller["reseller_id"], ("profiles",), lambda: fetch_all(
         """
         SELECT 
             pr.id, pr.name, 
-            COUNT(u.id) FILTER (WHERE u.deleted_at IS NULL) AS users_count,
-            COALESCE(SUM(ci.amount) FILTER (WHERE ci.status='paid'),0) AS total_revenue
+            COALESCE(u.users_count, 0) AS users_count,
+            COALESCE(ci.total_revenue, 0) AS total_revenue
         FROM ppp_profiles pr
-        LEFT JOIN ppp_users u ON u.profile_id=pr.id AND u.reseller_id=pr.reseller_id
-        LEFT JOIN customer_invoices ci ON ci.profile_id=pr.id AND ci.reseller_id=pr.reseller_id
+        LEFT JOIN (
+            SELECT profile_id, COUNT(*) AS users_count
+            FROM ppp_users
+            WHERE reseller_id=$1 AND deleted_at IS NULL
+            GROUP BY profile_id
+        ) u ON u.profile_id=pr.id
+        LEFT JOIN (
+            SELECT profile_id, SUM(amount) AS total_revenue
+            FROM customer_invoices
+            WHERE reseller_id=$1 AND status='paid'
+            GROUP BY profile_id
+        ) ci ON ci.profile_id=pr.id
         WHERE pr.reseller_id=$1 AND pr.deleted_at IS NULL
-        GROUP BY pr.id, pr.name
         ORDER BY pr.name
         """,
         (reseller["reseller_id"],),
-    )
+    ))
     return {"profiles": rows}
+
+
+# ---------------------------
+# GET /reports/dashboard
+# ---------------------------
+# Empat summary di atas dalam satu query (satu round trip, satu acquire pool);
+# tiap section dikembalikan sebagai JSON lalu di-decode di sini.
+DASHBOARD_SQL = """
+    WITH u AS (
+        SELECT
+            COUNT(*) FILTER (WHERE status='active' AND deleted_at IS NULL) AS active,
+            COUNT(*) FILTER (WHERE status='suspended' AND deleted_at IS NULL) AS suspended,
+            COUNT(*) FILTER (WHERE deleted_at IS NULL) AS total
+        FROM ppp_users
+        WHERE reseller_id=$1
+    ),
+    inv AS (
+        SELECT
+            COALESCE(SUM(invoice_count) FILTER (WHERE status='paid'),0)::bigint AS paid_count,
+            COALESCE(SUM(amount) FILTER (WHERE status='paid'),0) AS paid_amount,
+            COALESCE(SUM(invoice_count) FILTER (WHERE status NOT IN ('paid','')),0)::bigint AS unpaid_count,
+            COALESCE(SUM(amount) FILTER (WHERE status NOT IN ('paid','')),0) AS unpaid_amount
+        FROM invoice_daily_rollup
+        WHERE reseller_id=$1 AND ($2::date IS NULL OR (day >= $2::date AND day < $3::date))
+    ),
+    pay AS (
+        SELECT NULLIF(method,'') AS method, SUM(payment_count)::bigint AS count, SUM(amount) AS total
+        FROM payment_daily_rollup
+        WHERE reseller_id=$1 AND ($2::date IS NULL OR (day >= $2::date AND day < $3::date))
+        GROUP BY method
+        HAVING SUM(payment_count) > 0
+    ),
+    prof AS (
+        SELECT
+            pr.id, pr.name,
+            COALESCE(pu.users_count, 0) AS users_count,
+            COALESCE(ci.total_revenue, 0) AS total_revenue
+        FROM ppp_profiles pr
+        LEFT JOIN (
+            SELECT profile_id, COUNT(*) AS users_count
+            FROM ppp_users
+            WHERE reseller_id=$1 AND deleted_at IS NULL
+            GROUP BY profile_id
+        ) pu ON pu.profile_id=pr.id
+        LEFT JOIN (
+            SELECT profile_id, SUM(amount) AS total_revenue
+            FROM customer_invoices
+            WHERE reseller_id=$1 AND status='paid'
+            GROUP BY profile_id
+        ) ci ON ci.profile_id=pr.id
+        WHERE pr.reseller_id=$1 AND pr.deleted_at IS NULL
+    )
+    SELECT
+        (SELECT row_to_json(u) FROM u) AS users,
+        (SELECT row_to_json(inv) FROM inv) AS invoices,
+        (SELECT COALESCE(json_agg(pay), '[]') FROM pay) AS payments,
+        (SELECT COALESCE(json_agg(prof ORDER BY prof.name), '[]') FROM prof) AS profiles
+"""
+
+# kolom nominal dikembalikan sebagai Decimal, sama seperti endpoint summary terpisah
+_AMOUNT_KEYS = ("paid_amount", "unpaid_amount", "total", "total_revenue")
+
+
+def _decode_section(value: str) -> Any:
+    def amounts(obj: Dict[str, Any]) -> Dict[str, Any]:
+        for k in _AMOUNT_KEYS:
+            if obj.get(k) is not None:
+                obj[k] = Decimal(str(obj[k]))
+        return obj
+
+    data = json.loads(value, parse_float=Decimal)
+    return [amounts(r) for r in data] if isinstance(data, list) else amounts(data)
+
+
+async def _load_dashboard(reseller_id: str, period: Optional[str]) -> Dict[str, Any]:
+    start = end = None
+    if period:
+        try:
+            start, end = period_range(period)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="period harus format YYYY-MM")
+
+    row = await fetch_one(DASHBOARD_SQL, (reseller_id, start, end))
+    return {
+        "users": _decode_section(row["users"]),
+        "invoices": _decode_section(row["invoices"]),
+        "payments": {"methods": _decode_section(row["payments"])},
+        "profiles": {"profiles": _decode_section(row["profiles"])},
+    }
+
+
+@router.get("/reports/dashboard")
+async def dashboard(
+    period: Optional[str] = Query(None, description="Format: YYYY-MM (untuk invoices & payments)"),
+    reseller=Depends(auth_reseller_jwt),
+):
+    return await report_cache.get_or_load(
+        reseller["reseller_id"], ("dashboard", period),
+        lambda: _load_dashboard(reseller["reseller_id"], period),
+    )
+
+
+# ---------------------------
+# Time-series bulanan (revenue, subscriber baru, suspend, method payment)
+# ---------------------------
+# Semua bucket dalam satu query: generate_series bulan + agregat per bulan
+# dari rollup (invoice/payment) dan ppp_users. $1 NULL = semua reseller (admin).
+TIMESERIES_SQL = """
+    WITH months AS (
+        SELECT generate_series($2::date, $3::date, interval '1 month')::date AS month
+    ),
+    inv AS (
+        SELECT date_trunc('month', day)::date AS month,
+            COALESCE(SUM(amount) FILTER (WHERE status='paid'),0) AS revenue,
+            COALESCE(SUM(invoice_count) FILTER (WHERE status='paid'),0)::bigint AS paid_invoices,
+            COALESCE(SUM(invoice_count) FILTER (WHERE status NOT IN ('paid','')),0)::bigint AS unpaid_invoices
+        FROM invoice_daily_rollup
+        WHERE ($1::uuid IS NULL OR reseller_id=$1::uuid) AND day >= $2 AND day < $4
+        GROUP BY 1
+    ),
+    pay AS (
+        SELECT month, jsonb_object_agg(method, jsonb_build_object('count', cnt, 'total', total)) AS methods
+        FROM (
+            SELECT date_trunc('month', day)::date AS month,
+                COALESCE(NULLIF(method,''),'unknown') AS method,
+                SUM(payment_count)::bigint AS cnt, SUM(amount) AS total
+            FROM payment_daily_rollup
+            WHERE ($1::uuid IS NULL OR reseller_id=$1::uuid) AND day >= $2 AND day < $4
+              AND status='success'
+            GROUP BY 1, 2
+        ) t
+        GROUP BY month
+    ),
+    subs AS (
+        SELECT date_trunc('month', created_at AT TIME ZONE $5)::date AS month, COUNT(*) AS new_subscribers
+        FROM ppp_users
+        WHERE ($1::uuid IS NULL OR reseller_id=$1::uuid) AND created_at >= $6 AND created_at < $7
+        GROUP BY 1
+    ),
+    susp AS (
+        -- event transisi ke suspended (migrations/010)
+        SELECT date_trunc('month', suspended_at AT TIME ZONE $5)::date AS month, COUNT(*) AS suspensions
+        FROM user_suspensions
+        WHERE ($1::uuid IS NULL OR reseller_id=$1::uuid) AND suspended_at >= $6 AND suspended_at < $7
+        GROUP BY 1
+    )
+    SELECT m.month,
+        COALESCE(inv.revenue, 0) AS revenue,
+        COALESCE(inv.paid_invoices, 0) AS paid_invoices,
+        COALESCE(inv.unpaid_invoices, 0) AS unpaid_invoices,
+        COALESCE(subs.new_subscribers, 0) AS new_subscribers,
+        COALESCE(susp.suspensions, 0) AS suspensions,
+        COALESCE(pay.methods, '{}'::jsonb) AS payment_methods
+    FROM months m
+    LEFT JOIN inv USING (month)
+    LEFT JOIN pay USING (month)
+    LEFT JOIN subs USING (month)
+    LEFT JOIN susp USING (month)
+    ORDER BY m.month
+"""
+
+
+def _add_months(d: date, n: int) -> date:
+    y, m = divmod(d.year * 12 + d.month - 1 + n, 12)
+    return date(y, m + 1, 1)
+
+
+async def build_timeseries(reseller_id: Optional[str], months: int) -> List[Dict[str, Any]]:
+    """
+    Bucket bulanan untuk `months` bulan terakhir (termasuk bulan berjalan).
+    Bulan yang sudah tutup di-cache per scope & bulan (diinvalidasi trigger
+    rollup saat bulan itu berubah); kalau semuanya sudah ada di cache, query
+    hanya menghitung bulan berjalan.
+    """
+    current = now_tz().date().replace(day=1)
+    first = _add_months(current, -(months - 1))
+    scope = reseller_id or "admin"
+
+    closed = [_add_months(first, i) for i in range(months - 1)]
+    cached = {m: closed_month_cache.get(closed_month_ns(scope, m), "row") for m in closed}
+    query_start = current if all(v is not None for v in cached.values()) else first
+
+    generations = {m: closed_month_cache.generation(closed_month_ns(scope, m)) for m in closed}
+    end = _add_months(current, 1)
+    rows = await fetch_all(
+        TIMESERIES_SQL,
+        (
+            reseller_id,
+            query_start,
+            current,
+            end,
+            settings.TIMEZONE,
+            start_of_day_tz(query_start),
+            start_of_day_tz(end),
+        ),
+    )
+
+    buckets = {}
+    for row in rows:
+        row["payment_methods"] = json.loads(row["payment_methods"], parse_float=Decimal)
+        buckets[row["month"]] = row
+        if row["month"] < current:
+            ns = closed_month_ns(scope, row["month"])
+            closed_month_cache.set(ns, "row", row, generations[row["month"]])
+
+    return [buckets.get(m) or cached[m] for m in closed] + [buckets[current]]
+
+
+@router.get("/reports/timeseries")
+async def timeseries(
+    months: int = Query(12, ge=1, le=60, description="Jumlah bulan terakhir (termasuk bulan ini)"),
+    reseller=Depends(auth_reseller_jwt),
+):
+    return {"months": months, "buckets": await build_timeseries(reseller["reseller_id"], months)}
@@ -1,19 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 
-from app.utils import ( hash_password, verify_password, create_access_token, create_refresh_token, verify_token, serialize_row )
-from app.deps import auth_reseller_jwt
+from app.utils import ( hash_password_async, verify_password_async, PasswordHashBusy, create_access_token, create_refresh_token, verify_token, serialize_row )
+from app.deps import auth_reseller_jwt, reseller_context
+from app.cache import get_reseller_context, invalidate_reseller_context
 from app.db import fetch_one, execute
 from app.utils import new_uuid, now_tz
 from app.config import get_settings
+from app.revocation import revoked_tokens
 
 settings = get_settings()
 
 router = APIRouter()
 
+
+def _password_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Server sedang sibuk, coba lagi sebentar",
+        headers={"Retry-After": "1"},
+    )
+
 # ----------- Schemas -----------
 class RegisterRequest(BaseModel):
     name: str
@@ -37,6 +47,9 @@ class LoginResponse(BaseModel):
 class RefreshRequest(BaseModel):
     refresh_token: str
 
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class RefreshResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
@@ -68,7 +81,10 @@ async def register(data: RegisterRequest):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     reseller_id = new_uuid()
-    pwd_hash = hash_password(data.password)
+    try:
+        pwd_hash = await hash_password_async(data.password)
+    except PasswordHashBusy:
+        raise _password_busy()
     await execute(
         """
         INSERT INTO resellers (id, name, email, password_hash, created_at)
@@ -85,7 +101,13 @@ async def login(data: LoginRequest):
     reseller = await fetch_one(
         "SELECT id, password_hash FROM resellers WHERE email=$1", (data.email,)
     )
-    if not reseller or not verify_password(data.password, reseller["password_hash"]):
+    if not reseller:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        valid = await verify_password_async(data.password, reseller["password_hash"])
+    except PasswordHashBusy:
+        raise _password_busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     access_token = create_access_token(reseller["id"])
@@ -94,15 +116,24 @@ async def login(data: LoginRequest):
 
 
 @router.post("/auth/logout", status_code=204)
-async def logout(_: Dict[str, Any] = Depends(auth_reseller_jwt)):
-    # opsional: implementasi blacklist token
+async def logout(
+    data: Optional[LogoutRequest] = None,
+    reseller: Dict[str, Any] = Depends(auth_reseller_jwt),
+):
+    # revoke access token (by jti) + refresh token kalau dikirim
+    if reseller.get("jti") and reseller.get("exp"):
+        await revoked_tokens.revoke(reseller["jti"], reseller["reseller_id"], reseller["exp"])
+    if data and data.refresh_token:
+        payload = verify_token(data.refresh_token, refresh=True)
+        if payload and payload.get("sub") == reseller["reseller_id"] and payload.get("jti"):
+            await revoked_tokens.revoke(payload["jti"], payload["sub"], payload["exp"])
     return {}
 
 
 @router.post("/auth/refresh", response_model=RefreshResponse)
 async def refresh(data: RefreshRequest):
     payload = verify_token(data.refresh_token, refresh=True)
-    if not payload:
+    if not payload or payload.get("jti") in revoked_tokens:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
     new_access = create_access_token(payload["sub"])
@@ -110,29 +141,13 @@ async def refresh(data: RefreshRequest):
 
 
 @router.get("/auth/me", response_model=RegisterResponse)
-async def auth_me(reseller: Dict[str, Any] = Depends(auth_reseller_jwt)):
-    row = await fetch_one(
-        "SELECT id, name, email FROM resellers WHERE id=$1",
-        (reseller["reseller_id"],),
-    )
-    if not row:
-        raise HTTPException(status_code=404, detail="Reseller not found")
-    return serialize_row(row)
+async def auth_me(ctx: Dict[str, Any] = Depends(reseller_context)):
+    return {"id": ctx["id"], "name": ctx["name"], "email": ctx["email"]}
 
 
 @router.get("/resellers/me", response_model=ResellerProfileResponse)
-async def get_profile(reseller: Dict[str, Any] = Depends(auth_reseller_jwt)):
-    row = await fetch_one(
-        """
-        SELECT id, name, company_name, email, phone, alamat, logo, 
-               price_per_user, currency, volume_pricing
-        FROM resellers WHERE id=$1
-        """,
-        (reseller["reseller_id"],),
-    )
-    if not row:
-        raise HTTPException(status_code=404, detail="Reseller not found")
-    return serialize_row(row)
+async def get_profile(ctx: Dict[str, Any] = Depends(reseller_context)):
+    return serialize_row(ctx)
 
 
 @router.put("/resellers/me", response_model=ResellerProfileResponse)
@@ -147,12 +162,6 @@ async def update_profile(
         """,
         (data.phone, data.alamat, data.logo, now_tz(), data.company_name, reseller["reseller_id"]),
     )
-    row = await fetch_one(
-        """
-        SELECT id, name, company_name, email, phone, alamat, logo, 
-               price_per_user, currency, volume_pricing
-        FROM resellers WHERE id=$1
-        """,
-        (reseller["reseller_id"],),
-    )
+    await invalidate_reseller_context(reseller["reseller_id"])
+    row = await get_reseller_context(reseller["reseller_id"])
     return serialize_row(row)
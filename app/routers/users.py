@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel, EmailStr
 from typing import Optional, Dict, Any
 from datetime import date, datetime
 
-from app.db import fetch_one, fetch_all, execute
+from app.db import fetch_one, fetch_all, execute, coa_log_writer
 from app.deps import auth_reseller_jwt, pagination
 from app.utils import new_uuid, now_tz, response_list
+from app.responses import trusted_response, make_etag, etag_matches, not_modified
+from app.cache import invalidate_reseller_reports
+from app.metrics import OUTBOUND_CALL_SECONDS
 
 import asyncio  
+import time
 router = APIRouter() 
 
 # === Konfigurasi NAS static ===
@@ -43,6 +47,7 @@ async def disconnect_user_sessions(username: str):
         data = "\n".join(attrs) + "\n"
         cmd = ["/usr/bin/radclient", "-x", f"{nas_ip}:{DEFAULT_COA_PORT}", "disconnect", NAS_SECRET]
 
+        start = time.perf_counter()
         try:
             proc = await asyncio.create_subprocess_exec(
                 *cmd,
@@ -57,17 +62,18 @@ async def disconnect_user_sessions(username: str):
             print("❌ radclient tidak ditemukan. Install freeradius-utils.")
             return
         except Exception as e:
+            OUTBOUND_CALL_SECONDS.observe(time.perf_counter() - start, target="coa", outcome="error")
             print(f"❌ Gagal menjalankan radclient: {e}")
             return
 
         success = "ACK" in out
+        OUTBOUND_CALL_SECONDS.observe(
+            time.perf_counter() - start, target="coa", outcome="ack" if success else "nak"
+        )
         result_text = out.strip() or err.strip()
 
-        # Simpan hasil ke DB (opsional)
-        await execute("""
-            INSERT INTO coa_log (username, nas_ip, result, response)
-            VALUES ($1, $2, $3, $4)
-        """, (username, nas_ip, "success" if success else "failed", result_text))
+        # Simpan hasil ke DB (opsional) — ditulis per batch oleh coa_log_writer
+        coa_log_writer.add(username, nas_ip, "success" if success else "failed", result_text)
 
         if success:
             print(f"✅ COA-ACK {username} ({acctsessionid}) @ {nas_ip} — {result_text}")
@@ -178,15 +184,37 @@ async def list_users(
         f"SELECT COUNT(*) AS count FROM ppp_users WHERE {where_clause}", tuple(params)
     )
 
-    return response_list(rows, paging["page"], paging["per_page"], total["count"])
+    return trusted_response(response_list(rows, paging["page"], paging["per_page"], total["count"]))
+
+
+# Kolom yang dikembalikan GET /users/{id}. ETag = md5 dari kolom-kolom ini (dihitung
+# di DB), bukan updated_at: tidak semua writer ppp_users menyentuh updated_at.
+USER_DETAIL_COLUMNS = """
+    id, reseller_id, username, full_name, phone, email, alamat, profile_id,
+    status, active_until, is_active, created_at, updated_at
+"""
+USER_DETAIL_VERSION = f"md5(ROW({USER_DETAIL_COLUMNS})::text)"
 
 
 @router.get("/users/{user_id}", response_model=UserOut)
-async def get_user(user_id: str, reseller=Depends(auth_reseller_jwt)):
+async def get_user(user_id: str, request: Request, reseller=Depends(auth_reseller_jwt)):
+    # klien yang kirim If-None-Match dicek dulu tanpa ambil row penuh
+    if request.headers.get("if-none-match"):
+        current = await fetch_one(
+            f"""
+            SELECT id, {USER_DETAIL_VERSION} AS version
+            FROM ppp_users WHERE id=$1 AND reseller_id=$2 AND deleted_at IS NULL
+            """,
+            (user_id, reseller["reseller_id"]),
+        )
+        if current:
+            etag = make_etag("user", current["id"], current["version"])
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
     row = await fetch_one(
-        """
-        SELECT id, reseller_id, username, full_name, phone, email, alamat, profile_id,
-               status, active_until, is_active, created_at, updated_at
+        f"""
+        SELECT {USER_DETAIL_COLUMNS}, {USER_DETAIL_VERSION} AS version
         FROM ppp_users
         WHERE id=$1 AND reseller_id=$2 AND deleted_at IS NULL
         """,
@@ -194,7 +222,7 @@ async def get_user(user_id: str, reseller=Depends(auth_reseller_jwt)):
     )
     if not row:
         raise HTTPException(status_code=404, detail="User not found")
-    return row
+    return trusted_response(row, UserOut, headers={"ETag": make_etag("user", row["id"], row["version"])})
 
 
 @router.post("/users", response_model=UserOut)
@@ -226,6 +254,8 @@ async def create_user(data: UserCreate, reseller=Depends(auth_reseller_jwt)):
         ),
     )
 
+    await invalidate_reseller_reports(reseller["reseller_id"])
+
     row = await fetch_one(
         """
         SELECT id, reseller_id, username, full_name, phone, email, alamat, profile_id,
@@ -271,6 +301,8 @@ async def update_user(user_id: str, data: UserUpdate, reseller=Depends(auth_rese
         ),
     )
 
+    await invalidate_reseller_reports(reseller["reseller_id"])
+
     row = await fetch_one(
         """
         SELECT id, reseller_id, username, full_name, phone, email, alamat, profile_id,
@@ -300,6 +332,7 @@ async def delete_user(user_id: str, reseller=Depends(auth_reseller_jwt)):
         (user_id, reseller["reseller_id"]),
     )
 
+    await invalidate_reseller_reports(reseller["reseller_id"])
     print(f"🗑️ User {username if user else user_id} berhasil dihapus.")
     return {}
 
@@ -319,6 +352,8 @@ async def change_status(user_id: str, status: str, reseller=Depends(auth_reselle
         (status, now_tz(), user_id, reseller["reseller_id"]),
     )
 
+    await invalidate_reseller_reports(reseller["reseller_id"])
+
     row = await fetch_one(
         """
         SELECT id, reseller_id, username, full_name, phone, email, alamat, profile_id,
@@ -1,13 +1,22 @@
+import asyncio
 import bcrypt
 import uuid
 import json
+import base64
+import csv
+import io
+import re
 import httpx
-from datetime import datetime, timedelta
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 import pytz
 from jose import jwt, JWTError
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from .config import get_settings
+from .metrics import OUTBOUND_CALL_SECONDS
 
 settings = get_settings()
 
@@ -23,16 +32,48 @@ def verify_password(password: str, hashed: str) -> bool:
     return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
 
 
+# bcrypt ~100-300ms CPU per call → jalankan di thread pool khusus supaya event loop
+# tidak ke-block. Slot = thread + antrian; kalau penuh lebih lama dari
+# PASSWORD_HASH_TIMEOUT → PasswordHashBusy (router balas 429).
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_THREADS, thread_name_prefix="bcrypt"
+)
+_password_slots = asyncio.Semaphore(settings.PASSWORD_HASH_THREADS + settings.PASSWORD_HASH_QUEUE)
+
+
+class PasswordHashBusy(Exception):
+    pass
+
+
+async def _run_password_job(fn, *args):
+    try:
+        await asyncio.wait_for(_password_slots.acquire(), settings.PASSWORD_HASH_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PasswordHashBusy()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_executor, fn, *args)
+    finally:
+        _password_slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_job(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run_password_job(verify_password, password, hashed)
+
+
 # ---- JWT Token ----
 def create_access_token(reseller_id: str) -> str:
     expire = datetime.utcnow() + timedelta(minutes=settings.JWT_ACCESS_EXPIRES_MIN)
-    payload = {"sub": str(reseller_id), "exp": expire}
+    payload = {"sub": str(reseller_id), "exp": expire, "jti": uuid.uuid4().hex}
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
 
 
 def create_refresh_token(reseller_id: str) -> str:
     expire = datetime.utcnow() + timedelta(minutes=settings.JWT_REFRESH_EXPIRES_MIN)
-    payload = {"sub": str(reseller_id), "exp": expire, "type": "refresh"}
+    payload = {"sub": str(reseller_id), "exp": expire, "type": "refresh", "jti": uuid.uuid4().hex}
     return jwt.encode(payload, settings.JWT_SECRET, algorithm=settings.JWT_ALG)
 
 
@@ -103,6 +144,8 @@ async def send_wa_message(phone: str, text: str) -> Dict[str, Any]:
         phone = "62" + phone  # fallback: asumsi tidak pakai kode negara
 
     print(phone)
+    start = time.perf_counter()
+    outcome = "error"
     try:
         async with httpx.AsyncClient(timeout=10.0) as client:
             resp = await client.post(
@@ -110,11 +153,14 @@ async def send_wa_message(phone: str, text: str) -> Dict[str, Any]:
                 # headers={"Authorization": f"Bearer {settings.WA_TOKEN}"},
                 json={"number": phone, "message": text},
             )
+            outcome = "ok" if resp.is_success else f"http_{resp.status_code}"
             print(settings.WA_GATEWAY_URL)
             print(resp.text)
             return {"status": resp.status_code, "body": resp.json()}
     except Exception as e:
         return {"status": "error", "error": str(e)}
+    finally:
+        OUTBOUND_CALL_SECONDS.observe(time.perf_counter() - start, target="wa", outcome=outcome)
 
 
 # ---- Response Helper untuk List ----
@@ -127,6 +173,109 @@ def response_list(data: list, page: int, per_page: int, total: int) -> Dict[str,
     }
 
 
+# ---- Cursor Pagination (keyset created_at, id) ----
+# created_at NULL diurutkan sebagai -infinity (paling akhir di DESC) dan ikut
+# ke cursor sebagai null; tanpa COALESCE row itu hilang dari perbandingan row.
+def cursor_keyset(alias: str, n: int) -> Tuple[str, str]:
+    """(kondisi 'setelah cursor' dengan param $n/$n+1, ORDER BY) untuk tabel alias."""
+    key = f"COALESCE({alias}.created_at, '-infinity'::timestamptz)"
+    return (
+        f"({key}, {alias}.id) < (COALESCE(${n}::timestamptz, '-infinity'::timestamptz), ${n + 1})",
+        f"ORDER BY {key} DESC, {alias}.id DESC",
+    )
+
+
+def encode_cursor(created_at: Optional[datetime], row_id: Any) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], Any]:
+    """Raise ValueError kalau cursor tidak valid."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(created_at) if created_at is not None else None), row_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def response_cursor(data: list, limit: int, next_cursor: Optional[str]) -> Dict[str, Any]:
+    return {
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "data": data,
+    }
+
+
+_PERIOD_RE = re.compile(r"\d{4}-\d{2}")
+
+
+def period_range(period: str) -> Tuple[date, date]:
+    """'YYYY-MM' → (tanggal 1 bulan itu, tanggal 1 bulan berikutnya). Raise ValueError kalau format salah."""
+    # strptime juga menerima '2024-1' / ' 2024-01'; period ikut ke nama file export
+    if not isinstance(period, str) or not _PERIOD_RE.fullmatch(period):
+        raise ValueError(f"Invalid period: {period!r}")
+    start = datetime.strptime(period, "%Y-%m").date()
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+def start_of_day_tz(d: date) -> datetime:
+    """Tanggal → datetime 00:00 di TIMEZONE (untuk filter kolom timestamptz)."""
+    tz = pytz.timezone(settings.TIMEZONE)
+    return tz.localize(datetime.combine(d, datetime.min.time()))
+
+
+# ---- NDJSON Streaming ----
+def json_default(v: Any) -> Any:
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, uuid.UUID):
+        return str(v)
+    return str(v)
+
+
+async def stream_ndjson(rows: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for row in rows:
+        yield (json.dumps(row, default=json_default) + "\n").encode()
+
+
+# ---- CSV Streaming ----
+def _csv_value(v: Any) -> Any:
+    if v is None:
+        return ""
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, default=json_default)
+    return v
+
+
+async def stream_csv(
+    rows: AsyncIterator[Dict[str, Any]], columns: List[str], chunk_rows: int = 500
+) -> AsyncIterator[bytes]:
+    """Tulis row jadi CSV per chunk (BOM di awal supaya Excel baca UTF-8)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")
+    writer.writerow(columns)
+
+    count = 0
+    async for row in rows:
+        writer.writerow([_csv_value(row.get(c)) for c in columns])
+        count += 1
+        if count % chunk_rows == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate(0)
+
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
 # ---- Logging Helper ----
 def log_event(event: str, meta: Optional[Dict[str, Any]] = None) -> None:
     ts = now_tz().isoformat()
@@ -3,12 +3,20 @@ import logging
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from contextlib import asynccontextmanager
 
+from app.config import get_settings
 from app.db import connect_db, disconnect_db
+from app.metrics import start_metrics_writer, stop_metrics_writer
+from app.loop_monitor import start_loop_monitor, stop_loop_monitor
 from app.worker.scheduler import (
     job_generate_customer_invoices,
     job_remind_unpaid_invoices,
     job_suspend_overdue_users,
     job_generate_reseller_invoices,
+    job_process_webhook_inbox,
+    job_reconcile_settlements,
+    job_rebuild_financial_rollups,
+    job_run_report_jobs,
+    job_purge_revoked_tokens,
 )
 
 logging.basicConfig(
@@ -17,6 +25,7 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 
 @asynccontextmanager
@@ -24,6 +33,9 @@ async def lifespan():
     # Startup
     await connect_db()
     logger.info("✅ Database connected (Worker)")
+    # worker tidak expose HTTP: metrics-nya dibaca API /metrics lewat METRICS_DIR
+    start_metrics_writer()
+    start_loop_monitor()
 
     scheduler = AsyncIOScheduler(timezone="Asia/Jakarta")
 
@@ -32,6 +44,13 @@ async def lifespan():
     scheduler.add_job(job_remind_unpaid_invoices, "cron", hour=9, minute=10)          # reminder unpaid
     scheduler.add_job(job_suspend_overdue_users, "cron", day=1, hour=6, minute=0)     # suspend overdue
     scheduler.add_job(job_generate_reseller_invoices, "cron", day=1, hour=0, minute=10)  # reseller invoice
+    if settings.DUITKU_WEBHOOK_QUEUE:
+        # inbox hanya terisi kalau queue aktif; kosongkan dulu sebelum mematikannya
+        scheduler.add_job(job_process_webhook_inbox, "interval", seconds=2, max_instances=1, coalesce=True)  # inbox webhook
+    scheduler.add_job(job_reconcile_settlements, "interval", minutes=15, max_instances=1)  # rekonsiliasi settlement
+    scheduler.add_job(job_rebuild_financial_rollups, "cron", hour=3, minute=0)        # koreksi rollup keuangan
+    scheduler.add_job(job_run_report_jobs, "interval", seconds=5, max_instances=1, coalesce=True)  # report berat admin
+    scheduler.add_job(job_purge_revoked_tokens, "cron", hour=3, minute=30)           # hapus revoked token kedaluwarsa
 
     scheduler.start()
     logger.info("🚀 Worker scheduler started")
@@ -40,6 +59,8 @@ async def lifespan():
         yield
     finally:
         # Shutdown
+        await stop_loop_monitor()
+        await stop_metrics_writer()
         await disconnect_db()
         logger.info("🛑 Database disconnected (Worker)")
 
@@ -1,8 +1,57 @@
+import asyncio
+import functools
+import json
+import os
+import time
 from datetime import date, datetime, timedelta
 from app.db import fetch_all, execute
 from app.utils import send_wa_message
+from app.billing import parse_payment_callback, apply_payment_callback
+from app.reconciliation import iter_file_chunks, iter_text_lines, reconcile_settlement
+from app.config import get_settings
+from app.cache import invalidate_reseller_reports
+from app.report_jobs import run_report
+from app.routers.profiles import get_catalog_profile
+from app.metrics import Counter, Histogram
+from app.request_context import reset_caller, set_caller
+
+settings = get_settings()
+
+JOB_SECONDS = Histogram(
+    "worker_job_duration_seconds",
+    "Durasi eksekusi job scheduler",
+    ("job", "outcome"),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0),
+)
+JOB_ROWS = Counter("worker_job_rows_total", "Jumlah row yang diproses job scheduler", ("job",))
+
+
+def tracked_job(func):
+    """
+    Catat durasi job + jumlah row yang diproses (nilai return job, kalau int).
+    Nama job juga jadi label pemanggil query (slow-query log).
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = "error"
+        token = set_caller(func.__name__)
+        try:
+            rows = await func(*args, **kwargs)
+            outcome = "ok"
+        finally:
+            reset_caller(token)
+            JOB_SECONDS.observe(time.perf_counter() - start, job=func.__name__, outcome=outcome)
+        if isinstance(rows, int):
+            JOB_ROWS.inc(rows, job=func.__name__)
+        return rows
+
+    return wrapper
+
 
 # ========== CUSTOMER INVOICES ==========
+@tracked_job
 async def job_generate_customer_invoices():
     today = date.today()
     print(f"[{datetime.now()}] Running job_generate_customer_invoices...")
@@ -10,9 +59,8 @@ async def job_generate_customer_invoices():
     # Cari user dengan active_until = today + 3 hari
     users = await fetch_all(
         """
-        SELECT u.*, p.price, p.name as profile_name
+        SELECT u.*
         FROM ppp_users u
-        JOIN ppp_profiles p ON p.id = u.profile_id
         WHERE u.active_until = $1
           AND u.deleted_at IS NULL
           AND u.is_active = true
@@ -21,6 +69,12 @@ async def job_generate_customer_invoices():
     )
 
     for u in users:
+        # harga & nama paket dari katalog profile (cache per reseller)
+        profile = await get_catalog_profile(u["reseller_id"], u["profile_id"])
+        if not profile:
+            continue
+        u = {**u, "price": profile["price"], "profile_name": profile["name"]}
+
         # Cek apakah sudah ada invoice untuk periode ini
         existing = await fetch_all(
             """
@@ -52,8 +106,14 @@ async def job_generate_customer_invoices():
             f"senilai {u['price']} jatuh tempo {u['active_until']}. Harap segera dibayar."
         )
 
+    # cache /reports/* reseller yang invoicenya bertambah
+    for reseller_id in {u["reseller_id"] for u in users}:
+        await invalidate_reseller_reports(reseller_id)
+    return len(users)
+
 
 # ========== REMINDER UNPAID ==========
+@tracked_job
 async def job_remind_unpaid_invoices():
     today = date.today()
     print(f"[{datetime.now()}] Running job_remind_unpaid_invoices...")
@@ -80,9 +140,11 @@ async def job_remind_unpaid_invoices():
                 f"Halo {inv['username']}, tagihan Anda untuk periode {inv['period_start']} - {inv['period_end']} "
                 f"masih belum dibayar. Mohon segera lunasi sebelum {month_end}."
             )
+    return len(invoices)
 
 
 # ========== SUSPEND USERS ==========
+@tracked_job
 async def job_suspend_overdue_users():
     today = date.today()
     print(f"[{datetime.now()}] Running job_suspend_overdue_users...")
@@ -100,7 +162,7 @@ async def job_suspend_overdue_users():
     )
 
     for inv in invoices:
-        await execute("UPDATE ppp_users SET status='suspended' WHERE id=$1", (inv["user_id"],))
+        await execute("UPDATE ppp_users SET status='suspended', updated_at=now() WHERE id=$1", (inv["user_id"],))
         print(f"Suspended user {inv['username']} (invoice {inv['id']})")
 
         await send_wa_message(
@@ -109,8 +171,13 @@ async def job_suspend_overdue_users():
             f"karena tagihan belum dibayar."
         )
 
+    for reseller_id in {inv["reseller_id"] for inv in invoices}:
+        await invalidate_reseller_reports(reseller_id)
+    return len(invoices)
+
 
 # ========== GENERATE INVOICES FOR RESELLERS ==========
+@tracked_job
 async def job_generate_reseller_invoices():
     today = date.today()
     print(f"[{datetime.now()}] Running job_generate_reseller_invoices...")
@@ -158,3 +225,190 @@ async def job_generate_reseller_invoices():
                 f"Halo {r['name']}, invoice bulan {period_start.strftime('%B %Y')} "
                 f"dengan total {total} sudah dibuat. Mohon dibayar sebelum tanggal 20."
             )
+    return len(resellers)
+
+
+# ========== WEBHOOK INBOX (mode ingest Duitku) ==========
+@tracked_job
+async def job_process_webhook_inbox():
+    # Klaim satu batch; row 'processing' yang macet > 5 menit (worker crash) diambil ulang
+    batch = await fetch_all(
+        """
+        UPDATE payment_webhook_inbox
+        SET status='processing', locked_at=now(), attempts=attempts+1
+        WHERE id IN (
+            SELECT id FROM payment_webhook_inbox
+            WHERE status='pending'
+               OR (status='processing' AND locked_at < now() - interval '5 minutes')
+            ORDER BY id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, provider_txn_id, payload
+        """,
+        (settings.WEBHOOK_INBOX_BATCH,),
+    )
+    if not batch:
+        return 0
+
+    print(f"[{datetime.now()}] Running job_process_webhook_inbox ({len(batch)} callbacks)...")
+
+    # Idempotensi: callback dengan provider_txn_id sama cukup diproses sekali,
+    # pakai callback terakhir (status paling baru), sisanya ikut ditandai done.
+    groups = {}
+    for row in sorted(batch, key=lambda r: r["id"]):
+        key = row["provider_txn_id"] or f"inbox:{row['id']}"
+        groups.setdefault(key, []).append(row)
+
+    sem = asyncio.Semaphore(5)
+    done_ids, failed = [], []
+
+    async def process(rows):
+        ids = [r["id"] for r in rows]
+        async with sem:
+            try:
+                callback = parse_payment_callback(json.loads(rows[-1]["payload"]))
+                result = await apply_payment_callback(callback)
+                if not result:
+                    failed.append((ids, f"Invoice not found: {callback['invoice_id']}"))
+                    return
+                done_ids.extend(ids)
+            except Exception as e:
+                failed.append((ids, str(e)))
+
+    await asyncio.gather(*(process(rows) for rows in groups.values()))
+
+    if done_ids:
+        await execute(
+            """
+            UPDATE payment_webhook_inbox
+            SET status='done', processed_at=now(), last_error=NULL
+            WHERE id = ANY($1::bigint[])
+            """,
+            (done_ids,),
+        )
+
+    for ids, error in failed:
+        await execute(
+            """
+            UPDATE payment_webhook_inbox
+            SET status = CASE WHEN attempts >= $3 THEN 'failed' ELSE 'pending' END,
+                last_error=$2, locked_at=NULL
+            WHERE id = ANY($1::bigint[])
+            """,
+            (ids, error, settings.WEBHOOK_INBOX_MAX_ATTEMPTS),
+        )
+        print(f"Inbox callback {ids} gagal diproses: {error}")
+    return len(batch)
+
+
+# ========== REKONSILIASI SETTLEMENT ==========
+@tracked_job
+async def job_reconcile_settlements():
+    if not settings.SETTLEMENT_DIR or not os.path.isdir(settings.SETTLEMENT_DIR):
+        return 0
+
+    lines = 0
+    # File settlement_YYYY-MM-DD.csv → window 1 hari; setelah diproses di-rename .done/.failed
+    for name in sorted(os.listdir(settings.SETTLEMENT_DIR)):
+        if not (name.startswith("settlement_") and name.endswith(".csv")):
+            continue
+        path = os.path.join(settings.SETTLEMENT_DIR, name)
+        try:
+            day = date.fromisoformat(name[len("settlement_"):-len(".csv")])
+        except ValueError:
+            print(f"Skip file settlement {name}: nama file bukan settlement_YYYY-MM-DD.csv")
+            continue
+
+        print(f"[{datetime.now()}] Running job_reconcile_settlements ({name})...")
+        try:
+            result = await reconcile_settlement(
+                iter_text_lines(iter_file_chunks(path)),
+                window_start=day,
+                window_end=day,
+                source=name,
+            )
+        except Exception as e:
+            print(f"Rekonsiliasi {name} gagal: {e}")
+            os.rename(path, path + ".failed")
+            continue
+
+        os.rename(path, path + ".done")
+        lines += result["lines"]
+        print(
+            f"Rekonsiliasi {name}: {result['lines']} baris, "
+            f"{result['matched']} cocok, {result['mismatched']} mismatch (run {result['run_id']})"
+        )
+    return lines
+
+
+# ========== ROLLUP KEUANGAN ==========
+@tracked_job
+async def job_rebuild_financial_rollups():
+    # Trigger menjaga rollup per row; rebuild penuh ini mengoreksi kasus tepi
+    # (mis. payment ikut terhapus cascade setelah invoice-nya hilang).
+    print(f"[{datetime.now()}] Running job_rebuild_financial_rollups...")
+    # tanpa lock tabel: per bucket, commit per bucket (migrations/008)
+    # bucket yang berubah di bulan tutup men-trigger invalidasi closed_month_cache (migrations/009)
+    await execute("CALL rollup_rebuild_buckets()")
+
+
+# ========== REPORT JOBS ==========
+@tracked_job
+async def job_run_report_jobs():
+    # Klaim maksimal REPORT_JOB_CONCURRENCY job sekaligus (job dengan max_instances=1,
+    # jadi itu juga batas report yang jalan bersamaan per worker). Job 'running'
+    # yang macet > 30 menit (worker crash) diambil ulang.
+    jobs = await fetch_all(
+        """
+        UPDATE report_jobs
+        SET status='running', started_at=now(), attempts=attempts+1
+        WHERE id IN (
+            SELECT id FROM report_jobs
+            WHERE status='queued'
+               OR (status='running' AND started_at < now() - interval '30 minutes')
+            ORDER BY id
+            LIMIT $1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, kind, params, attempts
+        """,
+        (settings.REPORT_JOB_CONCURRENCY,),
+    )
+    if not jobs:
+        return 0
+
+    print(f"[{datetime.now()}] Running job_run_report_jobs ({len(jobs)} jobs)...")
+
+    async def process(job):
+        try:
+            result = await run_report(job["kind"], json.loads(job["params"]))
+        except Exception as e:
+            await execute(
+                """
+                UPDATE report_jobs
+                SET status = CASE WHEN attempts >= $3 THEN 'failed' ELSE 'queued' END,
+                    error=$2, finished_at=now()
+                WHERE id=$1
+                """,
+                (job["id"], str(e), settings.REPORT_JOB_MAX_ATTEMPTS),
+            )
+            print(f"Report job {job['id']} ({job['kind']}) gagal: {e}")
+            return
+        await execute(
+            "UPDATE report_jobs SET status='done', result=$2::jsonb, error=NULL, finished_at=now() WHERE id=$1",
+            (job["id"], result),
+        )
+        print(f"Report job {job['id']} ({job['kind']}) selesai")
+
+    await asyncio.gather(*(process(job) for job in jobs))
+    return len(jobs)
+
+
+# ========== REVOKED TOKENS ==========
+@tracked_job
+async def job_purge_revoked_tokens():
+    # token yang sudah lewat exp tidak perlu diblok lagi
+    print(f"[{datetime.now()}] Running job_purge_revoked_tokens...")
+    status = await execute("DELETE FROM revoked_tokens WHERE expires_at < now()")
+    return int(status.split()[-1])
@@ -0,0 +1,23 @@
+-- Inbox callback payment gateway (mode ingest DUITKU_WEBHOOK_QUEUE=true).
+-- Webhook hanya append ke sini; worker job_process_webhook_inbox yang settle invoice.
+CREATE TABLE IF NOT EXISTS payment_webhook_inbox (
+    id              BIGSERIAL PRIMARY KEY,
+    provider        TEXT NOT NULL,
+    provider_txn_id TEXT,
+    invoice_id      TEXT,
+    payload         JSONB NOT NULL,
+    status          TEXT NOT NULL DEFAULT 'pending',  -- pending / processing / done / failed
+    attempts        INT NOT NULL DEFAULT 0,
+    last_error      TEXT,
+    received_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+    locked_at       TIMESTAMPTZ,
+    processed_at    TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS payment_webhook_inbox_pending_idx
+    ON payment_webhook_inbox (id)
+    WHERE status IN ('pending', 'processing');
+
+-- Dipakai settle_customer_invoice untuk idempotensi by provider_txn_id
+CREATE INDEX IF NOT EXISTS payments_provider_txn_id_idx
+    ON payments (provider_txn_id);
@@ -0,0 +1,34 @@
+-- Rekonsiliasi payments vs file settlement provider (Duitku).
+CREATE TABLE IF NOT EXISTS reconciliation_runs (
+    id            BIGSERIAL PRIMARY KEY,
+    source        TEXT NOT NULL,                    -- nama file / 'upload'
+    method        TEXT,
+    window_start  DATE NOT NULL,
+    window_end    DATE NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'running',  -- running / done / failed
+    lines         INT NOT NULL DEFAULT 0,
+    matched       INT NOT NULL DEFAULT 0,
+    mismatched    INT NOT NULL DEFAULT 0,
+    error         TEXT,
+    created_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at   TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS reconciliation_mismatches (
+    id              BIGSERIAL PRIMARY KEY,
+    run_id          BIGINT NOT NULL REFERENCES reconciliation_runs(id) ON DELETE CASCADE,
+    kind            TEXT NOT NULL,  -- missing_in_db / missing_in_file / amount_mismatch / status_mismatch / duplicate_in_file / invalid_line
+    provider_txn_id TEXT,
+    payment_id      BIGINT,
+    file_amount     NUMERIC,
+    db_amount       NUMERIC,
+    db_status       TEXT,
+    line_no         INT
+);
+
+CREATE INDEX IF NOT EXISTS reconciliation_mismatches_run_idx
+    ON reconciliation_mismatches (run_id, id);
+
+-- Range query payments per window rekonsiliasi
+CREATE INDEX IF NOT EXISTS payments_created_at_idx
+    ON payments (created_at);
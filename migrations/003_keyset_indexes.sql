@@ -0,0 +1,11 @@
+-- Index untuk cursor pagination (keyset created_at DESC, id DESC) list admin
+CREATE INDEX IF NOT EXISTS resellers_created_at_id_idx
+    ON resellers (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS ppp_users_created_at_id_idx
+    ON ppp_users (created_at DESC, id DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS customer_invoices_created_at_id_idx
+    ON customer_invoices (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS invoices_created_at_id_idx
+    ON invoices (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS payments_created_at_id_idx
+    ON payments (created_at DESC, id DESC);
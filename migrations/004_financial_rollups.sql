@@ -0,0 +1,193 @@
+-- Rollup harian keuangan untuk /reports/* dan /admin/reports/finance/summary.
+-- Dijaga trigger (per row), plus rebuild penuh tiap malam oleh worker
+-- (job_rebuild_financial_rollups) sebagai jaring pengaman.
+--
+-- invoice_daily_rollup : per (reseller, period_start, status invoice)
+--                        payments_amount = total payment success milik invoice di bucket itu
+-- payment_daily_rollup : per (reseller, hari created_at payment, method, status payment)
+-- method/status NULL disimpan sebagai '' (bagian primary key), dibaca balik pakai NULLIF.
+
+CREATE TABLE IF NOT EXISTS invoice_daily_rollup (
+    reseller_id     UUID NOT NULL,
+    day             DATE NOT NULL,
+    status          TEXT NOT NULL,
+    invoice_count   BIGINT NOT NULL DEFAULT 0,
+    amount          NUMERIC NOT NULL DEFAULT 0,
+    payments_amount NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (reseller_id, day, status)
+);
+
+CREATE TABLE IF NOT EXISTS payment_daily_rollup (
+    reseller_id   UUID NOT NULL,
+    day           DATE NOT NULL,
+    method        TEXT NOT NULL,
+    status        TEXT NOT NULL,
+    payment_count BIGINT NOT NULL DEFAULT 0,
+    amount        NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (reseller_id, day, method, status)
+);
+
+CREATE INDEX IF NOT EXISTS invoice_daily_rollup_day_idx ON invoice_daily_rollup (day);
+CREATE INDEX IF NOT EXISTS payment_daily_rollup_day_idx ON payment_daily_rollup (day);
+
+-- recompute satu bucket invoice dari tabel dasar (idempotent, aman dipanggil
+-- beberapa kali dalam satu statement, mis. CTE settle invoice + payment)
+CREATE INDEX IF NOT EXISTS customer_invoices_reseller_period_idx
+    ON customer_invoices (reseller_id, period_start);
+CREATE INDEX IF NOT EXISTS payments_invoice_id_idx
+    ON payments (invoice_id);
+
+CREATE OR REPLACE FUNCTION rollup_invoice_refresh(p_reseller UUID, p_day DATE, p_status TEXT)
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    v_count BIGINT;
+    v_amount NUMERIC;
+    v_paid NUMERIC;
+BEGIN
+    IF p_reseller IS NULL OR p_day IS NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT COUNT(*), COALESCE(SUM(ci.amount), 0), COALESCE(SUM(pp.paid), 0)
+    INTO v_count, v_amount, v_paid
+    FROM customer_invoices ci
+    LEFT JOIN LATERAL (
+        SELECT SUM(p.amount) AS paid
+        FROM payments p
+        WHERE p.invoice_id = ci.id AND p.status = 'success'
+    ) pp ON true
+    WHERE ci.reseller_id = p_reseller
+      AND ci.period_start = p_day
+      AND COALESCE(ci.status, '') = COALESCE(p_status, '');
+
+    IF v_count = 0 THEN
+        DELETE FROM invoice_daily_rollup
+        WHERE reseller_id = p_reseller AND day = p_day AND status = COALESCE(p_status, '');
+    ELSE
+        INSERT INTO invoice_daily_rollup (reseller_id, day, status, invoice_count, amount, payments_amount)
+        VALUES (p_reseller, p_day, COALESCE(p_status, ''), v_count, v_amount, v_paid)
+        ON CONFLICT (reseller_id, day, status) DO UPDATE
+        SET invoice_count = EXCLUDED.invoice_count,
+            amount = EXCLUDED.amount,
+            payments_amount = EXCLUDED.payments_amount;
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_payment_add(
+    p_reseller UUID, p_ts TIMESTAMPTZ, p_method TEXT, p_status TEXT, p_count BIGINT, p_amount NUMERIC
+) RETURNS void LANGUAGE plpgsql AS $$
+BEGIN
+    IF p_reseller IS NULL OR p_ts IS NULL THEN
+        RETURN;
+    END IF;
+    INSERT INTO payment_daily_rollup (reseller_id, day, method, status, payment_count, amount)
+    VALUES (p_reseller, (p_ts AT TIME ZONE 'Asia/Jakarta')::date,
+            COALESCE(p_method, ''), COALESCE(p_status, ''), p_count, COALESCE(p_amount, 0))
+    ON CONFLICT (reseller_id, day, method, status) DO UPDATE
+    SET payment_count = payment_daily_rollup.payment_count + EXCLUDED.payment_count,
+        amount = payment_daily_rollup.amount + EXCLUDED.amount;
+END;
+$$;
+
+-- ---- Trigger customer_invoices ----
+CREATE OR REPLACE FUNCTION trg_customer_invoices_rollup()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.reseller_id IS NOT DISTINCT FROM NEW.reseller_id
+       AND OLD.period_start IS NOT DISTINCT FROM NEW.period_start
+       AND OLD.status IS NOT DISTINCT FROM NEW.status
+       AND OLD.amount IS NOT DISTINCT FROM NEW.amount THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_invoice_refresh(OLD.reseller_id, OLD.period_start, OLD.status);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rollup_invoice_refresh(NEW.reseller_id, NEW.period_start, NEW.status);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS customer_invoices_rollup ON customer_invoices;
+CREATE TRIGGER customer_invoices_rollup
+    AFTER INSERT OR UPDATE OR DELETE ON customer_invoices
+    FOR EACH ROW EXECUTE FUNCTION trg_customer_invoices_rollup();
+
+-- ---- Trigger payments ----
+CREATE OR REPLACE FUNCTION trg_payments_rollup()
+RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    inv RECORD;
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.invoice_id IS NOT DISTINCT FROM NEW.invoice_id
+       AND OLD.created_at IS NOT DISTINCT FROM NEW.created_at
+       AND OLD.method IS NOT DISTINCT FROM NEW.method
+       AND OLD.status IS NOT DISTINCT FROM NEW.status
+       AND OLD.amount IS NOT DISTINCT FROM NEW.amount THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT reseller_id, period_start, status INTO inv
+        FROM customer_invoices WHERE id = OLD.invoice_id;
+        IF FOUND THEN
+            PERFORM rollup_payment_add(inv.reseller_id, OLD.created_at, OLD.method, OLD.status, -1, -OLD.amount);
+            PERFORM rollup_invoice_refresh(inv.reseller_id, inv.period_start, inv.status);
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT reseller_id, period_start, status INTO inv
+        FROM customer_invoices WHERE id = NEW.invoice_id;
+        IF FOUND THEN
+            PERFORM rollup_payment_add(inv.reseller_id, NEW.created_at, NEW.method, NEW.status, 1, NEW.amount);
+            PERFORM rollup_invoice_refresh(inv.reseller_id, inv.period_start, inv.status);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS payments_rollup ON payments;
+CREATE TRIGGER payments_rollup
+    AFTER INSERT OR UPDATE OR DELETE ON payments
+    FOR EACH ROW EXECUTE FUNCTION trg_payments_rollup();
+
+-- ---- Rebuild penuh (backfill + koreksi nightly) ----
+CREATE OR REPLACE FUNCTION rollup_rebuild()
+RETURNS void LANGUAGE plpgsql AS $$
+BEGIN
+    -- tahan write sebentar supaya delta trigger tidak hilang di tengah rebuild
+    LOCK TABLE customer_invoices, payments IN SHARE MODE;
+
+    DELETE FROM invoice_daily_rollup;
+    INSERT INTO invoice_daily_rollup (reseller_id, day, status, invoice_count, amount, payments_amount)
+    SELECT ci.reseller_id, ci.period_start, COALESCE(ci.status, ''),
+           COUNT(*), COALESCE(SUM(ci.amount), 0), COALESCE(SUM(pp.paid), 0)
+    FROM customer_invoices ci
+    LEFT JOIN (
+        SELECT invoice_id, SUM(amount) AS paid
+        FROM payments
+        WHERE status = 'success'
+        GROUP BY invoice_id
+    ) pp ON pp.invoice_id = ci.id
+    WHERE ci.reseller_id IS NOT NULL AND ci.period_start IS NOT NULL
+    GROUP BY 1, 2, 3;
+
+    DELETE FROM payment_daily_rollup;
+    INSERT INTO payment_daily_rollup (reseller_id, day, method, status, payment_count, amount)
+    SELECT ci.reseller_id, (p.created_at AT TIME ZONE 'Asia/Jakarta')::date,
+           COALESCE(p.method, ''), COALESCE(p.status, ''),
+           COUNT(*), COALESCE(SUM(p.amount), 0)
+    FROM payments p
+    JOIN customer_invoices ci ON ci.id = p.invoice_id
+    WHERE p.created_at IS NOT NULL
+    GROUP BY 1, 2, 3, 4;
+END;
+$$;
+
+SELECT rollup_rebuild();
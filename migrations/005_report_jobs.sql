@@ -0,0 +1,17 @@
+-- Antrian report berat (admin), dihitung worker job_run_report_jobs di luar request path.
+CREATE TABLE IF NOT EXISTS report_jobs (
+    id           BIGSERIAL PRIMARY KEY,
+    kind         TEXT NOT NULL,                    -- lihat app/report_jobs.py REPORT_KINDS
+    params       JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status       TEXT NOT NULL DEFAULT 'queued',   -- queued / running / done / failed
+    attempts     INT NOT NULL DEFAULT 0,
+    result       JSONB,
+    error        TEXT,
+    created_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at   TIMESTAMPTZ,
+    finished_at  TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS report_jobs_pending_idx
+    ON report_jobs (id)
+    WHERE status IN ('queued', 'running');
@@ -0,0 +1,12 @@
+-- Token JWT yang di-revoke lewat /auth/logout (by jti). Dicerminkan ke memory
+-- tiap API process (app/revocation.py), sinkron lewat NOTIFY token_revoked.
+-- Row kedaluwarsa dihapus worker job_purge_revoked_tokens.
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti          TEXT PRIMARY KEY,
+    reseller_id  UUID,
+    expires_at   TIMESTAMPTZ NOT NULL,
+    revoked_at   TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS revoked_tokens_expires_at_idx
+    ON revoked_tokens (expires_at);
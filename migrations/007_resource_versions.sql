@@ -0,0 +1,48 @@
+-- Versi per (reseller, resource) untuk ETag list endpoint (/profiles, /reseller-invoices/me).
+-- Dinaikkan trigger di setiap write, lalu pg_notify('resource_version', reseller_id)
+-- supaya cache versi di tiap API process (app/cache.py) ikut dibuang.
+CREATE TABLE IF NOT EXISTS resource_versions (
+    reseller_id  UUID NOT NULL,
+    resource     TEXT NOT NULL,
+    version      BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (reseller_id, resource)
+);
+
+CREATE OR REPLACE FUNCTION resource_version_bump(p_reseller UUID, p_resource TEXT)
+RETURNS void LANGUAGE plpgsql AS $$
+BEGIN
+    IF p_reseller IS NULL THEN
+        RETURN;
+    END IF;
+    INSERT INTO resource_versions (reseller_id, resource, version)
+    VALUES (p_reseller, p_resource, 1)
+    ON CONFLICT (reseller_id, resource) DO UPDATE
+    SET version = resource_versions.version + 1;
+    PERFORM pg_notify('resource_version', p_reseller::text);
+END;
+$$;
+
+-- TG_ARGV[0] = nama resource
+CREATE OR REPLACE FUNCTION trg_resource_version()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM resource_version_bump(OLD.reseller_id, TG_ARGV[0]);
+    END IF;
+    IF TG_OP = 'INSERT'
+       OR (TG_OP = 'UPDATE' AND NEW.reseller_id IS DISTINCT FROM OLD.reseller_id) THEN
+        PERFORM resource_version_bump(NEW.reseller_id, TG_ARGV[0]);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS ppp_profiles_resource_version ON ppp_profiles;
+CREATE TRIGGER ppp_profiles_resource_version
+    AFTER INSERT OR UPDATE OR DELETE ON ppp_profiles
+    FOR EACH ROW EXECUTE FUNCTION trg_resource_version('profiles');
+
+DROP TRIGGER IF EXISTS invoices_resource_version ON invoices;
+CREATE TRIGGER invoices_resource_version
+    AFTER INSERT OR UPDATE OR DELETE ON invoices
+    FOR EACH ROW EXECUTE FUNCTION trg_resource_version('reseller_invoices');
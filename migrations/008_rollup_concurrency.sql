@@ -0,0 +1,240 @@
+-- Perbaikan konkurensi rollup harian (004).
+--
+-- rollup_invoice_refresh menghitung ulang satu bucket lalu upsert. Di READ
+-- COMMITTED dua transaksi yang mengubah invoice di bucket yang sama bisa
+-- saling tidak melihat row yang belum commit, dan yang commit terakhir
+-- menimpa hitungan yang lain. Sekarang tiap bucket dikunci (advisory lock
+-- level transaksi) sebelum dihitung ulang: transaksi kedua menunggu yang
+-- pertama commit, lalu hitungannya (snapshot baru per statement) sudah
+-- melihat row tersebut.
+--
+-- Urutan kunci supaya tidak deadlock: bucket invoice dulu, baru bucket
+-- payment; dua bucket invoice (UPDATE pindah bucket) dari key terkecil.
+--
+-- Hari bucket payment mengikuti GUC app.timezone, di-set app per koneksi pool
+-- dari settings.TIMEZONE (app/db.py). Client lain (psql, script) memakai
+-- default database: ALTER DATABASE <db> SET app.timezone = '<TIMEZONE>'.
+
+CREATE OR REPLACE FUNCTION rollup_tz()
+RETURNS TEXT LANGUAGE sql STABLE AS $$
+    SELECT COALESCE(NULLIF(current_setting('app.timezone', true), ''), 'Asia/Jakarta')
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_lock_key(p_kind TEXT, p_reseller UUID, p_day DATE, p_key TEXT)
+RETURNS BIGINT LANGUAGE sql IMMUTABLE AS $$
+    SELECT hashtextextended(p_kind || ':' || p_reseller || ':' || p_day || ':' || COALESCE(p_key, ''), 0)
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_invoice_refresh(p_reseller UUID, p_day DATE, p_status TEXT)
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    v_count BIGINT;
+    v_amount NUMERIC;
+    v_paid NUMERIC;
+BEGIN
+    IF p_reseller IS NULL OR p_day IS NULL THEN
+        RETURN;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock(rollup_lock_key('inv', p_reseller, p_day, p_status));
+
+    SELECT COUNT(*), COALESCE(SUM(ci.amount), 0), COALESCE(SUM(pp.paid), 0)
+    INTO v_count, v_amount, v_paid
+    FROM customer_invoices ci
+    LEFT JOIN LATERAL (
+        SELECT SUM(p.amount) AS paid
+        FROM payments p
+        WHERE p.invoice_id = ci.id AND p.status = 'success'
+    ) pp ON true
+    WHERE ci.reseller_id = p_reseller
+      AND ci.period_start = p_day
+      AND COALESCE(ci.status, '') = COALESCE(p_status, '');
+
+    IF v_count = 0 THEN
+        DELETE FROM invoice_daily_rollup
+        WHERE reseller_id = p_reseller AND day = p_day AND status = COALESCE(p_status, '');
+    ELSE
+        INSERT INTO invoice_daily_rollup (reseller_id, day, status, invoice_count, amount, payments_amount)
+        VALUES (p_reseller, p_day, COALESCE(p_status, ''), v_count, v_amount, v_paid)
+        ON CONFLICT (reseller_id, day, status) DO UPDATE
+        SET invoice_count = EXCLUDED.invoice_count,
+            amount = EXCLUDED.amount,
+            payments_amount = EXCLUDED.payments_amount;
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_payment_add(
+    p_reseller UUID, p_ts TIMESTAMPTZ, p_method TEXT, p_status TEXT, p_count BIGINT, p_amount NUMERIC
+) RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    v_day DATE;
+BEGIN
+    IF p_reseller IS NULL OR p_ts IS NULL THEN
+        RETURN;
+    END IF;
+    v_day := (p_ts AT TIME ZONE rollup_tz())::date;
+    -- delta sudah atomik; kunci untuk serialisasi dengan rebuild bucket yang sama
+    PERFORM pg_advisory_xact_lock(
+        rollup_lock_key('pay', p_reseller, v_day, COALESCE(p_method, '') || ':' || COALESCE(p_status, ''))
+    );
+    INSERT INTO payment_daily_rollup (reseller_id, day, method, status, payment_count, amount)
+    VALUES (p_reseller, v_day, COALESCE(p_method, ''), COALESCE(p_status, ''), p_count, COALESCE(p_amount, 0))
+    ON CONFLICT (reseller_id, day, method, status) DO UPDATE
+    SET payment_count = payment_daily_rollup.payment_count + EXCLUDED.payment_count,
+        amount = payment_daily_rollup.amount + EXCLUDED.amount;
+END;
+$$;
+
+-- ---- Trigger customer_invoices ----
+CREATE OR REPLACE FUNCTION trg_customer_invoices_rollup()
+RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    k_old BIGINT;
+    k_new BIGINT;
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.reseller_id IS NOT DISTINCT FROM NEW.reseller_id
+       AND OLD.period_start IS NOT DISTINCT FROM NEW.period_start
+       AND OLD.status IS NOT DISTINCT FROM NEW.status
+       AND OLD.amount IS NOT DISTINCT FROM NEW.amount THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND OLD.reseller_id IS NOT NULL AND OLD.period_start IS NOT NULL
+       AND NEW.reseller_id IS NOT NULL AND NEW.period_start IS NOT NULL THEN
+        -- pindah bucket (unpaid → paid): kunci keduanya dengan urutan tetap
+        k_old := rollup_lock_key('inv', OLD.reseller_id, OLD.period_start, OLD.status);
+        k_new := rollup_lock_key('inv', NEW.reseller_id, NEW.period_start, NEW.status);
+        PERFORM pg_advisory_xact_lock(LEAST(k_old, k_new));
+        PERFORM pg_advisory_xact_lock(GREATEST(k_old, k_new));
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_invoice_refresh(OLD.reseller_id, OLD.period_start, OLD.status);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rollup_invoice_refresh(NEW.reseller_id, NEW.period_start, NEW.status);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- ---- Trigger payments ----
+-- bucket invoice di-refresh (dan dikunci) sebelum delta bucket payment
+CREATE OR REPLACE FUNCTION trg_payments_rollup()
+RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    inv RECORD;
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.invoice_id IS NOT DISTINCT FROM NEW.invoice_id
+       AND OLD.created_at IS NOT DISTINCT FROM NEW.created_at
+       AND OLD.method IS NOT DISTINCT FROM NEW.method
+       AND OLD.status IS NOT DISTINCT FROM NEW.status
+       AND OLD.amount IS NOT DISTINCT FROM NEW.amount THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT reseller_id, period_start, status INTO inv
+        FROM customer_invoices WHERE id = OLD.invoice_id;
+        IF FOUND THEN
+            PERFORM rollup_invoice_refresh(inv.reseller_id, inv.period_start, inv.status);
+            PERFORM rollup_payment_add(inv.reseller_id, OLD.created_at, OLD.method, OLD.status, -1, -OLD.amount);
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT reseller_id, period_start, status INTO inv
+        FROM customer_invoices WHERE id = NEW.invoice_id;
+        IF FOUND THEN
+            PERFORM rollup_invoice_refresh(inv.reseller_id, inv.period_start, inv.status);
+            PERFORM rollup_payment_add(inv.reseller_id, NEW.created_at, NEW.method, NEW.status, 1, NEW.amount);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- ---- Rebuild per bucket (pengganti rollup_rebuild() dari 004) ----
+-- rollup_rebuild() mengunci customer_invoices & payments IN SHARE MODE selama
+-- rebuild penuh → semua write (settle, webhook) tertahan. Sekarang tiap bucket
+-- dihitung ulang dengan kunci bucket-nya saja dan di-commit sendiri-sendiri,
+-- jadi write hanya menunggu satu bucket yang sedang dihitung.
+
+CREATE OR REPLACE FUNCTION rollup_payment_refresh(p_reseller UUID, p_day DATE, p_method TEXT, p_status TEXT)
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    v_count BIGINT;
+    v_amount NUMERIC;
+BEGIN
+    IF p_reseller IS NULL OR p_day IS NULL THEN
+        RETURN;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock(
+        rollup_lock_key('pay', p_reseller, p_day, COALESCE(p_method, '') || ':' || COALESCE(p_status, ''))
+    );
+
+    SELECT COUNT(*), COALESCE(SUM(p.amount), 0)
+    INTO v_count, v_amount
+    FROM payments p
+    JOIN customer_invoices ci ON ci.id = p.invoice_id
+    WHERE ci.reseller_id = p_reseller
+      AND p.created_at >= (p_day::timestamp AT TIME ZONE rollup_tz())
+      AND p.created_at < ((p_day + 1)::timestamp AT TIME ZONE rollup_tz())
+      AND COALESCE(p.method, '') = COALESCE(p_method, '')
+      AND COALESCE(p.status, '') = COALESCE(p_status, '');
+
+    IF v_count = 0 THEN
+        DELETE FROM payment_daily_rollup
+        WHERE reseller_id = p_reseller AND day = p_day
+          AND method = COALESCE(p_method, '') AND status = COALESCE(p_status, '');
+    ELSE
+        INSERT INTO payment_daily_rollup (reseller_id, day, method, status, payment_count, amount)
+        VALUES (p_reseller, p_day, COALESCE(p_method, ''), COALESCE(p_status, ''), v_count, v_amount)
+        ON CONFLICT (reseller_id, day, method, status) DO UPDATE
+        SET payment_count = EXCLUDED.payment_count,
+            amount = EXCLUDED.amount;
+    END IF;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS rollup_rebuild();
+
+-- CALL di luar transaksi (autocommit): COMMIT per bucket, tiap transaksi
+-- hanya memegang satu kunci bucket sehingga tidak bisa deadlock dengan trigger.
+CREATE OR REPLACE PROCEDURE rollup_rebuild_buckets()
+LANGUAGE plpgsql AS $$
+DECLARE
+    b RECORD;
+BEGIN
+    -- bucket dari tabel dasar + bucket rollup lama yang mungkin sudah tidak ada datanya
+    FOR b IN
+        SELECT reseller_id, period_start AS day, COALESCE(status, '') AS status
+        FROM customer_invoices
+        WHERE reseller_id IS NOT NULL AND period_start IS NOT NULL
+        UNION
+        SELECT reseller_id, day, status FROM invoice_daily_rollup
+    LOOP
+        -- rollup bisa dihitung ulang kapan saja, tidak perlu menunggu flush WAL per bucket
+        PERFORM set_config('synchronous_commit', 'off', true);
+        PERFORM rollup_invoice_refresh(b.reseller_id, b.day, b.status);
+        COMMIT;
+    END LOOP;
+
+    FOR b IN
+        SELECT ci.reseller_id, (p.created_at AT TIME ZONE rollup_tz())::date AS day,
+               COALESCE(p.method, '') AS method, COALESCE(p.status, '') AS status
+        FROM payments p
+        JOIN customer_invoices ci ON ci.id = p.invoice_id
+        WHERE p.created_at IS NOT NULL AND ci.reseller_id IS NOT NULL
+        UNION
+        SELECT reseller_id, day, method, status FROM payment_daily_rollup
+    LOOP
+        PERFORM set_config('synchronous_commit', 'off', true);
+        PERFORM rollup_payment_refresh(b.reseller_id, b.day, b.method, b.status);
+        COMMIT;
+    END LOOP;
+END;
+$$;
@@ -0,0 +1,50 @@
+-- Invalidasi cache bulan tutup /reports/timeseries (closed_month_cache di
+-- app/cache.py). Bulan lama masih bisa berubah, mis. invoice periode lama
+-- baru dibayar. Setiap perubahan bucket rollup di bulan yang sudah tutup
+-- mengirim NOTIFY report_closed_months dengan namespace cache
+-- '<reseller_id>:YYYY-MM' dan 'admin:YYYY-MM'. Bucket bulan berjalan tidak
+-- di-cache, jadi tidak perlu NOTIFY.
+
+CREATE OR REPLACE FUNCTION rollup_closed_month_notify(p_reseller UUID, p_day DATE)
+RETURNS void LANGUAGE plpgsql AS $$
+BEGIN
+    IF p_day < date_trunc('month', now() AT TIME ZONE rollup_tz())::date THEN
+        PERFORM pg_notify('report_closed_months', p_reseller || ':' || to_char(p_day, 'YYYY-MM'));
+        PERFORM pg_notify('report_closed_months', 'admin:' || to_char(p_day, 'YYYY-MM'));
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION trg_rollup_closed_month_notify()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_closed_month_notify(OLD.reseller_id, OLD.day);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rollup_closed_month_notify(NEW.reseller_id, NEW.day);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- UPDATE tanpa perubahan nilai (refresh/rebuild yang hasilnya sama) tidak NOTIFY
+DROP TRIGGER IF EXISTS invoice_daily_rollup_closed_month ON invoice_daily_rollup;
+CREATE TRIGGER invoice_daily_rollup_closed_month
+    AFTER INSERT OR DELETE ON invoice_daily_rollup
+    FOR EACH ROW EXECUTE FUNCTION trg_rollup_closed_month_notify();
+DROP TRIGGER IF EXISTS invoice_daily_rollup_closed_month_upd ON invoice_daily_rollup;
+CREATE TRIGGER invoice_daily_rollup_closed_month_upd
+    AFTER UPDATE ON invoice_daily_rollup
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION trg_rollup_closed_month_notify();
+
+DROP TRIGGER IF EXISTS payment_daily_rollup_closed_month ON payment_daily_rollup;
+CREATE TRIGGER payment_daily_rollup_closed_month
+    AFTER INSERT OR DELETE ON payment_daily_rollup
+    FOR EACH ROW EXECUTE FUNCTION trg_rollup_closed_month_notify();
+DROP TRIGGER IF EXISTS payment_daily_rollup_closed_month_upd ON payment_daily_rollup;
+CREATE TRIGGER payment_daily_rollup_closed_month_upd
+    AFTER UPDATE ON payment_daily_rollup
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION trg_rollup_closed_month_notify();
@@ -0,0 +1,40 @@
+-- Event suspend user untuk metric "suspensions" /reports/timeseries.
+-- Sebelumnya dihitung dari user yang *sekarang* suspended menurut updated_at:
+-- user yang sudah aktif lagi hilang dari bulan suspend-nya, dan edit apa pun
+-- memindahkan user ke bulan lain. Trigger mencatat setiap transisi ke
+-- 'suspended' (job_suspend_overdue_users, PATCH /users/{id}/status, PUT /users/{id}).
+CREATE TABLE IF NOT EXISTS user_suspensions (
+    id           BIGSERIAL PRIMARY KEY,
+    reseller_id  UUID NOT NULL,
+    user_id      UUID NOT NULL,
+    suspended_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS user_suspensions_reseller_at_idx
+    ON user_suspensions (reseller_id, suspended_at);
+CREATE INDEX IF NOT EXISTS user_suspensions_at_idx
+    ON user_suspensions (suspended_at);
+
+CREATE OR REPLACE FUNCTION trg_ppp_users_suspension()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.reseller_id IS NOT NULL THEN
+        INSERT INTO user_suspensions (reseller_id, user_id) VALUES (NEW.reseller_id, NEW.id);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS ppp_users_suspension ON ppp_users;
+CREATE TRIGGER ppp_users_suspension
+    AFTER UPDATE OF status ON ppp_users
+    FOR EACH ROW
+    WHEN (NEW.status = 'suspended' AND OLD.status IS DISTINCT FROM 'suspended')
+    EXECUTE FUNCTION trg_ppp_users_suspension();
+
+-- backfill: user yang sedang suspended, waktu suspend didekati dengan updated_at
+INSERT INTO user_suspensions (reseller_id, user_id, suspended_at)
+SELECT u.reseller_id, u.id, COALESCE(u.updated_at, u.created_at, now())
+FROM ppp_users u
+WHERE u.status = 'suspended' AND u.reseller_id IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM user_suspensions s WHERE s.user_id = u.id);
@@ -0,0 +1,19 @@
+-- Keyset pagination sekarang mengurutkan COALESCE(created_at, '-infinity')
+-- supaya row dengan created_at NULL tidak hilang dari halaman (app/utils.py
+-- cursor_keyset). Index 003 diganti index ekspresi yang sama.
+CREATE INDEX IF NOT EXISTS resellers_keyset_idx
+    ON resellers ((COALESCE(created_at, '-infinity'::timestamptz)) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS ppp_users_keyset_idx
+    ON ppp_users ((COALESCE(created_at, '-infinity'::timestamptz)) DESC, id DESC) WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS customer_invoices_keyset_idx
+    ON customer_invoices ((COALESCE(created_at, '-infinity'::timestamptz)) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS invoices_keyset_idx
+    ON invoices ((COALESCE(created_at, '-infinity'::timestamptz)) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS payments_keyset_idx
+    ON payments ((COALESCE(created_at, '-infinity'::timestamptz)) DESC, id DESC);
+
+DROP INDEX IF EXISTS resellers_created_at_id_idx;
+DROP INDEX IF EXISTS ppp_users_created_at_id_idx;
+DROP INDEX IF EXISTS customer_invoices_created_at_id_idx;
+DROP INDEX IF EXISTS invoices_created_at_id_idx;
+DROP INDEX IF EXISTS payments_created_at_id_idx;
@@ -0,0 +1,21 @@
+-- Idempotensi settle_customer_invoice di bawah konkurensi. Dua callback
+-- dengan provider_txn_id sama yang datang bersamaan (retry gateway, dua worker
+-- inbox) sama-sama tidak melihat payment lain di snapshot-nya, lalu
+-- masing-masing insert. Index unik ini jadi penjaganya: pay_ins memakai
+-- ON CONFLICT DO NOTHING, invoice dikunci FOR UPDATE di CTE cur.
+
+-- duplikat lama: sisakan satu row per (invoice, txn), utamakan yang success
+DELETE FROM payments p
+USING (
+    SELECT id, row_number() OVER (
+        PARTITION BY invoice_id, provider_txn_id
+        ORDER BY (status = 'success') IS TRUE DESC, id
+    ) AS rn
+    FROM payments
+    WHERE provider_txn_id IS NOT NULL
+) d
+WHERE p.id = d.id AND d.rn > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS payments_invoice_txn_uniq
+    ON payments (invoice_id, provider_txn_id)
+    WHERE provider_txn_id IS NOT NULL;
@@ -0,0 +1,264 @@
+-- invoice_daily_rollup dijaga dengan delta per invoice, seperti payment_daily_rollup.
+--
+-- Sebelumnya (008) setiap write invoice atau payment menghitung ulang seluruh
+-- bucket (reseller, period_start, status) termasuk LATERAL ke payments, di bawah
+-- kunci bucket. Bucket bulan berjalan berisi semua invoice periode itu, jadi
+-- biaya per write ikut tumbuh dengan ukuran bucket (kuadratik untuk job generate
+-- invoice) dan write lain di bucket yang sama menunggu selama recount.
+--
+-- Sekarang tiap invoice menyumbang satu row di invoice_rollup_state (bucket,
+-- amount, total payment success yang sedang dihitung di rollup). Trigger
+-- invoice/payment memanggil rollup_invoice_sync: kurangi sumbangan lama, tambah
+-- sumbangan baru. Tidak bisa langsung memakai OLD/NEW trigger payment: CTE
+-- settle (app/billing.py) mengubah invoice dan payment-nya dalam satu statement
+-- dan trigger keduanya melihat hasil akhir, sehingga payment baru akan
+-- terhitung dua kali. Sync membandingkan dengan sumbangan tersimpan jadi aman
+-- dipanggil berkali-kali.
+--
+-- rollup_invoice_refresh tetap dipakai rollup_rebuild_buckets() (koreksi nightly).
+
+CREATE TABLE IF NOT EXISTS invoice_rollup_state (
+    invoice_id  UUID PRIMARY KEY,
+    reseller_id UUID,
+    day         DATE,
+    status      TEXT NOT NULL,
+    amount      NUMERIC NOT NULL,
+    paid        NUMERIC NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION rollup_invoice_add(
+    p_reseller UUID, p_day DATE, p_status TEXT, p_count BIGINT, p_amount NUMERIC, p_paid NUMERIC
+) RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    v_count BIGINT;
+BEGIN
+    IF p_reseller IS NULL OR p_day IS NULL THEN
+        RETURN;
+    END IF;
+    -- delta sudah atomik; kunci untuk serialisasi dengan rebuild bucket yang sama
+    PERFORM pg_advisory_xact_lock(rollup_lock_key('inv', p_reseller, p_day, p_status));
+    INSERT INTO invoice_daily_rollup (reseller_id, day, status, invoice_count, amount, payments_amount)
+    VALUES (p_reseller, p_day, COALESCE(p_status, ''), p_count, COALESCE(p_amount, 0), COALESCE(p_paid, 0))
+    ON CONFLICT (reseller_id, day, status) DO UPDATE
+    SET invoice_count = invoice_daily_rollup.invoice_count + EXCLUDED.invoice_count,
+        amount = invoice_daily_rollup.amount + EXCLUDED.amount,
+        payments_amount = invoice_daily_rollup.payments_amount + EXCLUDED.payments_amount
+    RETURNING invoice_count INTO v_count;
+
+    -- bucket kosong dihapus, sama seperti hasil rollup_invoice_refresh
+    IF v_count = 0 THEN
+        DELETE FROM invoice_daily_rollup
+        WHERE reseller_id = p_reseller AND day = p_day AND status = COALESCE(p_status, '');
+    END IF;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION rollup_invoice_sync(p_invoice UUID)
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    s invoice_rollup_state%ROWTYPE;
+    has_old BOOLEAN;
+    has_new BOOLEAN;
+    v_reseller UUID;
+    v_day DATE;
+    v_status TEXT;
+    v_amount NUMERIC;
+    v_paid NUMERIC := 0;
+    k_old BIGINT;
+    k_new BIGINT;
+BEGIN
+    IF p_invoice IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- kunci per invoice: sync dari transaksi lain menunggu, lalu membaca ulang
+    -- invoice & payments dengan snapshot baru
+    SELECT * INTO s FROM invoice_rollup_state WHERE invoice_id = p_invoice FOR UPDATE;
+    has_old := FOUND;
+
+    SELECT reseller_id, period_start, COALESCE(status, ''), COALESCE(amount, 0)
+    INTO v_reseller, v_day, v_status, v_amount
+    FROM customer_invoices WHERE id = p_invoice;
+    has_new := FOUND;
+    IF has_new THEN
+        SELECT COALESCE(SUM(p.amount), 0) INTO v_paid
+        FROM payments p
+        WHERE p.invoice_id = p_invoice AND p.status = 'success';
+    END IF;
+
+    IF has_old AND has_new
+       AND s.reseller_id IS NOT DISTINCT FROM v_reseller
+       AND s.day IS NOT DISTINCT FROM v_day
+       AND s.status = v_status THEN
+        -- bucket sama: cukup selisih amount / payment
+        IF s.amount <> v_amount OR s.paid <> v_paid THEN
+            PERFORM rollup_invoice_add(v_reseller, v_day, v_status, 0, v_amount - s.amount, v_paid - s.paid);
+            UPDATE invoice_rollup_state SET amount = v_amount, paid = v_paid WHERE invoice_id = p_invoice;
+        END IF;
+        RETURN;
+    END IF;
+
+    IF has_old AND has_new THEN
+        -- pindah bucket (unpaid → paid): kunci keduanya dengan urutan tetap
+        k_old := rollup_lock_key('inv', s.reseller_id, s.day, s.status);
+        k_new := rollup_lock_key('inv', v_reseller, v_day, v_status);
+        PERFORM pg_advisory_xact_lock(LEAST(k_old, k_new));
+        PERFORM pg_advisory_xact_lock(GREATEST(k_old, k_new));
+    END IF;
+
+    IF has_old THEN
+        PERFORM rollup_invoice_add(s.reseller_id, s.day, s.status, -1, -s.amount, -s.paid);
+    END IF;
+    IF has_new THEN
+        PERFORM rollup_invoice_add(v_reseller, v_day, v_status, 1, v_amount, v_paid);
+        INSERT INTO invoice_rollup_state (invoice_id, reseller_id, day, status, amount, paid)
+        VALUES (p_invoice, v_reseller, v_day, v_status, v_amount, v_paid)
+        ON CONFLICT (invoice_id) DO UPDATE
+        SET reseller_id = EXCLUDED.reseller_id,
+            day = EXCLUDED.day,
+            status = EXCLUDED.status,
+            amount = EXCLUDED.amount,
+            paid = EXCLUDED.paid;
+    ELSE
+        DELETE FROM invoice_rollup_state WHERE invoice_id = p_invoice;
+    END IF;
+END;
+$$;
+
+-- ---- Trigger customer_invoices ----
+CREATE OR REPLACE FUNCTION trg_customer_invoices_rollup()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.id IS NOT DISTINCT FROM NEW.id
+       AND OLD.reseller_id IS NOT DISTINCT FROM NEW.reseller_id
+       AND OLD.period_start IS NOT DISTINCT FROM NEW.period_start
+       AND OLD.status IS NOT DISTINCT FROM NEW.status
+       AND OLD.amount IS NOT DISTINCT FROM NEW.amount THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_invoice_sync(OLD.id);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.id IS DISTINCT FROM OLD.id) THEN
+        PERFORM rollup_invoice_sync(NEW.id);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- ---- Trigger payments ----
+-- sync invoice (kunci invoice + bucket invoice) dulu, baru delta bucket payment.
+-- Payment non-success tidak mengubah payments_amount, jadi tidak perlu sync.
+CREATE OR REPLACE FUNCTION trg_payments_rollup()
+RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    v_reseller UUID;
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.invoice_id IS NOT DISTINCT FROM NEW.invoice_id
+       AND OLD.created_at IS NOT DISTINCT FROM NEW.created_at
+       AND OLD.method IS NOT DISTINCT FROM NEW.method
+       AND OLD.status IS NOT DISTINCT FROM NEW.status
+       AND OLD.amount IS NOT DISTINCT FROM NEW.amount THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF OLD.status = 'success' THEN
+            PERFORM rollup_invoice_sync(OLD.invoice_id);
+        END IF;
+        SELECT reseller_id INTO v_reseller FROM customer_invoices WHERE id = OLD.invoice_id;
+        IF FOUND THEN
+            PERFORM rollup_payment_add(v_reseller, OLD.created_at, OLD.method, OLD.status, -1, -OLD.amount);
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        IF NEW.status = 'success'
+           AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'success'
+                OR NEW.invoice_id IS DISTINCT FROM OLD.invoice_id) THEN
+            PERFORM rollup_invoice_sync(NEW.invoice_id);
+        END IF;
+        SELECT reseller_id INTO v_reseller FROM customer_invoices WHERE id = NEW.invoice_id;
+        IF FOUND THEN
+            PERFORM rollup_payment_add(v_reseller, NEW.created_at, NEW.method, NEW.status, 1, NEW.amount);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- sumbangan awal tiap invoice = hitungan bucket yang sudah ada (dijaga recount 008)
+INSERT INTO invoice_rollup_state (invoice_id, reseller_id, day, status, amount, paid)
+SELECT ci.id, ci.reseller_id, ci.period_start, COALESCE(ci.status, ''), COALESCE(ci.amount, 0),
+       COALESCE(pp.paid, 0)
+FROM customer_invoices ci
+LEFT JOIN (
+    SELECT invoice_id, SUM(amount) AS paid
+    FROM payments
+    WHERE status = 'success'
+    GROUP BY invoice_id
+) pp ON pp.invoice_id = ci.id
+ON CONFLICT (invoice_id) DO NOTHING;
+
+-- ---- Rebuild ----
+-- sama seperti 008, ditambah koreksi invoice_rollup_state yang menyimpang dari
+-- tabel dasar (biasanya kosong) sebelum bucket dihitung ulang
+CREATE OR REPLACE PROCEDURE rollup_rebuild_buckets()
+LANGUAGE plpgsql AS $$
+DECLARE
+    b RECORD;
+BEGIN
+    FOR b IN
+        WITH truth AS (
+            SELECT ci.id, ci.reseller_id, ci.period_start AS day, COALESCE(ci.status, '') AS status,
+                   COALESCE(ci.amount, 0) AS amount, COALESCE(pp.paid, 0) AS paid
+            FROM customer_invoices ci
+            LEFT JOIN (
+                SELECT invoice_id, SUM(amount) AS paid
+                FROM payments
+                WHERE status = 'success'
+                GROUP BY invoice_id
+            ) pp ON pp.invoice_id = ci.id
+        )
+        SELECT COALESCE(t.id, s.invoice_id) AS invoice_id
+        FROM truth t
+        FULL JOIN invoice_rollup_state s ON s.invoice_id = t.id
+        WHERE (t.reseller_id, t.day, t.status, t.amount, t.paid)
+              IS DISTINCT FROM (s.reseller_id, s.day, s.status, s.amount, s.paid)
+    LOOP
+        PERFORM set_config('synchronous_commit', 'off', true);
+        PERFORM rollup_invoice_sync(b.invoice_id);
+        COMMIT;
+    END LOOP;
+
+    -- bucket dari tabel dasar + bucket rollup lama yang mungkin sudah tidak ada datanya
+    FOR b IN
+        SELECT reseller_id, period_start AS day, COALESCE(status, '') AS status
+        FROM customer_invoices
+        WHERE reseller_id IS NOT NULL AND period_start IS NOT NULL
+        UNION
+        SELECT reseller_id, day, status FROM invoice_daily_rollup
+    LOOP
+        -- rollup bisa dihitung ulang kapan saja, tidak perlu menunggu flush WAL per bucket
+        PERFORM set_config('synchronous_commit', 'off', true);
+        PERFORM rollup_invoice_refresh(b.reseller_id, b.day, b.status);
+        COMMIT;
+    END LOOP;
+
+    FOR b IN
+        SELECT ci.reseller_id, (p.created_at AT TIME ZONE rollup_tz())::date AS day,
+               COALESCE(p.method, '') AS method, COALESCE(p.status, '') AS status
+        FROM payments p
+        JOIN customer_invoices ci ON ci.id = p.invoice_id
+        WHERE p.created_at IS NOT NULL AND ci.reseller_id IS NOT NULL
+        UNION
+        SELECT reseller_id, day, method, status FROM payment_daily_rollup
+    LOOP
+        PERFORM set_config('synchronous_commit', 'off', true);
+        PERFORM rollup_payment_refresh(b.reseller_id, b.day, b.method, b.status);
+        COMMIT;
+    END LOOP;
+END;
+$$;
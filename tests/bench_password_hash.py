@@ -0,0 +1,91 @@
+"""
+Simulasi lonjakan login: N verifikasi bcrypt bersamaan, dipanggil langsung di
+event loop (alur lama) vs verify_password_async (thread pool + semaphore di
+app/utils.py). Dilaporkan latensi login p50/p99, lag event loop selama
+lonjakan, dan jumlah PasswordHashBusy (dibalas 429 oleh /auth/login).
+
+    python tests/bench_password_hash.py [jumlah_login]
+
+Tidak butuh database. Ukuran pool & antrian mengikuti PASSWORD_HASH_THREADS,
+PASSWORD_HASH_QUEUE dan PASSWORD_HASH_TIMEOUT dari environment.
+"""
+import asyncio
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import conftest  # noqa: F401  (env settings)
+from app.config import get_settings
+from app.utils import PasswordHashBusy, hash_password, verify_password, verify_password_async
+
+settings = get_settings()
+LAG_INTERVAL = 0.005
+
+
+async def inline_login(password, hashed):
+    return verify_password(password, hashed)
+
+
+async def pool_login(password, hashed):
+    return await verify_password_async(password, hashed)
+
+
+def quantile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def sample_lag(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(max(time.perf_counter() - start - LAG_INTERVAL, 0.0) * 1000)
+
+
+async def measure(login, n, hashed):
+    timings, busy = [], 0
+
+    async def one():
+        # latensi dihitung dari saat semua login dikirim (termasuk menunggu loop yang terblokir)
+        nonlocal busy
+        try:
+            assert await login("rahasia123", hashed)
+        except PasswordHashBusy:
+            busy += 1
+            return
+        timings.append((time.perf_counter() - start) * 1000)
+
+    lags, stop = [], asyncio.Event()
+    sampler = asyncio.ensure_future(sample_lag(lags, stop))
+    await asyncio.sleep(LAG_INTERVAL * 2)
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    total = time.perf_counter() - start
+    stop.set()
+    await sampler
+    return timings, busy, lags, total
+
+
+async def main(n):
+    hashed = hash_password("rahasia123")
+    print(
+        f"n={n} threads={settings.PASSWORD_HASH_THREADS} queue={settings.PASSWORD_HASH_QUEUE} "
+        f"timeout={settings.PASSWORD_HASH_TIMEOUT}s"
+    )
+    for login in (inline_login, pool_login):
+        timings, busy, lags, total = await measure(login, n, hashed)
+        p50 = statistics.median(timings) if timings else 0.0
+        print(
+            f"{login.__name__:12s} ok={len(timings)} busy={busy} total={total:.2f} s  "
+            f"login p50={p50:.1f} ms p99={quantile(timings, 0.99):.1f} ms  "
+            f"loop lag p99={quantile(lags, 0.99):.1f} ms max={max(lags, default=0.0):.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
@@ -0,0 +1,95 @@
+"""
+Bandingkan biaya serialisasi list besar: JSONResponse default FastAPI
+(validasi response_model pydantic + jsonable_encoder + json.dumps) vs
+trusted_response (proyeksi field + orjson, app/responses.py).
+
+    python tests/bench_responses.py [jumlah_row]
+
+Tidak butuh database: row dibentuk seperti hasil fetch_all customer_invoices.
+Request lewat TestClient, jadi angka sudah termasuk routing & middleware Starlette.
+"""
+import pathlib
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+import pytz
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import conftest  # noqa: F401  (env settings)
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.responses import trusted_response
+from app.routers.invoices import CustomerInvoiceOut
+
+REPEAT = 20
+
+
+def make_rows(n):
+    tz = pytz.timezone("Asia/Jakarta")
+    created = tz.localize(datetime(2024, 2, 1, 8, 30, 15, 123456))
+    reseller_id = str(uuid.uuid4())
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "reseller_id": reseller_id,
+            "user_id": str(uuid.uuid4()),
+            "profile_id": str(uuid.uuid4()),
+            "period_start": date(2024, 2, 1),
+            "period_end": date(2024, 2, 29),
+            "amount": Decimal("150000.00") + i,
+            "status": "paid" if i % 3 else "unpaid",
+            "created_at": created + timedelta(minutes=i),
+            "updated_at": created + timedelta(minutes=i, seconds=5),
+            "paid_at": created + timedelta(hours=1) if i % 3 else None,
+            "meta": {"months": 1, "source": "job"},
+            # kolom ekstra yang tidak ada di model (dibuang oleh kedua jalur)
+            "user_username": f"user{i}",
+        }
+        for i in range(n)
+    ]
+
+
+def build_app(rows):
+    app = FastAPI()
+
+    @app.get("/validated", response_model=List[CustomerInvoiceOut], response_class=JSONResponse)
+    async def validated():
+        return rows
+
+    @app.get("/trusted", response_model=List[CustomerInvoiceOut])
+    async def trusted():
+        return trusted_response(rows, CustomerInvoiceOut)
+
+    return app
+
+
+def measure(client, path):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        resp = client.get(path)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert resp.status_code == 200
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], resp
+
+
+def main(n):
+    client = TestClient(build_app(make_rows(n)))
+    results = {path: measure(client, path) for path in ("/validated", "/trusted")}
+    # output kedua jalur harus sama
+    assert results["/validated"][2].json() == results["/trusted"][2].json()
+    for path, (p50, p95, resp) in results.items():
+        print(f"{path:11s} p50={p50:.2f} ms  p95={p95:.2f} ms  ({n} row, {len(resp.content)} byte)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,85 @@
+"""
+Bandingkan latensi settle invoice: alur lama (6 statement terpisah, seperti
+PUT /invoices/{id}/pay sebelum app/billing.py) vs settle_customer_invoice
+(satu statement CTE).
+
+    TEST_DATABASE_URL=... python tests/bench_settle_invoice.py [jumlah_invoice]
+
+Database test di-reset seperti pytest. Latensi per round trip di sini (socket
+lokal) jauh lebih kecil dari produksi, jadi selisih sebenarnya lebih besar.
+"""
+import asyncio
+import pathlib
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import conftest  # noqa: F401  (env settings + reset schema)
+from app import db
+from app.billing import settle_customer_invoice
+from app.utils import now_tz
+from factories import make_invoice, make_reseller, make_user
+
+
+async def old_flow(invoice_id, reseller_id):
+    invoice = await db.fetch_one(
+        "SELECT * FROM customer_invoices WHERE id=$1 AND reseller_id=$2", (invoice_id, reseller_id)
+    )
+    paid_at = now_tz()
+    await db.execute(
+        "UPDATE customer_invoices SET status='paid', paid_at=$1, updated_at=$2 WHERE id=$3",
+        (paid_at, now_tz(), invoice_id),
+    )
+    user = await db.fetch_one("SELECT id, active_until, phone FROM ppp_users WHERE id=$1", (invoice["user_id"],))
+    current_until = user["active_until"] or invoice["period_start"]
+    new_until = current_until + (invoice["period_end"] - invoice["period_start"]) + timedelta(days=1)
+    await db.execute("UPDATE ppp_users SET active_until=$1 WHERE id=$2", (new_until, user["id"]))
+    await db.execute(
+        """
+        INSERT INTO payments (invoice_id, amount, method, status, paid_at, created_at)
+        VALUES ($1,$2,'manual','success',$3,$4)
+        """,
+        (invoice_id, invoice["amount"], paid_at, now_tz()),
+    )
+    return await db.fetch_one("SELECT * FROM customer_invoices WHERE id=$1", (invoice_id,))
+
+
+async def new_flow(invoice_id, reseller_id):
+    return await settle_customer_invoice(
+        invoice_id, method="manual", reseller_id=reseller_id, record_if_paid=False
+    )
+
+
+async def measure(flow, n):
+    reseller = await make_reseller(f"Bench {flow.__name__}")
+    invoices = []
+    for i in range(n):
+        user = await make_user(reseller["id"], username=f"u{i}")
+        invoices.append((await make_invoice(reseller["id"], user["id"]))["id"])
+    timings = []
+    for invoice_id in invoices:
+        start = time.perf_counter()
+        await flow(invoice_id, reseller["id"])
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+async def main(n):
+    await conftest._reset_schema()
+    await db.connect_db()
+    try:
+        for flow in (old_flow, new_flow):
+            p50, p95 = await measure(flow, n)
+            print(f"{flow.__name__:9s} p50={p50:.3f} ms  p95={p95:.3f} ms  (n={n})")
+    finally:
+        await db.disconnect_db()
+
+
+if __name__ == "__main__":
+    if not conftest.TEST_DATABASE_URL:
+        sys.exit("TEST_DATABASE_URL tidak di-set")
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,148 @@
+"""
+Bandingkan latensi /reports/profiles/summary dan /admin/reports/resellers/summary:
+query join lama (users × invoices, fan-out per profile/reseller) vs bentuk
+sekarang (agregat per subquery / rollup) pada jumlah invoice & payment yang
+makin besar.
+
+    TEST_DATABASE_URL=... python tests/bench_summaries.py [user_per_profile]
+
+Tiap ukuran: database test di-reset seperti pytest, diisi 5 reseller × 4 profile
+× N user, 6 invoice per user (5 paid + payment success, 1 unpaid), lalu tiap
+query dijalankan beberapa kali. Ukuran yang dipakai N/4, N/2 dan N. Cache
+report dikosongkan sebelum tiap panggilan profiles_summary.
+"""
+import asyncio
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import conftest  # noqa: F401  (env settings + reset schema)
+from app import db
+from app.cache import report_cache
+from app.routers.admin import summary_resellers
+from app.routers.reports import profiles_summary
+
+RESELLERS = 5
+PROFILES = 4
+MONTHS = 6
+REPEAT = 10
+
+# bentuk lama (sebelum pre-agregasi), lihat juga tests/test_summaries.py
+OLD_PROFILES_SQL = """
+    SELECT pr.id, pr.name,
+        COUNT(u.id) FILTER (WHERE u.deleted_at IS NULL) AS users_count,
+        COALESCE(SUM(ci.amount) FILTER (WHERE ci.status='paid'),0) AS total_revenue
+    FROM ppp_profiles pr
+    LEFT JOIN ppp_users u ON u.profile_id=pr.id AND u.reseller_id=pr.reseller_id
+    LEFT JOIN customer_invoices ci ON ci.profile_id=pr.id AND ci.reseller_id=pr.reseller_id
+    WHERE pr.reseller_id=$1 AND pr.deleted_at IS NULL
+    GROUP BY pr.id, pr.name
+    ORDER BY pr.name
+"""
+
+OLD_RESELLERS_SQL = """
+    SELECT r.id, r.name,
+        COUNT(u.id) FILTER (WHERE u.deleted_at IS NULL) AS users_count,
+        COUNT(ci.id) FILTER (WHERE ci.status='paid') AS invoices_paid,
+        COALESCE(SUM(ci.amount) FILTER (WHERE ci.status='paid'),0) AS total_revenue
+    FROM resellers r
+    LEFT JOIN ppp_users u ON u.reseller_id=r.id
+    LEFT JOIN customer_invoices ci ON ci.reseller_id=r.id
+    GROUP BY r.id, r.name
+    ORDER BY r.name
+"""
+
+
+async def seed(users_per_profile):
+    await db.execute(
+        """
+        INSERT INTO resellers (name, email, price_per_user)
+        SELECT 'Bench ' || g, 'bench' || g || '@example.com', 5000 FROM generate_series(1, $1) g
+        """,
+        (RESELLERS,),
+    )
+    await db.execute(
+        """
+        INSERT INTO ppp_profiles (reseller_id, name, price)
+        SELECT r.id, g || 'M', 150000 FROM resellers r, generate_series(1, $1) g
+        """,
+        (PROFILES,),
+    )
+    await db.execute(
+        """
+        INSERT INTO ppp_users (reseller_id, username, phone, profile_id, active_until, status)
+        SELECT pr.reseller_id, 'u' || pr.name || '-' || g, '081200000000', pr.id, '2024-01-31', 'active'
+        FROM ppp_profiles pr, generate_series(1, $1) g
+        """,
+        (users_per_profile,),
+    )
+    await db.execute(
+        """
+        INSERT INTO customer_invoices (reseller_id, user_id, profile_id, period_start, period_end, amount, status)
+        SELECT u.reseller_id, u.id, u.profile_id, make_date(2024, m, 1), make_date(2024, m, 28), 150000,
+               CASE WHEN m < $1 THEN 'paid' ELSE 'unpaid' END
+        FROM ppp_users u, generate_series(1, $1) m
+        """,
+        (MONTHS,),
+    )
+    await db.execute(
+        """
+        INSERT INTO payments (invoice_id, amount, method, status, paid_at, created_at)
+        SELECT id, amount, 'duitku', 'success', now(), now() FROM customer_invoices WHERE status='paid'
+        """
+    )
+    await db.execute("ANALYZE")
+    return [r["id"] for r in await db.fetch_all("SELECT id FROM resellers ORDER BY name")]
+
+
+async def timed(fn):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        await fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+async def profiles_new(reseller_ids):
+    for reseller_id in reseller_ids:
+        report_cache.invalidate_local()
+        await profiles_summary(reseller={"reseller_id": reseller_id})
+
+
+async def profiles_old(reseller_ids):
+    for reseller_id in reseller_ids:
+        await db.fetch_all(OLD_PROFILES_SQL, (reseller_id,))
+
+
+async def main(n):
+    for users_per_profile in sorted({max(1, n // 4), max(1, n // 2), n}):
+        await conftest._reset_schema()
+        await db.connect_db()
+        try:
+            reseller_ids = await seed(users_per_profile)
+            counts = await db.fetch_one(
+                "SELECT (SELECT COUNT(*) FROM customer_invoices) AS invoices, (SELECT COUNT(*) FROM payments) AS payments"
+            )
+            print(f"-- {users_per_profile} user/profile: {counts['invoices']} invoice, {counts['payments']} payment")
+            cases = (
+                ("profiles old", lambda: profiles_old(reseller_ids)),
+                ("profiles new", lambda: profiles_new(reseller_ids)),
+                ("resellers old", lambda: db.fetch_all(OLD_RESELLERS_SQL)),
+                ("resellers new", lambda: summary_resellers(admin={"admin": True})),
+            )
+            for name, fn in cases:
+                p50, p95 = await timed(fn)
+                print(f"{name:14s} p50={p50:.3f} ms  p95={p95:.3f} ms")
+        finally:
+            await db.disconnect_db()
+
+
+if __name__ == "__main__":
+    if not conftest.TEST_DATABASE_URL:
+        sys.exit("TEST_DATABASE_URL tidak di-set")
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 40))
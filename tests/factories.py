@@ -0,0 +1,79 @@
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from app.db import fetch_one
+
+
+async def make_reseller(name: str = "Reseller") -> Dict[str, Any]:
+    return await fetch_one(
+        "INSERT INTO resellers (name, email, price_per_user) VALUES ($1, $2, 5000) RETURNING *",
+        (name, f"{name.lower().replace(' ', '')}@example.com"),
+    )
+
+
+async def make_profile(reseller_id: str, name: str = "10M", price: Any = "150000") -> Dict[str, Any]:
+    return await fetch_one(
+        "INSERT INTO ppp_profiles (reseller_id, name, price) VALUES ($1, $2, $3) RETURNING *",
+        (reseller_id, name, Decimal(price)),
+    )
+
+
+async def make_user(
+    reseller_id: str,
+    username: str = "budi",
+    active_until: Optional[date] = date(2024, 1, 31),
+    profile_id: Optional[str] = None,
+    status: str = "active",
+) -> Dict[str, Any]:
+    return await fetch_one(
+        """
+        INSERT INTO ppp_users (reseller_id, username, phone, profile_id, active_until, status)
+        VALUES ($1, $2, '081200000000', $3, $4, $5) RETURNING *
+        """,
+        (reseller_id, username, profile_id, active_until, status),
+    )
+
+
+async def make_invoice(
+    reseller_id: str,
+    user_id: str,
+    amount: Any = "150000",
+    period_start: date = date(2024, 2, 1),
+    period_end: date = date(2024, 2, 29),
+    status: str = "unpaid",
+) -> Dict[str, Any]:
+    return await fetch_one(
+        """
+        INSERT INTO customer_invoices (reseller_id, user_id, period_start, period_end, amount, status)
+        VALUES ($1, $2, $3, $4, $5, $6) RETURNING *
+        """,
+        (reseller_id, user_id, period_start, period_end, Decimal(amount), status),
+    )
+
+
+async def make_payment(
+    invoice_id: str,
+    amount: Any = "150000",
+    method: str = "duitku",
+    status: str = "success",
+    provider_txn_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    return await fetch_one(
+        """
+        INSERT INTO payments (invoice_id, amount, method, provider_txn_id, status, paid_at)
+        VALUES ($1, $2, $3, $4, $5, now()) RETURNING *
+        """,
+        (invoice_id, Decimal(amount), method, provider_txn_id, status),
+    )
+
+
+def api_client(reseller_id: Optional[str] = None):
+    """httpx client ke app (in-process, pool dari fixture `run`), login sebagai reseller_id."""
+    import httpx
+
+    from app.main import app
+    from app.utils import create_access_token
+
+    headers = {"Authorization": f"Bearer {create_access_token(reseller_id)}"} if reseller_id else {}
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test", headers=headers)
@@ -0,0 +1,139 @@
+-- Skema dasar minimal untuk test (tabel inti dikelola di luar repo ini).
+-- Hanya kolom yang dipakai app; migrations/*.sql dijalankan di atasnya.
+CREATE TABLE resellers (
+    id             UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    name           TEXT,
+    company_name   TEXT,
+    email          TEXT UNIQUE,
+    phone          TEXT,
+    alamat         TEXT,
+    logo           TEXT,
+    price_per_user NUMERIC DEFAULT 0,
+    currency       TEXT DEFAULT 'IDR',
+    volume_pricing JSONB,
+    password_hash  TEXT,
+    created_at     TIMESTAMPTZ DEFAULT now(),
+    updated_at     TIMESTAMPTZ
+);
+
+CREATE TABLE ppp_profiles (
+    id                   UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    reseller_id          UUID REFERENCES resellers(id) ON DELETE CASCADE,
+    name                 TEXT,
+    price                NUMERIC,
+    rate_limit_up        TEXT,
+    rate_limit_down      TEXT,
+    burst_limit_up       TEXT,
+    burst_limit_down     TEXT,
+    burst_threshold_up   TEXT,
+    burst_threshold_down TEXT,
+    burst_time_up        TEXT,
+    burst_time_down      TEXT,
+    min_rate_up          TEXT,
+    min_rate_down        TEXT,
+    priority             INT,
+    group_name           TEXT,
+    auto_pool            TEXT,
+    is_active            BOOLEAN DEFAULT true,
+    created_at           TIMESTAMPTZ DEFAULT now(),
+    updated_at           TIMESTAMPTZ,
+    deleted_at           TIMESTAMPTZ
+);
+
+CREATE TABLE ppp_users (
+    id            UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    reseller_id   UUID REFERENCES resellers(id) ON DELETE CASCADE,
+    username      TEXT,
+    password_hash TEXT,
+    full_name     TEXT,
+    phone         TEXT,
+    email         TEXT,
+    alamat        TEXT,
+    profile_id    UUID REFERENCES ppp_profiles(id),
+    status        TEXT DEFAULT 'active',
+    active_until  DATE,
+    is_active     BOOLEAN DEFAULT true,
+    created_at    TIMESTAMPTZ DEFAULT now(),
+    updated_at    TIMESTAMPTZ,
+    deleted_at    TIMESTAMPTZ
+);
+
+CREATE TABLE customer_invoices (
+    id           UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    reseller_id  UUID REFERENCES resellers(id) ON DELETE CASCADE,
+    user_id      UUID REFERENCES ppp_users(id) ON DELETE CASCADE,
+    profile_id   UUID,
+    period_start DATE,
+    period_end   DATE,
+    amount       NUMERIC,
+    status       TEXT,
+    paid_at      TIMESTAMPTZ,
+    meta         JSONB,
+    created_at   TIMESTAMPTZ DEFAULT now(),
+    updated_at   TIMESTAMPTZ
+);
+
+CREATE TABLE payments (
+    id              BIGSERIAL PRIMARY KEY,
+    invoice_id      UUID REFERENCES customer_invoices(id) ON DELETE CASCADE,
+    amount          NUMERIC,
+    method          TEXT,
+    provider_txn_id TEXT,
+    status          TEXT,
+    paid_at         TIMESTAMPTZ,
+    created_at      TIMESTAMPTZ DEFAULT now(),
+    updated_at      TIMESTAMPTZ
+);
+
+CREATE TABLE invoices (
+    id           UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    reseller_id  UUID REFERENCES resellers(id) ON DELETE CASCADE,
+    period_start DATE,
+    period_end   DATE,
+    users_count  INT,
+    unit_price   NUMERIC,
+    subtotal     NUMERIC,
+    discount     NUMERIC,
+    tax          NUMERIC,
+    total        NUMERIC,
+    currency     TEXT,
+    status       TEXT,
+    paid_at      TIMESTAMPTZ,
+    meta         JSONB,
+    created_at   TIMESTAMPTZ DEFAULT now(),
+    updated_at   TIMESTAMPTZ,
+    UNIQUE (reseller_id, period_start, period_end)
+);
+
+CREATE TABLE radacct (
+    radacctid        BIGSERIAL PRIMARY KEY,
+    username         TEXT,
+    acctsessionid    TEXT,
+    nasipaddress     INET,
+    framedipaddress  INET,
+    callingstationid TEXT,
+    acctstarttime    TIMESTAMPTZ,
+    acctstoptime     TIMESTAMPTZ,
+    acctinputoctets  BIGINT,
+    acctoutputoctets BIGINT,
+    acctsessiontime  BIGINT
+);
+
+CREATE TABLE duitku_logs (
+    id                BIGSERIAL PRIMARY KEY,
+    merchant_order_id TEXT,
+    amount            NUMERIC,
+    result_code       TEXT,
+    signature         TEXT,
+    payload           JSONB,
+    created_at        TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE TABLE coa_log (
+    id         BIGSERIAL PRIMARY KEY,
+    username   TEXT,
+    nas_ip     TEXT,
+    result     TEXT,
+    response   TEXT,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
@@ -0,0 +1,22 @@
+import pytest
+from fastapi import HTTPException
+
+from app.db import fetch_one
+from app.routers.admin import mark_reseller_invoice_paid
+
+
+def test_mark_paid_without_reseller_is_404_and_unchanged(run):
+    async def scenario():
+        # reseller sudah tidak ada (reseller_id NULL): dulu TypeError → 500
+        invoice = await fetch_one(
+            """
+            INSERT INTO invoices (reseller_id, period_start, period_end, total, currency, status)
+            VALUES (NULL, '2024-02-01', '2024-02-29', 500000, 'IDR', 'unpaid') RETURNING *
+            """
+        )
+        with pytest.raises(HTTPException) as exc:
+            await mark_reseller_invoice_paid(invoice["id"], admin={"admin": True})
+        assert exc.value.status_code == 404
+        assert (await fetch_one("SELECT status FROM invoices WHERE id=$1", (invoice["id"],)))["status"] == "unpaid"
+
+    run(scenario)
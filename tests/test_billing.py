@@ -0,0 +1,169 @@
+import asyncio
+from datetime import date
+
+from app import db
+from app.billing import SETTLE_INVOICE_SQL, settle_customer_invoice
+from app.db import fetch_all, fetch_one
+from app.utils import now_tz
+
+from factories import make_invoice, make_payment, make_reseller, make_user
+
+
+async def _setup():
+    reseller = await make_reseller("Reseller A")
+    user = await make_user(reseller["id"], active_until=date(2024, 1, 31))
+    invoice = await make_invoice(reseller["id"], user["id"])
+    return reseller, user, invoice
+
+
+async def _payments(invoice_id):
+    return await fetch_all("SELECT * FROM payments WHERE invoice_id=$1 ORDER BY id", (invoice_id,))
+
+
+async def _active_until(user_id):
+    row = await fetch_one("SELECT active_until FROM ppp_users WHERE id=$1", (user_id,))
+    return row["active_until"]
+
+
+def test_new_payment_settles_invoice(run):
+    async def scenario():
+        reseller, user, invoice = await _setup()
+        result = await settle_customer_invoice(
+            invoice["id"], method="duitku", provider_txn_id="TXN-1", reseller_id=reseller["id"]
+        )
+        assert result["prev_status"] == "unpaid"
+        assert result["invoice"]["status"] == "paid"
+        assert result["payment"]["provider_txn_id"] == "TXN-1"
+        assert result["payment"]["status"] == "success"
+        # periode 29 hari → active_until maju 29 hari
+        assert result["user"]["active_until"] == date(2024, 2, 29)
+        assert await _active_until(user["id"]) == date(2024, 2, 29)
+        assert len(await _payments(invoice["id"])) == 1
+
+    run(scenario)
+
+
+def test_repeat_callback_is_idempotent(run):
+    async def scenario():
+        reseller, user, invoice = await _setup()
+        first = await settle_customer_invoice(invoice["id"], method="duitku", provider_txn_id="TXN-1")
+        again = await settle_customer_invoice(invoice["id"], method="duitku", provider_txn_id="TXN-1")
+        assert again["prev_status"] == "paid"
+        assert again["invoice"] is None
+        assert again["user"] is None
+        assert again["payment"]["id"] == first["payment"]["id"]
+        assert len(await _payments(invoice["id"])) == 1
+        assert await _active_until(user["id"]) == date(2024, 2, 29)
+
+    run(scenario)
+
+
+def test_status_change_updates_existing_payment(run):
+    async def scenario():
+        reseller, user, invoice = await _setup()
+        pending = await settle_customer_invoice(
+            invoice["id"], method="duitku", status="pending", provider_txn_id="TXN-1"
+        )
+        assert pending["invoice"] is None
+        assert pending["payment"]["status"] == "pending"
+        assert await _active_until(user["id"]) == date(2024, 1, 31)
+
+        success = await settle_customer_invoice(
+            invoice["id"], method="duitku", status="success", provider_txn_id="TXN-1"
+        )
+        assert success["invoice"]["status"] == "paid"
+        assert success["payment"]["id"] == pending["payment"]["id"]
+        assert success["payment"]["status"] == "success"
+        rows = await _payments(invoice["id"])
+        assert [r["status"] for r in rows] == ["success"]
+
+    run(scenario)
+
+
+def test_unknown_invoice_changes_nothing(run):
+    async def scenario():
+        reseller, user, invoice = await _setup()
+        paid = await settle_customer_invoice(invoice["id"], method="duitku", provider_txn_id="TXN-1")
+        result = await settle_customer_invoice(
+            "00000000-0000-0000-0000-00000000abcd", method="duitku", status="failed", provider_txn_id="TXN-1"
+        )
+        assert result is None
+        rows = await _payments(invoice["id"])
+        assert [(r["id"], r["status"]) for r in rows] == [(paid["payment"]["id"], "success")]
+
+    run(scenario)
+
+
+def test_other_reseller_cannot_touch_payment_by_txn_id(run):
+    async def scenario():
+        reseller_a, user_a, invoice_a = await _setup()
+        paid = await settle_customer_invoice(
+            invoice_a["id"], method="duitku", provider_txn_id="TXN-A", reseller_id=reseller_a["id"]
+        )
+        before = await _payments(invoice_a["id"])
+
+        reseller_b = await make_reseller("Reseller B")
+        user_b = await make_user(reseller_b["id"], username="andi")
+        invoice_b = await make_invoice(reseller_b["id"], user_b["id"])
+
+        # B mengirim txn id milik A ke invoice B sendiri (POST /payments)
+        result = await settle_customer_invoice(
+            invoice_b["id"], method="manual", status="failed", provider_txn_id="TXN-A",
+            reseller_id=reseller_b["id"],
+        )
+        assert result["payment"]["invoice_id"] == invoice_b["id"]
+        assert result["payment"]["id"] != paid["payment"]["id"]
+
+        # B mengirim txn id A ke invoice A (bukan miliknya) → 404, tidak ada perubahan
+        result = await settle_customer_invoice(
+            invoice_a["id"], method="manual", status="failed", provider_txn_id="TXN-A",
+            reseller_id=reseller_b["id"],
+        )
+        assert result is None
+
+        assert await _payments(invoice_a["id"]) == before
+
+    run(scenario)
+
+
+def test_payment_for_existing_txn_on_unpaid_invoice_is_kept(run):
+    async def scenario():
+        reseller, user, invoice = await _setup()
+        await make_payment(invoice["id"], status="pending", provider_txn_id="TXN-9")
+        result = await settle_customer_invoice(invoice["id"], method="duitku", provider_txn_id="TXN-9")
+        assert result["invoice"]["status"] == "paid"
+        assert [r["status"] for r in await _payments(invoice["id"])] == ["success"]
+
+    run(scenario)
+
+
+def test_concurrent_double_callback_settles_once(run):
+    async def scenario():
+        reseller, user, invoice = await _setup()
+        now = now_tz()
+        async with db.pool.acquire() as conn:
+            tx = conn.transaction()
+            await tx.start()
+            # callback pertama sudah settle tapi belum commit
+            await conn.fetchrow(
+                SETTLE_INVOICE_SQL,
+                invoice["id"], None, now, now, "success", None, "duitku", "TXN-1", True,
+            )
+            second = asyncio.ensure_future(
+                settle_customer_invoice(invoice["id"], method="duitku", provider_txn_id="TXN-1")
+            )
+            await asyncio.sleep(0.2)
+            # callback kedua menunggu kunci invoice
+            assert not second.done()
+            await tx.commit()
+            again = await second
+
+        rows = await _payments(invoice["id"])
+        assert len(rows) == 1
+        assert again["prev_status"] == "paid"
+        assert again["invoice"] is None
+        assert again["user"] is None
+        assert again["payment"]["id"] == rows[0]["id"]
+        assert await _active_until(user["id"]) == date(2024, 2, 29)
+
+    run(scenario)
@@ -0,0 +1,46 @@
+import asyncio
+import zlib
+
+from app.compression import CompressionMiddleware
+
+CHUNKS = [b'{"id": %d, "name": "baris"}\n' % i * 20 for i in range(3)]
+
+
+async def _ndjson_app(scope, receive, send):
+    await send({
+        "type": "http.response.start", "status": 200,
+        "headers": [(b"content-type", b"application/x-ndjson")],
+    })
+    for i, chunk in enumerate(CHUNKS):
+        await send({"type": "http.response.body", "body": chunk, "more_body": i < len(CHUNKS) - 1})
+
+
+def _call(accept_encoding):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(_ndjson_app, minimum_size=0)(scope, None, send))
+    headers = dict(sent[0]["headers"])
+    return headers.get(b"content-encoding"), [m["body"] for m in sent[1:]]
+
+
+def test_q_zero_excludes_encoding():
+    assert _call("gzip;q=0")[0] is None
+    assert _call("gzip;q=0, deflate")[0] is None
+    assert _call("*;q=0")[0] is None
+    assert _call("br;q=0, gzip;q=0.5")[0] == b"gzip"
+    assert _call("gzip; q=1.0")[0] == b"gzip"
+    assert _call("*")[0] in (b"gzip", b"br")
+
+
+def test_streamed_chunks_are_flushed_one_by_one():
+    encoding, bodies = _call("gzip")
+    assert encoding == b"gzip"
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # tiap chunk bisa langsung di-decode utuh oleh klien, tanpa menunggu chunk berikutnya
+    for chunk, body in zip(CHUNKS, bodies):
+        assert d.decompress(body) == chunk
+    assert d.eof
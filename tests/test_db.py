@@ -0,0 +1,88 @@
+import json
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app import db, request_context
+from app.request_context import QueryStats
+from app.routers.payments import payment_webhook
+
+from factories import make_reseller, make_user
+
+
+def test_explain_plan_does_not_leak_parameter_values(run):
+    async def scenario():
+        reseller = await make_reseller()
+        await make_user(reseller["id"], username="rahasia")
+        plans = [
+            await db._explain(
+                "SELECT * FROM ppp_users WHERE username=$1 AND length(phone) > $2",
+                ("rahasia", 424242),
+            ),
+            await db._explain("UPDATE ppp_users SET full_name=$1 WHERE username=$2", ("Nama Rahasia", "rahasia")),
+        ]
+        for plan in plans:
+            assert "rahasia" not in plan.lower()
+            assert "424242" not in plan
+        assert "Filter: " in plans[0] and "rows=" in plans[0]
+
+    run(scenario)
+
+
+def test_query_stats_count_transaction_stream_and_batch_writes(run):
+    async def scenario():
+        reseller = await make_reseller()
+        await make_user(reseller["id"], username="budi")
+        await make_user(reseller["id"], username="andi")
+        writer = db.BatchLogWriter("user_suspensions", ("reseller_id", "user_id"))
+        try:
+            stats = QueryStats()
+            token = request_context._query_stats.set(stats)
+            try:
+                async with db.transaction() as conn:
+                    assert await conn.fetchval("SELECT count(*) FROM ppp_users") == 2
+                    rows = [r async for r in conn.cursor("SELECT id FROM ppp_users", prefetch=1)]
+                streamed = [r async for r in db.stream_rows("SELECT username FROM ppp_users")]
+                writer.add(reseller["id"], rows[0]["id"])
+                assert await writer.flush() == 1
+            finally:
+                request_context._query_stats.reset(token)
+        finally:
+            db._log_writers.remove(writer)
+
+        assert len(rows) == 2 and len(streamed) == 2
+        assert stats.shapes == {
+            "SELECT count(*) FROM ppp_users": 1,
+            "SELECT id FROM ppp_users": 1,
+            "SELECT username FROM ppp_users": 1,
+            "COPY user_suspensions": 1,
+        }
+
+    run(scenario)
+
+
+def test_duitku_log_writer_flushes_webhook_row(run):
+    async def scenario():
+        body = json.dumps({
+            "merchantOrderId": "INV-1", "amount": "150000", "resultCode": "00", "signature": "salah",
+        }).encode()
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        request = Request({"type": "http", "method": "POST", "path": "/payments/webhook", "headers": []}, receive)
+        # signature salah tetap dicatat ke duitku_logs sebelum ditolak
+        with pytest.raises(HTTPException) as exc:
+            await payment_webhook(request)
+        assert exc.value.status_code == 403
+
+        errors = db.duitku_log_writer.flush_errors
+        assert await db.duitku_log_writer.flush() == 1
+        assert db.duitku_log_writer.flush_errors == errors
+        row = await db.fetch_one("SELECT merchant_order_id, amount, result_code, payload FROM duitku_logs")
+        assert (row["merchant_order_id"], row["amount"], row["result_code"]) == ("INV-1", Decimal("150000"), "00")
+        assert json.loads(row["payload"])["signature"] == "salah"
+
+    run(scenario)
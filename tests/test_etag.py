@@ -0,0 +1,46 @@
+from datetime import date
+
+from app.billing import settle_customer_invoice
+
+from factories import api_client, make_invoice, make_reseller, make_user
+
+
+def test_user_etag_changes_after_settlement(run):
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"], active_until=date(2024, 1, 31))
+        invoice = await make_invoice(reseller["id"], user["id"])
+
+        async with api_client(reseller["id"]) as client:
+            first = await client.get(f"/users/{user['id']}")
+            assert first.status_code == 200
+            etag = first.headers["etag"]
+
+            cached = await client.get(f"/users/{user['id']}", headers={"If-None-Match": etag})
+            assert cached.status_code == 304
+
+            await settle_customer_invoice(invoice["id"], method="duitku", provider_txn_id="TXN-1")
+
+            after = await client.get(f"/users/{user['id']}", headers={"If-None-Match": etag})
+            assert after.status_code == 200
+            assert after.json()["active_until"] == "2024-02-29"
+            assert after.headers["etag"] != etag
+
+    run(scenario)
+
+
+def test_user_etag_changes_when_writer_skips_updated_at(run):
+    async def scenario():
+        from app.db import execute
+
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"])
+        async with api_client(reseller["id"]) as client:
+            etag = (await client.get(f"/users/{user['id']}")).headers["etag"]
+            # writer lain (mis. script/radius) yang tidak menyentuh updated_at
+            await execute("UPDATE ppp_users SET phone='089999' WHERE id=$1", (user["id"],))
+            after = await client.get(f"/users/{user['id']}", headers={"If-None-Match": etag})
+            assert after.status_code == 200
+            assert after.json()["phone"] == "089999"
+
+    run(scenario)
@@ -0,0 +1,30 @@
+from factories import api_client, make_invoice, make_reseller, make_user
+
+
+def test_export_rejects_malformed_period(run):
+    async def scenario():
+        reseller = await make_reseller()
+        async with api_client(reseller["id"]) as client:
+            for path in ("/invoices/export", "/payments/export"):
+                for period in ('2024-02"; x=".exe', "2024-2", "2024-02\r\nX-Injected: 1"):
+                    resp = await client.get(path, params={"period": period})
+                    assert resp.status_code == 400, (path, period)
+
+    run(scenario)
+
+
+def test_export_filename_uses_validated_period(run):
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"])
+        await make_invoice(reseller["id"], user["id"])
+        async with api_client(reseller["id"]) as client:
+            resp = await client.get("/invoices/export", params={"period": "2024-02"})
+            assert resp.status_code == 200
+            assert resp.headers["content-disposition"] == 'attachment; filename="invoices_2024-02.csv"'
+            assert len(resp.text.strip().splitlines()) == 2  # header + 1 invoice
+
+            resp = await client.get("/invoices/export", params={"period": "2024-03"})
+            assert len(resp.text.strip().splitlines()) == 1
+
+    run(scenario)
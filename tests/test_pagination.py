@@ -0,0 +1,33 @@
+from app.db import execute, fetch_all
+
+from factories import api_client, make_reseller
+
+
+def test_keyset_pages_include_rows_without_created_at(run):
+    async def scenario():
+        ids = set()
+        for i in range(5):
+            ids.add((await make_reseller(f"Reseller {i}"))["id"])
+        await execute(
+            "UPDATE resellers SET created_at=NULL WHERE id = ANY($1::uuid[])", (sorted(ids)[:3],)
+        )
+
+        seen, cursor = [], None
+        async with api_client() as client:
+            for _ in range(10):
+                params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+                resp = await client.get("/admin/resellers", params=params, auth=("admin", "admin"))
+                assert resp.status_code == 200
+                body = resp.json()
+                seen += [r["id"] for r in body["data"]]
+                cursor = body["next_cursor"]
+                if not cursor:
+                    break
+
+        assert len(seen) == len(set(seen)) == 5
+        assert set(seen) == ids
+        # row bertanggal di depan, NULL di akhir
+        dated = {r["id"] for r in await fetch_all("SELECT id FROM resellers WHERE created_at IS NOT NULL")}
+        assert set(seen[:2]) == dated
+
+    run(scenario)
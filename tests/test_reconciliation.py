@@ -0,0 +1,66 @@
+import asyncio
+from datetime import date, datetime, timezone
+
+import pytest
+
+from app import db
+from app.db import fetch_all, fetch_one
+from app.reconciliation import reconcile_settlement
+
+from factories import make_invoice, make_reseller, make_user
+
+
+def test_cancelled_run_is_marked_failed(run):
+    async def scenario():
+        started = asyncio.Event()
+
+        async def lines():
+            yield "reference,amount"
+            yield "TXN-1,150000"
+            started.set()
+            await asyncio.sleep(3600)  # file settlement lambat, job dibatalkan di sini
+
+        task = asyncio.ensure_future(reconcile_settlement(
+            lines(), window_start=date(2024, 2, 1), window_end=date(2024, 2, 29), source="test.csv",
+        ))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        row = await fetch_one("SELECT status, error, lines, finished_at FROM reconciliation_runs")
+        assert (row["status"], row["error"], row["lines"]) == ("failed", "CancelledError", 1)
+        assert row["finished_at"] is not None
+
+    run(scenario)
+
+
+def test_window_follows_app_timezone(run):
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"])
+        invoice = await make_invoice(reseller["id"], user["id"])
+        # Asia/Jakarta (UTC+7): 2024-02-01 01:00 lokal masuk window, 2024-02-02 03:00 lokal tidak
+        for txn, created in (
+            ("TXN-IN", datetime(2024, 1, 31, 18, tzinfo=timezone.utc)),
+            ("TXN-OUT", datetime(2024, 2, 1, 20, tzinfo=timezone.utc)),
+        ):
+            await db.execute(
+                """
+                INSERT INTO payments (invoice_id, amount, method, provider_txn_id, status, created_at)
+                VALUES ($1, 150000, 'duitku', $2, 'success', $3)
+                """,
+                (invoice["id"], txn, created),
+            )
+
+        async def lines():
+            yield "reference,amount"
+            yield "TXN-IN,150000"
+
+        result = await reconcile_settlement(
+            lines(), window_start=date(2024, 2, 1), window_end=date(2024, 2, 1), source="tz.csv",
+        )
+        assert (result["matched"], result["mismatched"]) == (1, 0)
+        assert await fetch_all("SELECT kind FROM reconciliation_mismatches") == []
+
+    run(scenario)
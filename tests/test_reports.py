@@ -0,0 +1,52 @@
+import asyncio
+
+from app.billing import settle_customer_invoice
+from app.db import execute
+from app.routers.reports import _add_months, build_timeseries
+from app.utils import now_tz
+
+from factories import make_invoice, make_reseller, make_user
+
+
+def _month(buckets, month):
+    return next(b for b in buckets if b["month"] == month)
+
+
+def test_closed_month_is_refreshed_when_old_invoice_is_paid(run):
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"], active_until=None)
+        last_month = _add_months(now_tz().date().replace(day=1), -1)
+        invoice = await make_invoice(
+            reseller["id"], user["id"], period_start=last_month, period_end=last_month.replace(day=28)
+        )
+
+        before = _month(await build_timeseries(reseller["id"], 3), last_month)
+        assert (before["revenue"], before["unpaid_invoices"]) == (0, 1)
+
+        await settle_customer_invoice(invoice["id"], method="manual", reseller_id=reseller["id"])
+        await asyncio.sleep(0.2)  # NOTIFY report_closed_months sampai ke listener
+
+        after = _month(await build_timeseries(reseller["id"], 3), last_month)
+        assert (after["revenue"], after["paid_invoices"], after["unpaid_invoices"]) == (150000, 1, 0)
+
+    run(scenario)
+
+
+def test_suspensions_count_events_not_current_status(run):
+    async def scenario():
+        reseller = await make_reseller()
+        budi = await make_user(reseller["id"], username="budi")
+        andi = await make_user(reseller["id"], username="andi")
+        suspend = "UPDATE ppp_users SET status='suspended', updated_at=now() WHERE id=$1"
+        # job suspend menyentuh user yang sama sekali per invoice unpaid → tetap satu event
+        await execute(suspend, (budi["id"],))
+        await execute(suspend, (budi["id"],))
+        await execute(suspend, (andi["id"],))
+        # andi bayar lalu aktif lagi: suspend-nya bulan ini tetap terhitung
+        await execute("UPDATE ppp_users SET status='active', updated_at=now() WHERE id=$1", (andi["id"],))
+
+        current = (await build_timeseries(reseller["id"], 1))[-1]
+        assert current["suspensions"] == 2
+
+    run(scenario)
@@ -0,0 +1,163 @@
+import asyncio
+from datetime import date
+
+from app import db
+from app.billing import settle_customer_invoice
+from app.config import get_settings
+from app.db import fetch_all, fetch_one
+
+from factories import make_invoice, make_payment, make_reseller, make_user
+
+settings = get_settings()
+
+
+async def _invoice_rollup(reseller_id):
+    rows = await fetch_all(
+        "SELECT day, status, invoice_count, amount FROM invoice_daily_rollup WHERE reseller_id=$1 ORDER BY day, status",
+        (reseller_id,),
+    )
+    return [(r["day"], r["status"], r["invoice_count"], int(r["amount"])) for r in rows]
+
+
+async def _payment_rollup(reseller_id):
+    rows = await fetch_all(
+        "SELECT day, method, status, payment_count, amount FROM payment_daily_rollup "
+        "WHERE reseller_id=$1 ORDER BY day, method, status",
+        (reseller_id,),
+    )
+    return [(r["day"], r["method"], r["status"], r["payment_count"], int(r["amount"])) for r in rows]
+
+
+def test_concurrent_inserts_in_same_bucket_are_all_counted(run):
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"])
+        insert = """
+            INSERT INTO customer_invoices (reseller_id, user_id, period_start, period_end, amount, status)
+            VALUES ($1, $2, '2024-02-01', '2024-02-29', 100000, 'unpaid')
+        """
+        async with db.pool.acquire() as c1, db.pool.acquire() as c2:
+            tx1, tx2 = c1.transaction(), c2.transaction()
+            await tx1.start()
+            await tx2.start()
+            await c1.execute(insert, reseller["id"], user["id"])
+            # trigger tx2 menunggu kunci bucket sampai tx1 commit
+            second = asyncio.ensure_future(c2.execute(insert, reseller["id"], user["id"]))
+            await asyncio.sleep(0.2)
+            assert not second.done()
+            await tx1.commit()
+            await second
+            await tx2.commit()
+
+        assert await _invoice_rollup(reseller["id"]) == [(date(2024, 2, 1), "unpaid", 2, 200000)]
+
+    run(scenario)
+
+
+def test_invoice_status_change_moves_bucket(run):
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"])
+        invoice = await make_invoice(reseller["id"], user["id"])
+        await make_invoice(reseller["id"], user["id"])
+        await db.execute("UPDATE customer_invoices SET status='paid' WHERE id=$1", (invoice["id"],))
+        assert await _invoice_rollup(reseller["id"]) == [
+            (date(2024, 2, 1), "paid", 1, 150000),
+            (date(2024, 2, 1), "unpaid", 1, 150000),
+        ]
+
+    run(scenario)
+
+
+async def _invoice_rollup_full():
+    return await fetch_all(
+        "SELECT reseller_id, day, status, invoice_count, amount, payments_amount FROM invoice_daily_rollup "
+        "ORDER BY reseller_id, day, status"
+    )
+
+
+def test_deltas_match_rebuild(run):
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"])
+        a = await make_invoice(reseller["id"], user["id"])
+        b = await make_invoice(reseller["id"], user["id"], amount="90000")
+        c = await make_invoice(reseller["id"], user["id"], period_start=date(2024, 3, 1))
+
+        # CTE settle: invoice pindah bucket dan payment-nya dibuat di statement yang sama
+        await settle_customer_invoice(a["id"], method="duitku", provider_txn_id="TXN-A")
+        # pending dulu, lalu success (payment diupdate, invoice pindah bucket)
+        await settle_customer_invoice(b["id"], method="duitku", status="pending", provider_txn_id="TXN-B")
+        await settle_customer_invoice(b["id"], method="duitku", provider_txn_id="TXN-B")
+        await make_payment(c["id"], amount="20000")
+        failed = await make_payment(c["id"], amount="5000", status="failed")
+        await db.execute("UPDATE payments SET status='success', amount=7000 WHERE id=$1", (failed["id"],))
+        await db.execute("UPDATE customer_invoices SET amount=175000 WHERE id=$1", (c["id"],))
+        await db.execute("UPDATE customer_invoices SET period_start='2024-04-01' WHERE id=$1", (c["id"],))
+        await db.execute("DELETE FROM payments WHERE invoice_id=$1 AND status='success' AND amount=20000", (c["id"],))
+        await db.execute("DELETE FROM customer_invoices WHERE id=$1", (b["id"],))
+
+        by_trigger = await _invoice_rollup_full()
+        assert [(r["day"], r["status"], r["invoice_count"], int(r["payments_amount"])) for r in by_trigger] == [
+            (date(2024, 2, 1), "paid", 1, 150000),
+            (date(2024, 4, 1), "unpaid", 1, 7000),
+        ]
+        await db.execute("CALL rollup_rebuild_buckets()")
+        assert await _invoice_rollup_full() == by_trigger
+
+    run(scenario)
+
+
+def test_rebuild_repairs_drifted_buckets(run):
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"])
+        invoice = await make_invoice(reseller["id"], user["id"])
+        await make_payment(invoice["id"])
+        expected_invoices = await _invoice_rollup(reseller["id"])
+        expected_payments = await _payment_rollup(reseller["id"])
+
+        await db.execute("UPDATE invoice_daily_rollup SET invoice_count=7, amount=1")
+        await db.execute(
+            "INSERT INTO invoice_daily_rollup (reseller_id, day, status, invoice_count, amount) "
+            "VALUES ($1, '2023-12-01', 'unpaid', 3, 300)",
+            (reseller["id"],),
+        )
+        await db.execute("DELETE FROM payment_daily_rollup")
+        await db.execute("UPDATE invoice_rollup_state SET paid=0")
+
+        await db.execute("CALL rollup_rebuild_buckets()")
+        assert await _invoice_rollup(reseller["id"]) == expected_invoices
+        state = await fetch_one("SELECT paid FROM invoice_rollup_state WHERE invoice_id=$1", (invoice["id"],))
+        assert int(state["paid"]) == 150000
+        assert await _payment_rollup(reseller["id"]) == expected_payments
+        assert expected_payments and expected_payments[0][1:] == ("duitku", "success", 1, 150000)
+
+    run(scenario)
+
+
+def test_payment_day_follows_app_timezone(run):
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"])
+        invoice = await make_invoice(reseller["id"], user["id"])
+        insert = """
+            INSERT INTO payments (invoice_id, amount, method, status, created_at)
+            VALUES ($1, 1000, $2, 'success', '2024-02-01 20:00+00')
+        """
+        assert await fetch_one("SELECT current_setting('app.timezone') AS tz", ()) == {"tz": settings.TIMEZONE}
+        await db.execute(insert, (invoice["id"], "tz-app"))
+        async with db.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SET LOCAL app.timezone = 'UTC'")
+                await conn.execute(insert, invoice["id"], "tz-utc")
+
+        days = {r[1]: r[0] for r in await _payment_rollup(reseller["id"])}
+        assert days == {"tz-app": date(2024, 2, 2), "tz-utc": date(2024, 2, 1)}
+
+        # rebuild memakai timezone yang sama untuk batas hari
+        await db.execute("DELETE FROM payment_daily_rollup")
+        await db.execute("CALL rollup_rebuild_buckets()")
+        assert {r[1]: r[0] for r in await _payment_rollup(reseller["id"])}["tz-app"] == date(2024, 2, 2)
+
+    run(scenario)
@@ -0,0 +1,134 @@
+from datetime import date
+
+from app.db import execute, fetch_all, fetch_one
+from app.routers.admin import finance_summary, summary_resellers
+from app.routers.reports import profiles_summary
+
+from factories import make_invoice, make_payment, make_profile, make_reseller, make_user
+
+# Referensi naif: satu subquery berkorelasi per angka langsung dari tabel
+# dasar. Lambat (O(profile × row)) tapi jelas benar, tanpa join yang bisa fan-out.
+NAIVE_PROFILES_SQL = """
+    SELECT pr.id, pr.name,
+        (SELECT COUNT(*) FROM ppp_users u
+         WHERE u.profile_id=pr.id AND u.reseller_id=$1 AND u.deleted_at IS NULL) AS users_count,
+        (SELECT COALESCE(SUM(ci.amount), 0) FROM customer_invoices ci
+         WHERE ci.profile_id=pr.id AND ci.reseller_id=$1 AND ci.status='paid') AS total_revenue
+    FROM ppp_profiles pr
+    WHERE pr.reseller_id=$1 AND pr.deleted_at IS NULL
+    ORDER BY pr.name
+"""
+
+NAIVE_RESELLERS_SQL = """
+    SELECT r.id, r.name,
+        (SELECT COUNT(*) FROM ppp_users u WHERE u.reseller_id=r.id AND u.deleted_at IS NULL) AS users_count,
+        (SELECT COUNT(*) FROM customer_invoices ci
+         WHERE ci.reseller_id=r.id AND ci.status='paid' AND ci.period_start IS NOT NULL) AS invoices_paid,
+        (SELECT COALESCE(SUM(ci.amount), 0) FROM customer_invoices ci
+         WHERE ci.reseller_id=r.id AND ci.status='paid' AND ci.period_start IS NOT NULL) AS total_revenue
+    FROM resellers r
+    ORDER BY r.name
+"""
+
+NAIVE_FINANCE_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM inv WHERE status='paid') AS paid_invoices,
+        (SELECT COUNT(*) FROM inv WHERE status NOT IN ('paid','')) AS unpaid_invoices,
+        (SELECT COALESCE(SUM(amount), 0) FROM inv WHERE status='paid') AS paid_amount,
+        (SELECT COALESCE(SUM(amount), 0) FROM inv WHERE status NOT IN ('paid','')) AS unpaid_amount,
+        (SELECT COALESCE(SUM(p.amount), 0) FROM payments p
+         WHERE p.status='success' AND p.invoice_id IN (SELECT id FROM inv)) AS payments_total
+    FROM (SELECT 1) one
+"""
+
+# bentuk lama profiles_summary (sebelum pre-agregasi): users × invoices fan-out
+OLD_PROFILES_SQL = """
+    SELECT pr.id, pr.name,
+        COUNT(u.id) FILTER (WHERE u.deleted_at IS NULL) AS users_count,
+        COALESCE(SUM(ci.amount) FILTER (WHERE ci.status='paid'),0) AS total_revenue
+    FROM ppp_profiles pr
+    LEFT JOIN ppp_users u ON u.profile_id=pr.id AND u.reseller_id=pr.reseller_id
+    LEFT JOIN customer_invoices ci ON ci.profile_id=pr.id AND ci.reseller_id=pr.reseller_id
+    WHERE pr.reseller_id=$1 AND pr.deleted_at IS NULL
+    GROUP BY pr.id, pr.name
+    ORDER BY pr.name
+"""
+
+
+async def _naive_finance(period=None):
+    where = "WHERE reseller_id IS NOT NULL AND period_start IS NOT NULL"
+    params = ()
+    if period:
+        where += " AND period_start >= $1 AND period_start < $2"
+        params = (date(2024, 2, 1), date(2024, 3, 1))
+    return await fetch_one(
+        f"WITH inv AS (SELECT id, COALESCE(status, '') AS status, amount FROM customer_invoices {where}) "
+        + NAIVE_FINANCE_SQL,
+        params,
+    )
+
+
+async def _seed():
+    """Dua reseller, beberapa profile dengan banyak user dan banyak invoice (kasus fan-out)."""
+    resellers = []
+    for r in range(2):
+        reseller = await make_reseller(f"Reseller {r}")
+        resellers.append(reseller)
+        profiles = [await make_profile(reseller["id"], name=f"{r}-{p}M") for p in range(3)]
+        for i in range(7):
+            profile = profiles[i % 2]  # profile ke-3 sengaja tanpa user/invoice
+            user = await make_user(reseller["id"], username=f"u{r}-{i}", profile_id=profile["id"])
+            for month, status in ((1, "paid"), (2, "paid" if i % 3 else "unpaid"), (3, "unpaid")):
+                start = date(2024, month, 1)
+                invoice = await make_invoice(
+                    reseller["id"], user["id"], amount=str(100000 + 1000 * i),
+                    period_start=start, period_end=start.replace(day=28), status=status,
+                )
+                await execute("UPDATE customer_invoices SET profile_id=$1 WHERE id=$2", (profile["id"], invoice["id"]))
+                if status == "paid":
+                    await make_payment(invoice["id"], amount=invoice["amount"])
+            if i == 6:
+                await execute("UPDATE ppp_users SET deleted_at=now() WHERE id=$1", (user["id"],))
+        # invoice dengan status NULL tidak termasuk paid maupun unpaid
+        await make_invoice(reseller["id"], user["id"], status=None)
+    return resellers
+
+
+def test_summaries_match_naive_reference(run):
+    async def scenario():
+        resellers = await _seed()
+
+        for reseller in resellers:
+            rows = (await profiles_summary(reseller={"reseller_id": reseller["id"]}))["profiles"]
+            assert rows == await fetch_all(NAIVE_PROFILES_SQL, (reseller["id"],))
+            assert len(rows) == 3
+
+        result = await summary_resellers(admin={"admin": True})
+        assert result["resellers"] == await fetch_all(NAIVE_RESELLERS_SQL)
+
+        assert await finance_summary(period=None, admin={"admin": True}) == await _naive_finance()
+        assert await finance_summary(period="2024-02", admin={"admin": True}) == await _naive_finance("2024-02")
+
+    run(scenario)
+
+
+def test_old_join_query_matches_without_fan_out_and_inflates_with_it(run):
+    async def scenario():
+        # maksimal satu user dan satu invoice per profile: bentuk lama dan baru identik
+        single = await make_reseller("Single")
+        for p in range(2):
+            profile = await make_profile(single["id"], name=f"{p}M")
+            user = await make_user(single["id"], username=f"s{p}", profile_id=profile["id"])
+            invoice = await make_invoice(single["id"], user["id"], status="paid")
+            await execute("UPDATE customer_invoices SET profile_id=$1 WHERE id=$2", (profile["id"], invoice["id"]))
+        new = (await profiles_summary(reseller={"reseller_id": single["id"]}))["profiles"]
+        assert new == await fetch_all(OLD_PROFILES_SQL, (single["id"],))
+
+        reseller = (await _seed())[0]
+        old = await fetch_all(OLD_PROFILES_SQL, (reseller["id"],))
+        new = (await profiles_summary(reseller={"reseller_id": reseller["id"]}))["profiles"]
+        # profile dengan >1 user dan >1 invoice: users_count & revenue ikut dikali
+        assert old[0]["total_revenue"] > new[0]["total_revenue"]
+        assert old[0]["users_count"] > new[0]["users_count"]
+
+    run(scenario)
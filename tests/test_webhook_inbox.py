@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+from app import billing, db
+from app.db import fetch_all, fetch_one
+from app.utils import now_tz
+from app.worker import scheduler
+
+from factories import make_invoice, make_reseller, make_user
+
+
+def _duitku_payload(invoice_id, reference="REF-1"):
+    return {
+        "merchantOrderId": invoice_id,
+        "amount": "150000",
+        "resultCode": "00",
+        "reference": reference,
+    }
+
+
+def test_two_workers_claiming_same_txn_settle_once(run, monkeypatch):
+    sent = []
+
+    async def fake_wa(phone, text):
+        sent.append(phone)
+
+    monkeypatch.setattr(billing, "send_wa_message", fake_wa)
+    # satu callback per klaim: retry gateway untuk txn yang sama jatuh ke dua worker
+    monkeypatch.setattr(scheduler.settings, "WEBHOOK_INBOX_BATCH", 1)
+
+    async def scenario():
+        reseller = await make_reseller()
+        user = await make_user(reseller["id"])
+        invoice = await make_invoice(reseller["id"], user["id"])
+        for _ in range(2):
+            await db.execute(
+                """
+                INSERT INTO payment_webhook_inbox (provider, provider_txn_id, invoice_id, payload, received_at)
+                VALUES ('duitku', 'REF-1', $1, $2::jsonb, $3)
+                """,
+                (invoice["id"], json.dumps(_duitku_payload(invoice["id"])), now_tz()),
+            )
+
+        async with db.pool.acquire() as conn:
+            tx = conn.transaction()
+            await tx.start()
+            # tahan invoice supaya kedua worker sudah klaim dan sedang settle bersamaan
+            await conn.execute("SELECT 1 FROM customer_invoices WHERE id=$1 FOR UPDATE", invoice["id"])
+            workers = asyncio.ensure_future(
+                asyncio.gather(scheduler.job_process_webhook_inbox(), scheduler.job_process_webhook_inbox())
+            )
+            await asyncio.sleep(0.3)
+            claimed = await fetch_all("SELECT status FROM payment_webhook_inbox ORDER BY id")
+            assert [r["status"] for r in claimed] == ["processing", "processing"]
+            await tx.rollback()
+            assert await workers == [1, 1]
+
+        payments = await fetch_all("SELECT * FROM payments WHERE invoice_id=$1", (invoice["id"],))
+        assert [(p["provider_txn_id"], p["status"]) for p in payments] == [("REF-1", "success")]
+        inv = await fetch_one("SELECT status, paid_at FROM customer_invoices WHERE id=$1", (invoice["id"],))
+        assert inv["status"] == "paid"
+        inbox = await fetch_all("SELECT status, last_error FROM payment_webhook_inbox ORDER BY id")
+        assert [(r["status"], r["last_error"]) for r in inbox] == [("done", None), ("done", None)]
+        # WA konfirmasi hanya dari worker yang benar-benar settle
+        assert len(sent) == 1
+
+    run(scenario)